@@ -0,0 +1,153 @@
+"""
+Measure canvas frame times under high-rate synthetic pen input, comparing the previous
+rendering (full repaint, one painter per move event, exact-size growth) with the
+current one (exposed-rect repaint, persistent painter, moves coalesced per frame,
+geometric tiled growth).
+
+Run from the repository root (set QT_QPA_PLATFORM=offscreen on headless machines):
+    python -m benchmarks.frame_time --frames 300 --moves-per-frame 16
+"""
+
+import argparse
+import random
+import sys
+import time
+
+import numpy as np
+from PyQt5.QtCore import QEvent, QPoint, QSize, Qt
+from PyQt5.QtGui import QMouseEvent, QPainter, QPen
+from PyQt5.QtWidgets import QApplication
+
+from ui.canvas_widget import CanvasWidget
+
+FRAME_BUDGET = 1 / 60
+
+
+class LegacyCanvasWidget(CanvasWidget):
+    """The canvas rendering as it was before exposed-rect painting and coalescing."""
+
+    def __init__(self, class_names, parent=None):
+        super().__init__(class_names, parent)
+        self.coalesce_moves = False
+
+    def paintEvent(self, event):
+        canvas_painter = QPainter(self)
+        canvas_painter.drawImage(self.rect(), self.image, self.image.rect())
+
+    def resizeEvent(self, event):
+        if self.width() > self.image.width() or self.height() > self.image.height():
+            new_width = max(self.width(), self.image.width())
+            new_height = max(self.height(), self.image.height())
+            self.resize_image(self.image, QSize(new_width, new_height))
+            self.update()
+        super(CanvasWidget, self).resizeEvent(event)
+
+    def begin_painting(self):
+        pass
+
+    def draw_line_to(self, end_point):
+        dirty_rect = self.segment_rect(self.last_point, end_point)
+        self.history.before_paint(self.image, dirty_rect)
+        self.stroke_model.add_point(end_point.x(), end_point.y())
+        painter = QPainter(self.image)
+        painter.setPen(
+            QPen(
+                self.pen_color, self.pen_width, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin
+            )
+        )
+        painter.drawLine(self.last_point, end_point)
+        painter.end()
+        self.update(dirty_rect)
+        self.last_point = QPoint(end_point)
+
+
+def mouse_event(kind, point):
+    buttons = Qt.NoButton if kind == QEvent.MouseButtonRelease else Qt.LeftButton
+    return QMouseEvent(kind, point, Qt.LeftButton, buttons, Qt.NoModifier)
+
+
+def drive_strokes(app, canvas, frames, moves_per_frame, seed, stroke_frames=30):
+    """Send synthetic strokes, moves_per_frame events per frame; return frame times."""
+    rng = random.Random(seed)
+    width, height = canvas.width(), canvas.height()
+    frame_times = []
+    point = QPoint(width // 2, height // 2)
+
+    for frame in range(frames):
+        start = time.perf_counter()
+        if frame % stroke_frames == 0:
+            point = QPoint(rng.randrange(width), rng.randrange(height))
+            app.sendEvent(canvas, mouse_event(QEvent.MouseButtonPress, point))
+        for _ in range(moves_per_frame):
+            point = QPoint(
+                min(max(point.x() + rng.randint(-6, 6), 0), width - 1),
+                min(max(point.y() + rng.randint(-6, 6), 0), height - 1),
+            )
+            app.sendEvent(canvas, mouse_event(QEvent.MouseMove, point))
+        if frame % stroke_frames == stroke_frames - 1:
+            app.sendEvent(canvas, mouse_event(QEvent.MouseButtonRelease, point))
+        app.processEvents()  # Deliver the paint of this frame
+        frame_times.append(time.perf_counter() - start)
+    return np.array(frame_times)
+
+
+def drive_resize(app, canvas, start_size, steps, step):
+    """Grow the window step by step like a drag; return the seconds spent resizing."""
+    elapsed = 0.0
+    for i in range(1, steps + 1):
+        start = time.perf_counter()
+        canvas.resize(start_size.width() + i * step, start_size.height() + i * step)
+        app.processEvents()
+        elapsed += time.perf_counter() - start
+    return elapsed
+
+
+def run(app, canvas_class, args):
+    canvas = canvas_class([])
+    canvas.resize(args.width, args.height)
+    canvas.show()
+    app.processEvents()
+
+    # Drag the window larger, then restore it, so the image outgrows the widget
+    resize_seconds = drive_resize(app, canvas, canvas.size(), 50, 8)
+    canvas.resize(args.width, args.height)
+    app.processEvents()
+
+    frame_times = drive_strokes(
+        app, canvas, args.frames, args.moves_per_frame, args.seed
+    )
+    canvas.close()
+    return frame_times, resize_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--moves-per-frame", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+    print(
+        f"Canvas {args.width}x{args.height}, {args.frames} frames, "
+        f"{args.moves_per_frame} pen moves per frame"
+    )
+    for name, canvas_class in (
+        ("previous", LegacyCanvasWidget),
+        ("current", CanvasWidget),
+    ):
+        frame_times, resize_seconds = run(app, canvas_class, args)
+        frame_ms = frame_times * 1e3
+        dropped = int(np.sum(frame_times > FRAME_BUDGET))
+        print(
+            f"{name:>8}: frame p50 {np.percentile(frame_ms, 50):6.2f} ms, "
+            f"p99 {np.percentile(frame_ms, 99):6.2f} ms, "
+            f"max {frame_ms.max():6.2f} ms, over 16.7 ms: {dropped:3d}, "
+            f"50 resize steps: {resize_seconds * 1e3:6.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
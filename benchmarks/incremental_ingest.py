@@ -0,0 +1,134 @@
+"""
+Check that full and incremental preprocessing can be mixed on one store, and time an
+incremental update against a full run.
+
+On synthetic symbols, the store is built incrementally, replaced by a full run, updated
+incrementally without changes, and updated again after files were added and deleted.
+After every step each split must hold exactly the images listed in its index, each with
+the label of its source image; the script exits with status 1 otherwise.
+
+Run from the repository root:
+    python -m benchmarks.incremental_ingest --size 2000 --classes 10
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from contextlib import redirect_stdout
+
+import cv2
+import numpy as np
+
+from benchmarks.suite import generate_symbols
+from utils.data_processing import (
+    decode_images,
+    list_image_files,
+    preprocess_dataset,
+    update_dataset,
+)
+from utils.dataset_store import SPLITS, ShardedDataset
+
+
+def check_store(save_path, dataset_folder):
+    """
+    Compare every image of a store with the decoded source images.
+
+    Returns:
+        list: Descriptions of the problems found; empty if the store is consistent.
+    """
+    paths, _, _ = list_image_files(dataset_folder)
+    images, valid = decode_images(paths)
+    sources = Counter(
+        (os.path.basename(os.path.dirname(path)), image.tobytes())
+        for path, image, ok in zip(paths, images, valid)
+        if ok
+    )
+
+    dataset = ShardedDataset(save_path)
+    problems = []
+    stored = Counter()
+    for split in SPLITS:
+        split_index = dataset.index["splits"][split]
+        samples = dataset[split]
+        shard_samples = sum(len(shard) for shard in samples.shards)
+        if not split_index["num_samples"] == shard_samples == len(samples.labels):
+            problems.append(
+                f"{split}: index lists {split_index['num_samples']} samples, shards "
+                f"hold {shard_samples}, labels {len(samples.labels)}"
+            )
+            continue
+        split_images = samples.get_images(np.arange(len(samples)))
+        stored.update(
+            (dataset.class_names[label], image.tobytes())
+            for label, image in zip(samples.labels, split_images)
+        )
+    if not problems and stored != sources:
+        problems.append(
+            f"{sum((stored - sources).values())} stored images do not match the source "
+            f"image of their label, {sum((sources - stored).values())} are missing"
+        )
+    return problems
+
+
+def run_step(name, function, save_path, dataset_folder):
+    """Run one preprocessing step quietly, then time and check it."""
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        function()
+    seconds = time.perf_counter() - start
+    problems = check_store(save_path, dataset_folder)
+    print(f"{name:<34}{seconds:>8.2f}s  {'ok' if not problems else 'INCONSISTENT'}")
+    for problem in problems:
+        print(f"  {problem}")
+    return not problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=2000)
+    parser.add_argument("--classes", type=int, default=10)
+    parser.add_argument(
+        "--changed", type=int, default=20, help="Files added and deleted"
+    )
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="incremental_ingest_")
+    try:
+        folder = os.path.join(work_dir, "dataset")
+        save_path = os.path.join(work_dir, "store")
+        generate_symbols(folder, args.size, args.classes)
+
+        def change_files():
+            paths = sorted(list_image_files(folder)[0])
+            for path in paths[: args.changed]:
+                os.remove(path)
+            rng = np.random.default_rng(1)
+            for i in range(args.changed):
+                path = paths[i * len(paths) // args.changed]
+                noise = rng.integers(0, 256, size=(45, 45), dtype=np.uint8)
+                cv2.imwrite(f"{os.path.splitext(path)[0]}_new.png", noise)
+
+        steps = [
+            ("Incremental, new store", lambda: update_dataset(folder, save_path)),
+            ("Full run", lambda: preprocess_dataset(folder, save_path)),
+            ("Incremental, nothing changed", lambda: update_dataset(folder, save_path)),
+            ("Incremental, files changed", lambda: update_dataset(folder, save_path)),
+        ]
+        consistent = True
+        for name, function in steps:
+            if name == "Incremental, files changed":
+                change_files()
+            consistent &= run_step(name, function, save_path, folder)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if not consistent:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Measure prediction latency of the persistent InferenceSession against the previous
+approach of reloading the model file on every Predict click.
+
+Run from the repository root:
+    python -m benchmarks.inference_latency --model models/saved_models/trained_model.h5
+"""
+
+import argparse
+import time
+
+import numpy as np
+from tensorflow.keras.models import load_model
+
+from models.inference import DEFAULT_INPUT_SHAPE, DEFAULT_MODEL_PATH, InferenceSession
+
+
+def time_reload_per_prediction(model_path, batch, runs):
+    """
+    Time the old behaviour: load the model and call model.predict for every prediction.
+
+    Args:
+        model_path (str): Path to the trained model file.
+        batch (np.ndarray): Input batch to predict on.
+        runs (int): Number of predictions to time.
+
+    Returns:
+        list: Latency of each prediction in seconds.
+    """
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        model = load_model(model_path)
+        model.predict(batch, verbose=0)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def time_session(model_path, batch, runs):
+    """
+    Time predictions served by a pre-warmed InferenceSession.
+
+    Args:
+        model_path (str): Path to the trained model file.
+        batch (np.ndarray): Input batch to predict on.
+        runs (int): Number of predictions to time.
+
+    Returns:
+        tuple: (session, list of per-prediction latencies in seconds)
+    """
+    session = InferenceSession(model_path)
+    session.start()
+    session.wait_until_ready()
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        session.predict(batch)
+        timings.append(time.perf_counter() - start)
+    return session, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--reload-runs", type=int, default=3)
+    args = parser.parse_args()
+
+    batch = np.random.rand(1, *DEFAULT_INPUT_SHAPE).astype(np.float32)
+
+    reload_timings = time_reload_per_prediction(args.model, batch, args.reload_runs)
+    session, session_timings = time_session(args.model, batch, args.runs)
+
+    print(f"Reload per prediction:  median {np.median(reload_timings) * 1000:.1f} ms")
+    print(f"Session model load:     {session.stats['load_seconds'] * 1000:.1f} ms")
+    print(
+        f"Session first predict:  {session.stats['first_prediction_seconds'] * 1000:.1f} ms"
+    )
+    print(
+        f"Session steady state:   median {np.median(session_timings) * 1000:.2f} ms, "
+        f"p99 {np.percentile(session_timings, 99) * 1000:.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Load-test the prediction server on localhost with concurrent clients.
+
+Each client keeps one connection open and sends synthetic 45x45 PNG images back to back.
+The script reports throughput, client-side p50/p99 latency, rejected (503) requests,
+and the server's own metrics, including the mean micro-batch size.
+
+Run from the repository root, against a running server or one started by the script:
+    python -m benchmarks.server_load --spawn --concurrency 32 --duration 20
+"""
+
+import argparse
+import base64
+import http.client
+import json
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+
+import cv2
+import numpy as np
+
+from models.inference import DEFAULT_MODEL_PATH
+
+
+def synthetic_images(count, seed=0):
+    """Encode random line drawings as PNG files."""
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        image = np.full((45, 45), 255, dtype=np.uint8)
+        for _ in range(rng.integers(1, 4)):
+            start, end = rng.integers(5, 40, size=(2, 2))
+            cv2.line(image, tuple(map(int, start)), tuple(map(int, end)), 0, 2)
+        images.append(cv2.imencode(".png", image)[1].tobytes())
+    return images
+
+
+def request(connection, method, path, body=None, headers=None):
+    connection.request(method, path, body=body, headers=headers or {})
+    response = connection.getresponse()
+    return response.status, response.read()
+
+
+def wait_until_healthy(host, port, timeout):
+    """Poll /health until the model is loaded; return False on timeout."""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout=5)
+            status, _ = request(connection, "GET", "/health")
+            connection.close()
+            if status == 200:
+                return True
+        except OSError:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def client(host, port, images, per_request, stop_at, latencies, statuses, seed):
+    """Send requests until stop_at, recording latency and status of each one."""
+    rng = np.random.default_rng(seed)
+    connection = http.client.HTTPConnection(host, port, timeout=30)
+    while time.perf_counter() < stop_at:
+        if per_request == 1:
+            body = images[rng.integers(len(images))]
+            headers = {"Content-Type": "image/png"}
+        else:
+            chosen = rng.integers(len(images), size=per_request)
+            encoded = [base64.b64encode(images[i]).decode("ascii") for i in chosen]
+            body = json.dumps({"images": encoded})
+            headers = {"Content-Type": "application/json"}
+
+        start = time.perf_counter()
+        try:
+            status, _ = request(connection, "POST", "/predict", body, headers)
+        except (OSError, http.client.HTTPException):
+            status = "connection error"
+            connection.close()
+            connection = http.client.HTTPConnection(host, port, timeout=30)
+        elapsed = time.perf_counter() - start
+        statuses[status] += 1
+        if status == 200:
+            latencies.append(elapsed)
+        elif status == 503:
+            time.sleep(0.01)  # Back off as a well-behaved client would
+    connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--images-per-request", type=int, default=1)
+    parser.add_argument("--spawn", action="store_true", help="Start server.py first")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--dataset", default=None)
+    parser.add_argument("--server-args", default="", help="Extra server.py arguments")
+    args = parser.parse_args()
+
+    server = None
+    if args.spawn:
+        command = [sys.executable, "server.py", "--port", str(args.port)]
+        command += ["--model", args.model] + args.server_args.split()
+        if args.dataset:
+            command += ["--dataset", args.dataset]
+        server = subprocess.Popen(command)
+
+    try:
+        if not wait_until_healthy(args.host, args.port, timeout=300):
+            print("The server did not become healthy")
+            return
+
+        images = synthetic_images(256)
+        latencies = []
+        statuses = Counter()
+        stop_at = time.perf_counter() + args.duration
+        threads = [
+            threading.Thread(
+                target=client,
+                args=(
+                    args.host,
+                    args.port,
+                    images,
+                    args.images_per_request,
+                    stop_at,
+                    latencies,
+                    statuses,
+                    seed,
+                ),
+            )
+            for seed in range(args.concurrency)
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        connection = http.client.HTTPConnection(args.host, args.port, timeout=5)
+        _, body = request(connection, "GET", "/metrics")
+        metrics = json.loads(body)
+
+        ok = statuses.get(200, 0)
+        print(
+            f"{args.concurrency} clients, {args.images_per_request} image(s) per "
+            f"request, {elapsed:.1f}s"
+        )
+        print(
+            f"Throughput: {ok / elapsed:.0f} requests/s, "
+            f"{ok * args.images_per_request / elapsed:.0f} images/s"
+        )
+        if latencies:
+            p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+            print(f"Client latency: p50 {p50:.1f} ms, p99 {p99:.1f} ms")
+        print(f"Responses: {dict(statuses)}")
+        print(f"Server metrics: {json.dumps(metrics)}")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
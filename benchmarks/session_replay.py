@@ -0,0 +1,114 @@
+"""
+Replay a recorded drawing session through the canvas and check that it is deterministic,
+and compare rasterizing strokes with converting the canvas bitmap for inference.
+
+Without --session, a synthetic session is generated (and saved with --save).
+
+Run from the repository root (set QT_QPA_PLATFORM=offscreen on headless machines):
+    python -m benchmarks.session_replay --strokes 200
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+from PyQt5.QtCore import QSize
+from PyQt5.QtWidgets import QApplication
+
+from ui.canvas_widget import CanvasWidget
+from utils.image_utils import qimage_to_model_input
+from utils.strokes import (
+    CLEAR,
+    STROKE,
+    UNDO,
+    Stroke,
+    load_session,
+    save_session,
+    strokes_to_model_input,
+)
+
+
+def synthetic_session(strokes, canvas_size, seed=0, points=40, step=12):
+    """Generate random-walk strokes with the occasional undo and clear."""
+    rng = random.Random(seed)
+    width, height = canvas_size
+    events = []
+    t = 0.0
+    for _ in range(strokes):
+        x, y = rng.randrange(width), rng.randrange(height)
+        path, times = [], []
+        for _ in range(points):
+            x = min(max(x + rng.randint(-step, step), 0), width - 1)
+            y = min(max(y + rng.randint(-step, step), 0), height - 1)
+            path.append((x, y))
+            t += 0.008  # A 125 Hz pointer
+            times.append(t)
+        events.append((STROKE, Stroke(path, times, rng.choice([3, 5, 8]))))
+        if rng.random() < 0.1:
+            events.append((UNDO, None))
+        if rng.random() < 0.01:
+            events.append((CLEAR, None))
+    return events
+
+
+def replay(events, canvas_size):
+    """Replay events on a fresh canvas and return it with the elapsed time."""
+    canvas = CanvasWidget([])
+    canvas.resize_image(canvas.image, QSize(*canvas_size))
+    start = time.perf_counter()
+    canvas.replay(events)
+    return canvas, time.perf_counter() - start
+
+
+def time_call(function, repeats=50):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--session", help="Session file to replay")
+    parser.add_argument("--save", help="Save the synthetic session to this path")
+    parser.add_argument("--strokes", type=int, default=200)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+
+    if args.session:
+        events, canvas_size = load_session(args.session)
+        path = args.session
+    else:
+        canvas_size = (args.width, args.height)
+        events = synthetic_session(args.strokes, canvas_size, args.seed)
+        path = args.save or os.path.join(tempfile.mkdtemp(), "session.mvs")
+        save_session(path, events, canvas_size)
+        events, canvas_size = load_session(path)
+
+    points = sum(len(stroke.points) for event, stroke in events if event == STROKE)
+    size = os.path.getsize(path)
+    print(f"Session: {len(events)} events, {points} points, {size} bytes")
+
+    first, seconds = replay(events, canvas_size)
+    second, _ = replay(events, canvas_size)
+    print(f"Replay: {seconds * 1e3:.1f} ms ({points / seconds:.0f} points/s)")
+    print(f"Replays are pixel-identical: {first.image == second.image}")
+
+    strokes = first.get_strokes()
+    from_strokes = time_call(lambda: strokes_to_model_input(strokes, canvas_size))
+    from_bitmap = time_call(lambda: qimage_to_model_input(first.image))
+    print(
+        f"Model input from {len(strokes)} strokes: {from_strokes * 1e3:.2f} ms, "
+        f"from the canvas bitmap: {from_bitmap * 1e3:.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Measure application cold start: time to the first painted window and time until
+predictions are ready.
+
+Run from the repository root (set QT_QPA_PLATFORM=offscreen on headless machines):
+    python -m benchmarks.startup_time
+"""
+
+import time
+
+_PROCESS_START = time.perf_counter()
+
+import argparse
+import sys
+
+from PyQt5.QtCore import QEvent, QObject, QTimer
+from PyQt5.QtWidgets import QApplication
+
+from models.inference import DEFAULT_MODEL_PATH
+from ui.main_window import DATASET_PATH, MainWindow
+
+
+class FirstPaintFilter(QObject):
+    """Event filter that records when a widget is painted for the first time."""
+
+    def __init__(self):
+        super().__init__()
+        self.first_paint = None
+        self.tensorflow_imported = None
+
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.Paint and self.first_paint is None:
+            self.first_paint = time.perf_counter() - _PROCESS_START
+            self.tensorflow_imported = "tensorflow" in sys.modules
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--dataset", default=DATASET_PATH)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+    imports_done = time.perf_counter() - _PROCESS_START
+
+    paint_filter = FirstPaintFilter()
+    window = MainWindow(model_path=args.model, dataset_path=args.dataset)
+    window.installEventFilter(paint_filter)
+    window.show()
+
+    results = {}
+
+    def poll():
+        session = window.inference_session
+        elapsed = time.perf_counter() - _PROCESS_START
+        if (
+            session.is_ready()
+            or session.load_error is not None
+            or elapsed > args.timeout
+        ):
+            results["ready"] = elapsed if session.is_ready() else None
+            results["error"] = session.load_error
+            app.quit()
+
+    timer = QTimer()
+    timer.timeout.connect(poll)
+    timer.start(10)
+    app.exec_()
+
+    print(f"Imports and QApplication:  {imports_done * 1000:.0f} ms")
+    print(f"First painted window:      {paint_filter.first_paint * 1000:.0f} ms")
+    print(f"TensorFlow imported by then: {paint_filter.tensorflow_imported}")
+    if results.get("ready") is not None:
+        print(f"Predictions ready:         {results['ready'] * 1000:.0f} ms")
+    else:
+        print(f"Model did not become ready: {results.get('error')}")
+
+
+if __name__ == "__main__":
+    main()
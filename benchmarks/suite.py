@@ -0,0 +1,528 @@
+"""
+Benchmark suite covering dataset ingestion, preprocessing memory, training throughput,
+augmentation overhead, inference latency and canvas operations, run offline on synthetic
+data.
+
+`run` generates fake 45x45 symbols in N classes for every requested dataset size and
+writes all measurements to a JSON file; `compare` checks a result file against a saved
+baseline and exits with status 1 if any metric regressed by more than the threshold.
+
+Run from the repository root (set QT_QPA_PLATFORM=offscreen on headless machines):
+    python -m benchmarks.suite run --sizes 1000 10000 --classes 20 --output results.json
+    python -m benchmarks.suite compare baseline.json results.json --threshold 0.1
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PREPROCESS_CHILD = """
+import json, sys, time
+from benchmarks.suite import peak_rss_bytes
+from utils.data_processing import preprocess_dataset
+start = time.perf_counter()
+preprocess_dataset(sys.argv[1], sys.argv[2])
+print(json.dumps([time.perf_counter() - start, peak_rss_bytes()]))
+"""
+
+
+class Results:
+    """Named measurements, each with a unit and the direction that counts as better."""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def add(self, name, value, unit, higher_is_better):
+        self.metrics[name] = {
+            "value": float(value),
+            "unit": unit,
+            "higher_is_better": higher_is_better,
+        }
+        print(f"{name:<45} {value:>12.3f} {unit}")
+
+
+def peak_rss_bytes():
+    """
+    Return the peak resident set size of this process.
+
+    On Linux this is VmHWM, which starts afresh at exec; ru_maxrss would also count the
+    memory of the parent the process was forked from.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak * (1 if sys.platform == "darwin" else 1024)
+
+
+def generate_symbols(folder, size, num_classes, seed=0):
+    """
+    Write `size` synthetic 45x45 JPEG symbols, spread over `num_classes` class folders.
+
+    Every class has a random template of strokes, drawn with per-sample jitter in
+    position and thickness, so the classes are learnable like real symbols.
+    """
+    rng = np.random.default_rng(seed)
+    templates = [
+        rng.integers(6, 39, size=(rng.integers(1, 4), 2, 2)) for _ in range(num_classes)
+    ]
+
+    def write_class(class_index):
+        class_rng = np.random.default_rng((seed, class_index))
+        class_folder = os.path.join(folder, f"class_{class_index:03d}")
+        os.makedirs(class_folder, exist_ok=True)
+        for i in range(class_index, size, num_classes):
+            image = np.full((45, 45), 255, dtype=np.uint8)
+            shift = class_rng.integers(-3, 4, size=2)
+            thickness = int(class_rng.integers(1, 4))
+            for start, end in templates[class_index]:
+                cv2.line(
+                    image,
+                    tuple(map(int, start + shift)),
+                    tuple(map(int, end + shift)),
+                    0,
+                    thickness,
+                )
+            cv2.imwrite(os.path.join(class_folder, f"{i}.jpg"), image)
+
+    with ThreadPoolExecutor() as pool:
+        list(pool.map(write_class, range(num_classes)))
+
+
+def bench_ingestion(results, folder, size, repeat):
+    """Time load_images_from_folder; the first, cold-cache run is not counted."""
+    from utils.data_processing import load_images_from_folder
+
+    load_images_from_folder(folder)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        load_images_from_folder(folder)
+        timings.append(time.perf_counter() - start)
+    results.add(
+        f"ingest/{size}/images_per_second",
+        size / np.median(timings),
+        "images/s",
+        True,
+    )
+
+
+def bench_preprocessing(results, folder, save_path, size):
+    """Run preprocess_dataset in a child process to measure its own peak RSS."""
+    process = subprocess.run(
+        [sys.executable, "-c", PREPROCESS_CHILD, folder, save_path],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"preprocess_dataset failed:\n{process.stderr}")
+
+    seconds, peak_bytes = json.loads(process.stdout.strip().splitlines()[-1])
+    results.add(
+        f"preprocess/{size}/images_per_second", size / seconds, "images/s", True
+    )
+    results.add(f"preprocess/{size}/peak_rss_mb", peak_bytes / 1e6, "MB", False)
+
+
+def bench_training(results, store_path, size, backbone, epochs, batch_size, work_dir):
+    """Train on the preprocessed store and return the path of the saved model."""
+    from models.compare_backbones import EpochTimer
+    from models.train_model import (
+        build_model,
+        load_preprocessed_data,
+        save_trained_model,
+        train_model,
+    )
+
+    X_train, y_train, X_dev, y_dev, _, _, _, input_shape, num_classes = (
+        load_preprocessed_data(store_path)
+    )
+    model = build_model(input_shape, num_classes, backbone)
+    timer = EpochTimer()
+    train_model(
+        model,
+        X_train,
+        y_train,
+        X_dev,
+        y_dev,
+        batch_size=batch_size,
+        epochs=epochs,
+        checkpoint_path=os.path.join(work_dir, "checkpoint.weights.h5"),
+        callbacks=[timer],
+    )
+    # The first epoch includes tracing the training step
+    steady_epochs = timer.epoch_seconds[1:] or timer.epoch_seconds
+    results.add(
+        f"train/{size}/{backbone}/samples_per_second",
+        len(X_train) / np.median(steady_epochs),
+        "samples/s",
+        True,
+    )
+
+    model_path = os.path.join(work_dir, f"{backbone}_{size}.h5")
+    save_trained_model(model, model_path)
+    return model_path
+
+
+def bench_augmentation(
+    results, store_path, size, backbone, epochs, batch_size, work_dir
+):
+    """Measure the augmented input pipeline and what augmentation adds to an epoch."""
+    from models.compare_backbones import EpochTimer
+    from models.input_pipeline import make_dataset
+    from models.train_model import build_model, load_preprocessed_data, train_model
+
+    X_train, y_train, X_dev, y_dev, _, _, _, input_shape, num_classes = (
+        load_preprocessed_data(store_path)
+    )
+
+    # The augmented pipeline alone, which must outpace the training step
+    dataset = make_dataset(X_train, y_train, batch_size, shuffle=True, augment=True)
+    for _ in dataset:  # The first pass includes tracing the augmentation
+        pass
+    start = time.perf_counter()
+    for _ in dataset:
+        pass
+    results.add(
+        f"augment/{size}/pipeline_images_per_second",
+        len(X_train) / (time.perf_counter() - start),
+        "images/s",
+        True,
+    )
+
+    # The same streaming training with and without augmentation
+    epoch_seconds = {}
+    for augment in (False, True):
+        timer = EpochTimer()
+        train_model(
+            build_model(input_shape, num_classes, backbone),
+            X_train,
+            y_train,
+            X_dev,
+            y_dev,
+            batch_size=batch_size,
+            epochs=epochs,
+            streaming=True,
+            augment=augment,
+            checkpoint_path=os.path.join(work_dir, "checkpoint.weights.h5"),
+            callbacks=[timer],
+        )
+        # The first epoch includes tracing the training step
+        epoch_seconds[augment] = np.median(
+            timer.epoch_seconds[1:] or timer.epoch_seconds
+        )
+    results.add(
+        f"train/{size}/{backbone}/augmented_samples_per_second",
+        len(X_train) / epoch_seconds[True],
+        "samples/s",
+        True,
+    )
+    results.add(
+        f"augment/{size}/epoch_time_ratio",
+        epoch_seconds[True] / epoch_seconds[False],
+        "x",
+        False,
+    )
+
+
+def bench_inference(results, model_path, runs, batch_sizes):
+    """Time single and batched predictions of a warmed-up InferenceSession."""
+    from models.inference import DEFAULT_INPUT_SHAPE, InferenceSession
+
+    session = InferenceSession(model_path)
+    session.start()
+    session.wait_until_ready()
+
+    rng = np.random.default_rng(0)
+    for batch_size in batch_sizes:
+        batch = rng.random((batch_size,) + DEFAULT_INPUT_SHAPE, dtype=np.float32)
+        session.predict(batch)  # The interpreter or graph adapts to the batch size
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            session.predict(batch)
+            timings.append(time.perf_counter() - start)
+        timings = np.array(timings) * 1000
+        results.add(
+            f"inference/batch_{batch_size}/p50_ms",
+            np.percentile(timings, 50),
+            "ms",
+            False,
+        )
+        results.add(
+            f"inference/batch_{batch_size}/p99_ms",
+            np.percentile(timings, 99),
+            "ms",
+            False,
+        )
+        if batch_size > 1:
+            results.add(
+                f"inference/batch_{batch_size}/images_per_second",
+                batch_size * 1000 / np.median(timings),
+                "images/s",
+                True,
+            )
+
+
+def random_stroke(rng, width, height, length=20, step=15):
+    """Return the points of a random-walk stroke."""
+    x, y = rng.randrange(width), rng.randrange(height)
+    points = [(x, y)]
+    for _ in range(length):
+        x = min(max(x + rng.randint(-step, step), 0), width - 1)
+        y = min(max(y + rng.randint(-step, step), 0), height - 1)
+        points.append((x, y))
+    return points
+
+
+def bench_canvas(results, strokes, width, height):
+    """Time pen strokes, undo, redo and the model input of predictDrawing on the canvas."""
+    from PyQt5.QtCore import QEvent, QPoint, Qt
+    from PyQt5.QtGui import QMouseEvent
+    from PyQt5.QtWidgets import QApplication
+
+    from ui.canvas_widget import CanvasWidget
+    from utils.strokes import strokes_to_model_input
+
+    app = QApplication.instance() or QApplication([sys.argv[0]])
+    canvas = CanvasWidget([])
+    canvas.resize(width, height)
+    canvas.show()
+    app.processEvents()
+
+    def send(kind, point):
+        buttons = Qt.NoButton if kind == QEvent.MouseButtonRelease else Qt.LeftButton
+        app.sendEvent(
+            canvas, QMouseEvent(kind, point, Qt.LeftButton, buttons, Qt.NoModifier)
+        )
+
+    rng = random.Random(0)
+    stroke_timings = []
+    for _ in range(strokes):
+        points = [QPoint(x, y) for x, y in random_stroke(rng, width, height)]
+        start = time.perf_counter()
+        send(QEvent.MouseButtonPress, points[0])
+        for point in points[1:]:
+            send(QEvent.MouseMove, point)
+        send(QEvent.MouseButtonRelease, points[-1])
+        app.processEvents()
+        stroke_timings.append(time.perf_counter() - start)
+
+    # The input predictDrawing sends to the model, rasterized from the strokes
+    input_timings = []
+    for _ in range(20):
+        start = time.perf_counter()
+        strokes_to_model_input(canvas.get_strokes(), (canvas.width(), canvas.height()))
+        input_timings.append(time.perf_counter() - start)
+
+    memory_per_stroke = canvas.history.memory_used / max(
+        len(canvas.history.undo_stack), 1
+    )
+    undo_timings, redo_timings = [], []
+    for timings, action in ((undo_timings, canvas.undo), (redo_timings, canvas.redo)):
+        for _ in range(strokes):
+            start = time.perf_counter()
+            action()
+            app.processEvents()
+            timings.append(time.perf_counter() - start)
+    canvas.close()
+
+    prefix = f"canvas/{width}x{height}"
+    results.add(
+        f"{prefix}/stroke_p50_ms", np.median(stroke_timings) * 1000, "ms", False
+    )
+    results.add(f"{prefix}/undo_p50_ms", np.median(undo_timings) * 1000, "ms", False)
+    results.add(f"{prefix}/redo_p50_ms", np.median(redo_timings) * 1000, "ms", False)
+    results.add(f"{prefix}/undo_mb_per_stroke", memory_per_stroke / 1e6, "MB", False)
+    results.add(
+        f"{prefix}/drawing_to_input_ms", np.median(input_timings) * 1000, "ms", False
+    )
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    results = Results()
+    work_dir = tempfile.mkdtemp(prefix="math_vision_bench_", dir=args.work_dir)
+    model_path = None
+    try:
+        for size in args.sizes:
+            folder = os.path.join(work_dir, f"symbols_{size}")
+            store_path = os.path.join(work_dir, f"store_{size}")
+            generate_symbols(folder, size, args.classes)
+            if "ingest" in args.only:
+                bench_ingestion(results, folder, size, args.repeat)
+            if {"preprocess", "train", "augment"} & set(args.only):
+                bench_preprocessing(results, folder, store_path, size)
+            if "train" in args.only:
+                model_path = bench_training(
+                    results,
+                    store_path,
+                    size,
+                    args.backbone,
+                    args.epochs,
+                    args.batch_size,
+                    work_dir,
+                )
+            if "augment" in args.only:
+                bench_augmentation(
+                    results,
+                    store_path,
+                    size,
+                    args.backbone,
+                    args.epochs,
+                    args.batch_size,
+                    work_dir,
+                )
+            shutil.rmtree(folder)
+
+        if "inference" in args.only:
+            if args.model:
+                model_path = args.model
+            elif model_path is None:  # Train a model just for the latency numbers
+                size = args.sizes[0]
+                folder = os.path.join(work_dir, "symbols_inference")
+                store_path = os.path.join(work_dir, "store_inference")
+                generate_symbols(folder, size, args.classes)
+                bench_preprocessing(Results(), folder, store_path, size)
+                model_path = bench_training(
+                    Results(), store_path, size, args.backbone, 1, 64, work_dir
+                )
+            bench_inference(results, model_path, args.runs, args.inference_batch_sizes)
+
+        if "canvas" in args.only:
+            width, height = args.canvas_size
+            bench_canvas(results, args.strokes, width, height)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    import tensorflow as tf
+
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "tensorflow": tf.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "arguments": {
+                key: value for key, value in vars(args).items() if key != "func"
+            },
+        },
+        "metrics": results.metrics,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)["metrics"]
+    with open(args.results) as f:
+        current = json.load(f)["metrics"]
+
+    regressions = []
+    print(f"{'metric':<45}{'baseline':>12}{'current':>12}{'change':>9}")
+    for name in sorted(baseline.keys() & current.keys()):
+        before, after = baseline[name]["value"], current[name]["value"]
+        change = (after - before) / before if before else 0.0
+        worse = -change if current[name]["higher_is_better"] else change
+        flag = ""
+        if worse > args.threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<45}{before:>12.3f}{after:>12.3f}{change:>+9.1%}{flag}")
+
+    for name in sorted(baseline.keys() ^ current.keys()):
+        print(f"{name:<45} only in {'baseline' if name in baseline else 'results'}")
+
+    if regressions:
+        print(
+            f"{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}"
+        )
+        sys.exit(1)
+    print(f"No regression above {args.threshold:.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmarks")
+    run_parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    run_parser.add_argument("--classes", type=int, default=20)
+    run_parser.add_argument(
+        "--only",
+        nargs="+",
+        choices=["ingest", "preprocess", "train", "augment", "inference", "canvas"],
+        default=["ingest", "preprocess", "train", "augment", "inference", "canvas"],
+    )
+    run_parser.add_argument("--output", default="benchmark_results.json")
+    run_parser.add_argument("--work-dir", default=None, help="For the synthetic data")
+    run_parser.add_argument("--repeat", type=int, default=3)
+    run_parser.add_argument("--backbone", default="small_cnn")
+    run_parser.add_argument("--epochs", type=int, default=2)
+    run_parser.add_argument("--batch-size", type=int, default=64)
+    run_parser.add_argument(
+        "--model", default=None, help="Model for inference (default: the trained one)"
+    )
+    run_parser.add_argument("--runs", type=int, default=50)
+    run_parser.add_argument(
+        "--inference-batch-sizes", type=int, nargs="+", default=[1, 64, 256]
+    )
+    run_parser.add_argument("--strokes", type=int, default=50)
+    run_parser.add_argument(
+        "--canvas-size", type=int, nargs=2, default=[1920, 1080], metavar=("W", "H")
+    )
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser(
+        "compare", help="Flag regressions against a baseline"
+    )
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("results")
+    compare_parser.add_argument(
+        "--threshold", type=float, default=0.1, help="Relative change, e.g. 0.1"
+    )
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Compare the tile-based undo history of the canvas with full-canvas snapshots: memory per
+stroke, time spent when a stroke is released, and undo latency.
+
+Run from the repository root (set QT_QPA_PLATFORM=offscreen on headless machines):
+    python -m benchmarks.undo_history --width 3840 --height 2160 --strokes 50
+"""
+
+import argparse
+import random
+import sys
+import time
+
+from PyQt5.QtCore import QPoint, QSize
+from PyQt5.QtGui import QImage
+from PyQt5.QtWidgets import QApplication
+
+from ui.canvas_widget import CanvasWidget
+from ui.undo_history import TileUndoHistory
+
+
+def draw_stroke(canvas, rng, length=20, step=15):
+    """Draw a random-walk stroke of `length` segments on the canvas image."""
+    x = rng.randrange(canvas.image.width())
+    y = rng.randrange(canvas.image.height())
+    canvas.last_point = QPoint(x, y)
+    for _ in range(length):
+        x = min(max(x + rng.randint(-step, step), 0), canvas.image.width() - 1)
+        y = min(max(y + rng.randint(-step, step), 0), canvas.image.height() - 1)
+        canvas.draw_line_to(QPoint(x, y))
+
+
+def run_full_copy(canvas, strokes, rng):
+    """Replay strokes with the previous approach of one QImage.copy() per stroke."""
+    undo_stack, redo_stack = [], []
+    release_seconds = 0.0
+    for _ in range(strokes):
+        draw_stroke(canvas, rng)
+        start = time.perf_counter()
+        undo_stack.append(canvas.image.copy())
+        redo_stack = []
+        release_seconds += time.perf_counter() - start
+
+    memory = sum(image.byteCount() for image in undo_stack)
+    start = time.perf_counter()
+    while undo_stack:
+        redo_stack.append(canvas.image.copy())
+        canvas.image = undo_stack.pop()
+    undo_seconds = time.perf_counter() - start
+    return memory, release_seconds, undo_seconds
+
+
+def run_tiles(canvas, strokes, rng, memory_budget):
+    """Replay strokes with the tile-based undo history."""
+    canvas.history = TileUndoHistory(memory_budget=memory_budget)
+    release_seconds = 0.0
+    for _ in range(strokes):
+        canvas.history.begin_action()
+        draw_stroke(canvas, rng)
+        start = time.perf_counter()
+        canvas.save_snapshot()
+        release_seconds += time.perf_counter() - start
+
+    memory = canvas.history.memory_used
+    recorded = len(canvas.history.undo_stack)
+    start = time.perf_counter()
+    while canvas.history.undo(canvas.image) is not None:
+        pass
+    undo_seconds = time.perf_counter() - start
+    return memory, release_seconds, undo_seconds, recorded
+
+
+def new_canvas(width, height):
+    canvas = CanvasWidget([])
+    canvas.resize_image(canvas.image, QSize(width, height))
+    return canvas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--width", type=int, default=3840)
+    parser.add_argument("--height", type=int, default=2160)
+    parser.add_argument("--strokes", type=int, default=50)
+    parser.add_argument("--budget-mb", type=float, default=64.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+    strokes = args.strokes
+
+    canvas = new_canvas(args.width, args.height)
+    full_memory, full_release, full_undo = run_full_copy(
+        canvas, strokes, random.Random(args.seed)
+    )
+
+    canvas = new_canvas(args.width, args.height)
+    tile_memory, tile_release, tile_undo, recorded = run_tiles(
+        canvas, strokes, random.Random(args.seed), int(args.budget_mb * 1024 * 1024)
+    )
+    blank = QImage(canvas.image.size(), canvas.image.format())
+    blank.fill(0xFFFFFFFF)
+
+    print(f"Canvas {args.width}x{args.height}, {strokes} strokes")
+    print(
+        f"Full copy: {full_memory / strokes / 1e6:8.3f} MB/stroke, "
+        f"release {full_release / strokes * 1e3:7.3f} ms/stroke, "
+        f"undo {full_undo / strokes * 1e3:7.3f} ms/action"
+    )
+    print(
+        f"Tiles:     {tile_memory / max(recorded, 1) / 1e6:8.3f} MB/stroke, "
+        f"release {tile_release / strokes * 1e3:7.3f} ms/stroke, "
+        f"undo {tile_undo / max(recorded, 1) * 1e3:7.3f} ms/action"
+    )
+    print(f"Tile history kept {recorded}/{strokes} strokes within budget")
+    if recorded == strokes:
+        print(f"Undoing every stroke restored a blank canvas: {canvas.image == blank}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+"""
+Classify images offline with the trained model, without the GUI.
+
+Images are streamed from a directory tree, a glob pattern or a tar/zip archive, decoded in
+parallel with the training preprocessing and classified in large fixed-size batches. The
+top-k classes of every image are appended to a JSONL or CSV file as soon as its batch is
+done; running again with the same output file resumes where the previous run stopped.
+
+Usage:
+    python classify.py scans/ --output predictions.jsonl
+    python classify.py "scans/**/*.png" --output predictions.csv --top-k 3
+    python classify.py scans.tar.gz --output predictions.jsonl --batch-size 512
+"""
+
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import tarfile
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from models.inference import (
+    BACKENDS,
+    DEFAULT_CACHE_SIZE,
+    DEFAULT_MODEL_PATH,
+    InferenceSession,
+)
+from utils.data_processing import IMAGE_SIZE, decode_image_bytes
+from utils.manifest import load_class_names
+from utils.preprocessing import normalize_batch
+
+DATASET_PATH = "data/processed_data/math_notation_dataset"
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp")
+TAR_EXTENSIONS = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+
+def is_image_name(name):
+    """Return True if a file name has an image extension."""
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def iter_sources(source):
+    """
+    Stream the images of a directory tree, glob pattern, or tar/zip archive.
+
+    Files on disk are yielded as paths, so that workers read them in parallel; archive
+    members are read here, in order, since archives cannot be read concurrently.
+
+    Args:
+        source (str): Directory, glob pattern, or path of a tar or zip archive.
+
+    Yields:
+        tuple: (key, payload), where key identifies the image in the output and payload is
+            either a file path or the encoded image bytes.
+    """
+    lower = source.lower()
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if is_image_name(name):
+                    path = os.path.join(root, name)
+                    key = os.path.relpath(path, source).replace(os.sep, "/")
+                    yield key, path
+    elif lower.endswith(".zip"):
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and is_image_name(info.filename):
+                    yield info.filename, archive.read(info)
+    elif lower.endswith(TAR_EXTENSIONS):
+        # Stream mode reads the archive sequentially, even when it is compressed
+        with tarfile.open(source, "r|*") as archive:
+            for member in archive:
+                if member.isfile() and is_image_name(member.name):
+                    yield member.name, archive.extractfile(member).read()
+    else:
+        for path in sorted(glob.glob(source, recursive=True)):
+            if os.path.isfile(path) and is_image_name(path):
+                yield path, path
+
+
+def batched(items, batch_size):
+    """Group an iterable into lists of batch_size items (the last one may be shorter)."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _decode_into(images, valid, start, payloads):
+    """Decode payloads into rows start... of a preallocated batch."""
+    for i, payload in enumerate(payloads, start):
+        try:
+            if isinstance(payload, str):
+                with open(payload, "rb") as f:
+                    payload = f.read()
+            image = decode_image_bytes(payload, images.shape[1:])
+        except OSError:
+            image = None
+        if image is not None:
+            images[i] = image
+            valid[i] = True
+
+
+class ResultWriter:
+    """Append classification results to a JSONL or CSV file, resuming a partial one."""
+
+    def __init__(self, path, output_format, top_k):
+        """
+        Args:
+            path (str): Output file path.
+            output_format (str): "jsonl" or "csv".
+            top_k (int): Number of classes written per image.
+        """
+        self.path = path
+        self.output_format = output_format
+        self.top_k = top_k
+        self.done = self._load_done()
+
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, "a", newline="", encoding="utf-8")
+        self.csv_writer = None
+        if output_format == "csv":
+            self.csv_writer = csv.writer(self.file)
+            if new_file:
+                header = ["path"]
+                for rank in range(1, top_k + 1):
+                    header += [f"class_{rank}", f"probability_{rank}"]
+                self.csv_writer.writerow(header + ["error"])
+
+    def _load_done(self):
+        """Return the keys already in the output, dropping a truncated last line."""
+        if not os.path.exists(self.path):
+            return set()
+
+        with open(self.path, "rb+") as f:
+            data = f.read()
+            end = data.rfind(b"\n") + 1
+            if end < len(data):  # An interrupted run left half a line behind
+                f.truncate(end)
+        lines = data[:end].decode("utf-8").splitlines()
+
+        if self.output_format == "csv":
+            return {row[0] for row in csv.reader(lines[1:]) if row}
+        return {json.loads(line)["path"] for line in lines if line.strip()}
+
+    def write(self, key, probabilities=None, class_names=(), error=None):
+        """Write the top-k classes of one image, or the error that prevented it."""
+        top = []
+        if probabilities is not None:
+            for class_index in np.argsort(-probabilities)[: self.top_k]:
+                class_name = (
+                    class_names[class_index]
+                    if class_index < len(class_names)
+                    else str(class_index)
+                )
+                top.append((str(class_name), float(probabilities[class_index])))
+
+        if self.csv_writer is not None:
+            row = [key]
+            for class_name, probability in top:
+                row += [class_name, f"{probability:.6f}"]
+            row += [""] * (2 * (self.top_k - len(top)))
+            self.csv_writer.writerow(row + [error or ""])
+        else:
+            record = {"path": key}
+            if error is None:
+                record["predictions"] = [
+                    {"class_name": class_name, "probability": probability}
+                    for class_name, probability in top
+                ]
+            else:
+                record["error"] = error
+            self.file.write(json.dumps(record) + "\n")
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def classify(
+    source,
+    writer,
+    predict,
+    class_names,
+    batch_size=256,
+    workers=None,
+    prefetch_batches=2,
+    image_size=IMAGE_SIZE,
+):
+    """
+    Classify every image of a source that is not in the output yet.
+
+    Batches are decoded by a thread pool while earlier batches run through the model, and
+    every batch is run at the full batch size (the last one padded) so the model always
+    sees the same input shape.
+
+    Args:
+        source (str): Directory, glob pattern, or tar/zip archive.
+        writer (ResultWriter): Where results are written; its done keys are skipped.
+        predict (callable): Function mapping a normalized batch and the mask of its
+            decoded images (the other rows are padding) to class probabilities, like
+            InferenceSession.predict.
+        class_names (list): Class names, indexed by model output.
+        batch_size (int): Number of images per forward pass.
+        workers (int): Number of decoding threads. Defaults to the number of CPUs.
+        prefetch_batches (int): Number of batches decoded ahead of the model.
+        image_size (tuple): (height, width) of the model input.
+
+    Returns:
+        tuple: (images classified, images that could not be decoded)
+    """
+    workers = workers or os.cpu_count()
+    chunk_size = max(batch_size // workers, 1)
+    items = (item for item in iter_sources(source) if item[0] not in writer.done)
+
+    classified = failed = 0
+    start_time = time.perf_counter()
+    in_flight = deque()
+
+    def finish(keys, images, valid, futures):
+        nonlocal classified, failed
+        for future in futures:
+            future.result()
+        probabilities = predict(normalize_batch(images), valid)
+        for i, key in enumerate(keys):
+            if valid[i]:
+                writer.write(key, probabilities[i], class_names)
+                classified += 1
+            else:
+                writer.write(key, error="could not decode image")
+                failed += 1
+        writer.flush()
+        elapsed = max(time.perf_counter() - start_time, 1e-9)
+        print(
+            f"\rClassified {classified} images, {failed} failed "
+            f"({(classified + failed) / elapsed:.0f} images/s)",
+            end="",
+            file=sys.stderr,
+        )
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for batch in batched(items, batch_size):
+            keys = [key for key, _ in batch]
+            images = np.zeros((batch_size,) + tuple(image_size), dtype=np.uint8)
+            valid = np.zeros(batch_size, dtype=bool)
+            futures = [
+                pool.submit(
+                    _decode_into,
+                    images,
+                    valid,
+                    start,
+                    [payload for _, payload in batch[start : start + chunk_size]],
+                )
+                for start in range(0, len(batch), chunk_size)
+            ]
+            in_flight.append((keys, images, valid, futures))
+            if len(in_flight) > prefetch_batches:
+                finish(*in_flight.popleft())
+        while in_flight:
+            finish(*in_flight.popleft())
+
+    print(file=sys.stderr)
+    return classified, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Classify images offline with the trained model."
+    )
+    parser.add_argument("source", help="Directory, glob pattern, or tar/zip archive")
+    parser.add_argument("--output", required=True, help="JSONL or CSV output file")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="Output format")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument(
+        "--backend", choices=BACKENDS, help="Default: from the model file extension"
+    )
+    parser.add_argument("--dataset", default=DATASET_PATH, help="For the class names")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_CACHE_SIZE,
+        help="Predictions cached per image content, so images seen before skip the model",
+    )
+    args = parser.parse_args()
+
+    output_format = args.format or (
+        "csv" if args.output.lower().endswith(".csv") else "jsonl"
+    )
+    writer = ResultWriter(args.output, output_format, args.top_k)
+    if writer.done:
+        print(f"Resuming: {len(writer.done)} images already in {args.output}")
+
+    class_names = load_class_names(args.dataset)
+    session = InferenceSession(
+        args.model, backend=args.backend, cache_size=args.cache_size
+    )
+    session.start()
+    session.wait_until_ready()
+
+    start_time = time.perf_counter()
+    try:
+        classified, failed = classify(
+            args.source,
+            writer,
+            session.predict,
+            class_names,
+            batch_size=args.batch_size,
+            workers=args.workers,
+        )
+    finally:
+        writer.close()
+    elapsed = time.perf_counter() - start_time
+
+    total = classified + failed
+    print(
+        f"Classified {classified} images ({failed} could not be decoded) in "
+        f"{elapsed:.1f}s: {total / max(elapsed, 1e-9):.0f} images/s"
+    )
+    cache = session.cache.stats()
+    if cache["hits"]:
+        print(f"{cache['hits']} duplicate images were answered from the cache")
+
+
+if __name__ == "__main__":
+    main()
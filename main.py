@@ -1,20 +1,46 @@
+import argparse
 import sys
 from PyQt5.QtWidgets import QApplication
-from ui.main_window import MainWindow
+from models.inference import BACKENDS, DEFAULT_MODEL_PATH
+from ui.main_window import DATASET_PATH, MainWindow
+from utils import profiling
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Math notation recognition app.")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--dataset", default=DATASET_PATH, help="For the class names")
+    parser.add_argument(
+        "--backend", choices=BACKENDS, help="Default: from the model file extension"
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="TRACE",
+        help="Record stage timings and write them as a Chrome trace on exit.",
+    )
+    parser.add_argument(
+        "--tf-profile",
+        metavar="LOGDIR",
+        help="Capture a tf.profiler trace of the session for TensorBoard.",
+    )
+    # Remaining arguments are Qt's own (e.g. -platform)
+    args, qt_args = parser.parse_known_args()
+
     # Create the application instance
-    app = QApplication(sys.argv)
+    app = QApplication(sys.argv[:1] + qt_args)
 
     # Create the main window
-    main_window = MainWindow()
+    main_window = MainWindow(
+        model_path=args.model, dataset_path=args.dataset, backend=args.backend
+    )
 
     # Show the main window
     main_window.show()
 
     # Start the application event loop
-    sys.exit(app.exec_())
+    with profiling.profile_to(args.profile), profiling.tf_profiler(args.tf_profile):
+        exit_code = app.exec_()
+    sys.exit(exit_code)
 
 
 if __name__ == "__main__":
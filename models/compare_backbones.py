@@ -0,0 +1,166 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+from tensorflow.keras.callbacks import Callback
+from tensorflow.keras.layers import Conv2D, Dense, DepthwiseConv2D
+
+from models.export_model import benchmark_backend
+from models.inference import InferenceSession
+from models.train_model import (
+    BACKBONES,
+    DEFAULT_VGG16_WEIGHTS,
+    build_model,
+    load_preprocessed_data,
+    save_trained_model,
+    train_model,
+)
+from utils.dataset_store import is_sharded_dataset
+
+
+class EpochTimer(Callback):
+    """Record the wall-clock duration of every training epoch."""
+
+    def __init__(self):
+        super().__init__()
+        self.epoch_seconds = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.epoch_seconds.append(time.perf_counter() - self.start)
+
+
+def count_flops(model):
+    """
+    Count the floating point operations of one forward pass of a single image.
+
+    Multiply-accumulates of convolution and dense layers are counted as two operations;
+    activations, normalization and pooling are negligible next to them and are ignored.
+
+    Args:
+    - model (TensorFlow Keras Model): Functional model to count.
+
+    Returns:
+    - int: Floating point operations per image.
+    """
+    macs = 0
+    for layer in model.layers:
+        if isinstance(layer, DepthwiseConv2D):
+            _, height, width, channels = layer.output.shape
+            kernel_height, kernel_width = layer.kernel_size
+            macs += height * width * channels * kernel_height * kernel_width
+        elif isinstance(layer, Conv2D):
+            _, height, width, filters = layer.output.shape
+            kernel_height, kernel_width = layer.kernel_size
+            in_channels = layer.input.shape[-1]
+            macs += (
+                height * width * filters * kernel_height * kernel_width * in_channels
+            )
+        elif isinstance(layer, Dense):
+            macs += layer.input.shape[-1] * layer.units
+    return 2 * int(macs)
+
+
+def compare_backbone(backbone, data, args):
+    """
+    Build, train and measure one backbone.
+
+    Args:
+    - backbone (str): Backbone name, one of BACKBONES.
+    - data (tuple): Output of load_preprocessed_data.
+    - args (argparse.Namespace): Command-line options.
+
+    Returns:
+    - dict: Parameters, FLOPs, training throughput, latency and test accuracy.
+    """
+    X_train, y_train, X_dev, y_dev, X_test, y_test, _, input_shape, num_classes = data
+    model = build_model(input_shape, num_classes, backbone, args.vgg_weights)
+    trainable = int(sum(np.prod(weight.shape) for weight in model.trainable_weights))
+
+    timer = EpochTimer()
+    model, history = train_model(
+        model,
+        X_train,
+        y_train,
+        X_dev,
+        y_dev,
+        batch_size=args.batch_size,
+        epochs=args.epochs,
+        checkpoint_path=os.path.join(args.output_dir, f"{backbone}.weights.h5"),
+        callbacks=[timer],
+    )
+    # The first epoch includes tracing the training step
+    steady_epochs = timer.epoch_seconds[1:] or timer.epoch_seconds
+    train_images_per_second = len(X_train) / float(np.median(steady_epochs))
+
+    model_path = os.path.join(args.output_dir, f"{backbone}.h5")
+    save_trained_model(model, model_path)
+    measured = benchmark_backend(InferenceSession(model_path), X_test, y_test)
+
+    return {
+        "parameters": int(model.count_params()),
+        "trainable_parameters": trainable,
+        "mflops": count_flops(model) / 1e6,
+        "epochs": len(timer.epoch_seconds),
+        "train_images_per_second": train_images_per_second,
+        "latency_ms": measured["latency_ms"],
+        "inference_images_per_second": measured["images_per_second"],
+        "accuracy": measured["accuracy"],
+        "size_mb": os.path.getsize(model_path) / 1e6,
+    }
+
+
+def main():
+    """
+    Train every backbone on the same data and report its cost and accuracy.
+    """
+    parser = argparse.ArgumentParser(
+        description="Compare the model backbones on cost and accuracy."
+    )
+    parser.add_argument(
+        "--backbones", nargs="+", choices=BACKBONES, default=list(BACKBONES)
+    )
+    parser.add_argument("--vgg-weights", default=DEFAULT_VGG16_WEIGHTS)
+    parser.add_argument("--data", default="data/processed_data/math_notation_dataset")
+    parser.add_argument("--output-dir", default="models/saved_models/backbones")
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    data_path = args.data
+    if not is_sharded_dataset(data_path) and not data_path.endswith(".npz"):
+        data_path += ".npz"  # Dataset preprocessed with the previous format
+    data = load_preprocessed_data(data_path)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    results = {}
+    for backbone in args.backbones:
+        try:
+            results[backbone] = compare_backbone(backbone, data, args)
+        except FileNotFoundError as error:  # VGG16 weights are not available offline
+            print(f"Skipping {backbone}: {error}")
+
+    print(
+        f"{'backbone':<11}{'params':>11}{'MFLOPs':>9}{'train img/s':>13}"
+        f"{'latency (ms)':>14}{'infer img/s':>13}{'accuracy':>10}{'size (MB)':>11}"
+    )
+    for backbone, result in results.items():
+        print(
+            f"{backbone:<11}{result['parameters']:>11,}{result['mflops']:>9.1f}"
+            f"{result['train_images_per_second']:>13.0f}{result['latency_ms']:>14.2f}"
+            f"{result['inference_images_per_second']:>13.0f}"
+            f"{result['accuracy']:>10.4f}{result['size_mb']:>11.2f}"
+        )
+
+    report_path = os.path.join(args.output_dir, "backbone_report.json")
+    with open(report_path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Report saved to {report_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,693 @@
+"""
+Resumable training with full training-state checkpoints, on one or several local workers.
+
+The training state (model weights, optimizer slots and step, epoch, position within the
+epoch, running metrics, early-stopping progress and the dropout random state) is saved
+with tf.train.CheckpointManager every few hundred steps and after every epoch, and
+training resumes from the latest checkpoint automatically. Every epoch has a fixed data
+order derived from the seed and the epoch number (see models.input_pipeline.make_dataset),
+so a resumed run trains on exactly the batches the interrupted one had left.
+
+The same training loop runs data-parallel with tf.distribute.MultiWorkerMirroredStrategy
+when the process is one of several workers described by TF_CONFIG: launch_local_workers
+starts them as processes of this host on a local cluster spec, without any external
+service. `python -m models.distributed` measures the scaling efficiency against one worker.
+"""
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+DEFAULT_STATE_DIR = "models/saved_models/training_state"
+DEFAULT_SAVE_EVERY_STEPS = 200
+DEFAULT_PATIENCE = 5  # Epochs without a lower validation loss before stopping early
+STATES_KEPT = 2  # The previous state survives a crash while the latest is being written
+WORKER_POLL_SECONDS = 0.5
+
+
+def worker_environment():
+    """
+    Read the worker index and number of workers of this process from TF_CONFIG.
+
+    Returns:
+        Tuple of int: (worker index, number of workers); (0, 1) without TF_CONFIG.
+    """
+    if "TF_CONFIG" not in os.environ:
+        return 0, 1
+    config = json.loads(os.environ["TF_CONFIG"])
+    return config["task"]["index"], len(config["cluster"]["worker"])
+
+
+def is_worker_process():
+    """Return True if this process is one of several workers started with TF_CONFIG."""
+    return worker_environment()[1] > 1
+
+
+def create_strategy():
+    """
+    Create the distribution strategy of this process.
+
+    Must be called before TensorFlow runs its first operation. Every worker of a cluster
+    waits here until all of them have started.
+
+    Returns:
+        tf.distribute.Strategy: A MultiWorkerMirroredStrategy in a worker process,
+            otherwise the default (single-process) strategy.
+    """
+    import tensorflow as tf
+
+    if is_worker_process():
+        return tf.distribute.MultiWorkerMirroredStrategy()
+    return tf.distribute.get_strategy()
+
+
+def local_cluster_spec(num_workers):
+    """
+    Describe a cluster of workers that all run on this host, on free local ports.
+
+    Args:
+        num_workers (int): Number of worker processes.
+
+    Returns:
+        dict: Cluster spec for TF_CONFIG, e.g. {"worker": ["localhost:40123", ...]}.
+    """
+    sockets = [socket.socket() for _ in range(num_workers)]
+    try:
+        # Holding every socket open until all are bound gives distinct ports
+        for sock in sockets:
+            sock.bind(("localhost", 0))
+        return {"worker": [f"localhost:{sock.getsockname()[1]}" for sock in sockets]}
+    finally:
+        for sock in sockets:
+            sock.close()
+
+
+def launch_local_workers(num_workers, command, log_dir=None):
+    """
+    Run a command as every worker of a local multi-worker cluster and wait for all.
+
+    Every process gets the cluster spec and its own index in TF_CONFIG. Worker 0, the
+    chief, writes to this terminal; the other workers write to worker_<index>.log in
+    log_dir (or to the terminal too without it). If a worker fails, the others would wait
+    for it forever, so they are stopped.
+
+    Args:
+        num_workers (int): Number of worker processes.
+        command (list): Command line of a worker, e.g. [sys.executable, "-m", ...].
+        log_dir (str): Directory for the output of the non-chief workers.
+
+    Returns:
+        int: 0 if every worker succeeded, otherwise the exit code of the first failure.
+    """
+    cluster = local_cluster_spec(num_workers)
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+    processes, logs = [], []
+    try:
+        for index in range(num_workers):
+            config = {"cluster": cluster, "task": {"type": "worker", "index": index}}
+            output = None
+            if index and log_dir:
+                output = open(os.path.join(log_dir, f"worker_{index}.log"), "w")
+                logs.append(output)
+            processes.append(
+                subprocess.Popen(
+                    command,
+                    env=dict(os.environ, TF_CONFIG=json.dumps(config)),
+                    stdout=output,
+                    stderr=subprocess.STDOUT if output else None,
+                )
+            )
+
+        while True:
+            codes = [process.poll() for process in processes]
+            failed = [code for code in codes if code not in (None, 0)]
+            if failed:
+                for process in processes:
+                    if process.poll() is None:
+                        process.terminate()
+                print(f"A worker failed with exit code {failed[0]}, stopped the others")
+                return failed[0]
+            if all(code == 0 for code in codes):
+                return 0
+            time.sleep(WORKER_POLL_SECONDS)
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+        for output in logs:
+            output.close()
+
+
+class TrainingState:
+    """
+    Checkpoint of everything needed to continue training exactly where it stopped.
+
+    Besides the model and its optimizer, the state holds the epoch, the number of batches
+    already trained on in that epoch with their summed loss and correct predictions, the
+    best validation loss with its weights and the number of epochs since, and the state of
+    the model's random seed generators (dropout). Only the chief worker writes into
+    state_dir; every worker saves, since saving may involve collective operations, but the
+    others save to a temporary directory that is removed right away.
+    """
+
+    def __init__(self, model, state_dir, is_chief=True, max_to_keep=STATES_KEPT):
+        """
+        Args:
+            model (TensorFlow Keras Model): Compiled model, with a built optimizer.
+            state_dir (str): Directory of the checkpoints.
+            is_chief (bool): Whether this process writes the checkpoints.
+            max_to_keep (int): Number of checkpoints kept.
+        """
+        import tensorflow as tf
+
+        self.model = model
+        self.state_dir = state_dir
+        self.is_chief = is_chief
+        self.epoch = tf.Variable(0, dtype=tf.int64, trainable=False)
+        self.step = tf.Variable(0, dtype=tf.int64, trainable=False)
+        self.loss_sum = tf.Variable(0.0, dtype=tf.float64, trainable=False)
+        self.correct = tf.Variable(0.0, dtype=tf.float64, trainable=False)
+        self.best_val_loss = tf.Variable(np.inf, dtype=tf.float64, trainable=False)
+        self.best_epoch = tf.Variable(-1, dtype=tf.int64, trainable=False)
+        self.wait = tf.Variable(0, dtype=tf.int64, trainable=False)
+        self.best_weights = [
+            tf.Variable(weight, trainable=False) for weight in model.get_weights()
+        ]
+        # Seed generator states are model variables but not weights
+        weight_ids = {id(weight) for weight in model.weights}
+        random_states = [
+            variable for variable in model.variables if id(variable) not in weight_ids
+        ]
+
+        self.checkpoint = tf.train.Checkpoint(
+            model=model,
+            optimizer=model.optimizer,
+            random_states=random_states,
+            epoch=self.epoch,
+            step=self.step,
+            loss_sum=self.loss_sum,
+            correct=self.correct,
+            best_val_loss=self.best_val_loss,
+            best_epoch=self.best_epoch,
+            wait=self.wait,
+            best_weights=self.best_weights,
+        )
+        self.manager = tf.train.CheckpointManager(
+            self.checkpoint, state_dir, max_to_keep=max_to_keep
+        )
+
+    def restore(self):
+        """
+        Restore the latest checkpoint, if there is one.
+
+        Returns:
+            bool: Whether a checkpoint was restored.
+        """
+        if self.manager.latest_checkpoint is None:
+            return False
+        status = self.checkpoint.restore(self.manager.latest_checkpoint)
+        # Fails if the checkpoint was written for a different model
+        status.assert_existing_objects_matched()
+        return True
+
+    def save(self):
+        """Save the current state; call on every worker at the same step."""
+        step = int(self.model.optimizer.iterations.numpy())
+        if self.is_chief:
+            self.manager.save(checkpoint_number=step)
+            return
+        temp_dir = tempfile.mkdtemp(prefix="training_state_worker_")
+        try:
+            self.checkpoint.write(os.path.join(temp_dir, "state"))
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def delete(self):
+        """Remove the checkpoints once training has finished, keeping any worker logs."""
+        if not self.is_chief:
+            return
+        for prefix in self.manager.checkpoints:
+            for path in glob.glob(f"{prefix}.*"):
+                os.remove(path)
+        index_path = os.path.join(self.state_dir, "checkpoint")
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        if os.path.isdir(self.state_dir) and not os.listdir(self.state_dir):
+            os.rmdir(self.state_dir)
+
+
+def _worker_sum(strategy):
+    """
+    Build a function that sums a vector of per-worker values over all workers.
+
+    The collective runs inside a tf.function, which avoids the overhead of running it
+    eagerly.
+    """
+    import tensorflow as tf
+
+    if strategy.num_replicas_in_sync == 1:
+        return tf.identity
+    local_replicas = len(strategy.extended.worker_devices)
+
+    @tf.function
+    def sum_over_workers(values):
+        # Every replica contributes the worker's values once
+        per_replica = strategy.run(lambda: values / local_replicas)
+        return strategy.reduce("SUM", per_replica, axis=None)
+
+    return sum_over_workers
+
+
+def _synchronize_statistics(sum_over_workers, num_workers, variables):
+    """
+    Replace non-trainable variables by their mean over all workers.
+
+    Batch-normalization statistics are updated by every worker from its own batches, so
+    they drift apart; averaging them gives every worker the same model to validate and
+    the same state to checkpoint.
+    """
+    import tensorflow as tf
+
+    if num_workers == 1 or not variables:
+        return
+    values = tf.concat([tf.reshape(variable.value, [-1]) for variable in variables], 0)
+    means = sum_over_workers(values) / num_workers
+    offset = 0
+    for variable in variables:
+        size = int(np.prod(variable.shape))
+        variable.assign(tf.reshape(means[offset : offset + size], variable.shape))
+        offset += size
+
+
+def train_resumable(
+    model,
+    X_train,
+    y_train,
+    X_dev,
+    y_dev,
+    state_dir=DEFAULT_STATE_DIR,
+    batch_size=32,
+    epochs=20,
+    checkpoint_path=None,
+    callbacks=(),
+    learning_rate=0.001,
+    jit_compile=False,
+    augment=False,
+    save_every_steps=DEFAULT_SAVE_EVERY_STEPS,
+    patience=DEFAULT_PATIENCE,
+    seed=42,
+):
+    """
+    Train the model with full training-state checkpoints, resuming from the latest one.
+
+    The loop does what train_model does with Model.fit (Adam, sparse categorical
+    cross-entropy, the best weights saved to checkpoint_path, early stopping on the
+    validation loss that restores the best weights) in a loop of its own, since every
+    worker has to run the same steps and the checkpointed position has to be honoured.
+    The model has to be built inside the scope of its distribution strategy (see
+    create_strategy); with several workers, the batches are split between them, every
+    worker evaluates its share of the validation set and the results are summed.
+
+    The last partial batch of every epoch is dropped, so that every worker runs the same
+    number of steps whatever the number of workers. The checkpoints are removed when
+    training finishes.
+
+    Args:
+        model (TensorFlow Keras Model): Uncompiled model, built in the strategy scope.
+        X_train (numpy.ndarray or ShardedSplit): Training data.
+        y_train (numpy.ndarray): Training labels.
+        X_dev (numpy.ndarray or ShardedSplit): Validation data.
+        y_dev (numpy.ndarray): Validation labels.
+        state_dir (str): Directory of the training-state checkpoints.
+        batch_size (int): Global batch size, split evenly between the workers.
+        epochs (int): Number of epochs for training.
+        checkpoint_path (str): File the best weights are saved to, or None.
+        callbacks (list): Additional Keras callbacks; the epoch and batch hooks are called.
+        learning_rate (float): Learning rate of the Adam optimizer.
+        jit_compile (bool): Whether to compile the forward and backward pass with XLA.
+        augment (bool): Whether to randomly augment every training batch.
+        save_every_steps (int): Number of steps between checkpoints within an epoch.
+        patience (int): Epochs without improvement of the validation loss before stopping.
+        seed (int): Seed of the data order and the augmentation.
+
+    Returns:
+        Tuple of TensorFlow Keras Model and History:
+            (Trained model, Training history of the epochs run by this call)
+    """
+    import tensorflow as tf
+    from tensorflow.keras.callbacks import CallbackList, History
+    from tensorflow.keras.losses import SparseCategoricalCrossentropy
+    from tensorflow.keras.optimizers import Adam
+
+    from models.input_pipeline import make_dataset
+
+    strategy = model.distribute_strategy
+    worker_index, num_workers = worker_environment()
+    is_chief = worker_index == 0
+    num_replicas = strategy.num_replicas_in_sync
+    if batch_size % num_replicas:
+        raise ValueError(
+            f"The batch size {batch_size} cannot be split evenly between {num_replicas} "
+            "replicas"
+        )
+    steps_per_epoch = len(X_train) // batch_size
+    if steps_per_epoch == 0:
+        raise ValueError(
+            f"The training set ({len(X_train)} samples) is smaller than one batch "
+            f"({batch_size})"
+        )
+
+    with strategy.scope():
+        model.compile(
+            optimizer=Adam(learning_rate=learning_rate),
+            loss="sparse_categorical_crossentropy",
+            metrics=["accuracy"],
+        )
+        model.optimizer.build(model.trainable_variables)
+    state = TrainingState(model, state_dir, is_chief)
+    if state.restore():
+        print(
+            f"Resuming from {state_dir} at epoch {int(state.epoch.numpy()) + 1}, "
+            f"step {int(state.step.numpy())}"
+        )
+
+    statistics = [weight for weight in model.weights if not weight.trainable]
+    sum_over_workers = _worker_sum(strategy)
+    per_example_loss = SparseCategoricalCrossentropy(reduction="none")
+
+    @tf.function(jit_compile=jit_compile)
+    def compute_gradients(images, labels):
+        with tf.GradientTape() as tape:
+            probabilities = model(images, training=True)
+            # Summed over the replicas, this is the mean loss of the global batch
+            loss = tf.nn.compute_average_loss(
+                per_example_loss(labels, probabilities), global_batch_size=batch_size
+            )
+        gradients = tape.gradient(loss, model.trainable_variables)
+        correct = tf.reduce_sum(
+            tf.cast(
+                tf.equal(
+                    tf.argmax(probabilities, axis=-1, output_type=tf.int32), labels
+                ),
+                tf.float32,
+            )
+        )
+        return loss, correct, gradients
+
+    def replica_step(images, labels):
+        loss, correct, gradients = compute_gradients(images, labels)
+        # The optimizer sums the gradients of all replicas before applying them
+        model.optimizer.apply_gradients(zip(gradients, model.trainable_variables))
+        return loss, correct
+
+    @tf.function
+    def train_step(batch):
+        loss, correct = strategy.run(replica_step, args=batch)
+        return (
+            strategy.reduce("SUM", loss, axis=None),
+            strategy.reduce("SUM", correct, axis=None),
+        )
+
+    @tf.function
+    def evaluate_batch(images, labels):
+        probabilities = model(images, training=False)
+        predictions = tf.argmax(probabilities, axis=-1, output_type=tf.int32)
+        return (
+            tf.reduce_sum(per_example_loss(labels, probabilities)),
+            tf.reduce_sum(tf.cast(tf.equal(predictions, labels), tf.float32)),
+        )
+
+    def training_batches(epoch, first_step):
+        def dataset_fn(input_context):
+            local_replicas = num_replicas // input_context.num_input_pipelines
+            return make_dataset(
+                X_train,
+                y_train,
+                input_context.get_per_replica_batch_size(batch_size),
+                shuffle=True,
+                seed=seed,
+                augment=augment,
+                epoch=epoch,
+                skip_batches=first_step * local_replicas,
+                num_shards=input_context.num_input_pipelines,
+                shard_index=input_context.input_pipeline_id,
+                drop_remainder=True,
+            )
+
+        return strategy.distribute_datasets_from_function(dataset_fn)
+
+    def validate():
+        loss_sum = correct = 0.0
+        dataset = make_dataset(
+            X_dev, y_dev, batch_size, num_shards=num_workers, shard_index=worker_index
+        )
+        for images, labels in dataset:
+            batch_loss, batch_correct = evaluate_batch(images, labels)
+            loss_sum += float(batch_loss)
+            correct += float(batch_correct)
+        totals = tf.constant([loss_sum, correct], dtype=tf.float64)
+        loss_sum, correct = sum_over_workers(totals).numpy()
+        return loss_sum / len(X_dev), correct / len(X_dev)
+
+    history = History()
+    callbacks = CallbackList(
+        [history] + list(callbacks),
+        add_progbar=is_chief,
+        model=model,
+        verbose=1 if is_chief else 0,
+        epochs=epochs,
+        steps=steps_per_epoch,
+    )
+    model.stop_training = False
+    callbacks.on_train_begin()
+
+    first_epoch = int(state.epoch.numpy())
+    for epoch in range(first_epoch, epochs):
+        callbacks.on_epoch_begin(epoch)
+        first_step = int(state.step.numpy()) if epoch == first_epoch else 0
+        loss_sum = float(state.loss_sum.numpy()) if first_step else 0.0
+        correct = float(state.correct.numpy()) if first_step else 0.0
+        logs = {}
+        iterator = iter(training_batches(epoch, first_step))
+        start = time.perf_counter()
+        for step in range(first_step, steps_per_epoch):
+            callbacks.on_train_batch_begin(step)
+            batch_loss, batch_correct = train_step(next(iterator))
+            loss_sum += float(batch_loss)
+            correct += float(batch_correct)
+            logs = {
+                "loss": loss_sum / (step + 1),
+                "accuracy": correct / ((step + 1) * batch_size),
+            }
+            callbacks.on_train_batch_end(step, logs)
+            if (step + 1) % save_every_steps == 0 and step + 1 < steps_per_epoch:
+                state.step.assign(step + 1)
+                state.loss_sum.assign(loss_sum)
+                state.correct.assign(correct)
+                _synchronize_statistics(sum_over_workers, num_workers, statistics)
+                state.save()
+        train_seconds = time.perf_counter() - start
+
+        _synchronize_statistics(sum_over_workers, num_workers, statistics)
+        logs["val_loss"], logs["val_accuracy"] = validate()
+        logs["samples_per_second"] = (
+            (steps_per_epoch - first_step) * batch_size / train_seconds
+        )
+
+        # Save the best weights and stop early, like ModelCheckpoint and EarlyStopping
+        if logs["val_loss"] < state.best_val_loss.numpy():
+            if is_chief:
+                print(
+                    f"\nEpoch {epoch + 1}: val_loss improved from "
+                    f"{state.best_val_loss.numpy():.5f} to {logs['val_loss']:.5f}"
+                    + (
+                        f", saving model to {checkpoint_path}"
+                        if checkpoint_path
+                        else ""
+                    )
+                )
+                if checkpoint_path:
+                    model.save_weights(checkpoint_path)
+            state.best_val_loss.assign(logs["val_loss"])
+            state.best_epoch.assign(epoch)
+            state.wait.assign(0)
+            for best, weight in zip(state.best_weights, model.weights):
+                best.assign(weight.value)
+        else:
+            state.wait.assign_add(1)
+        callbacks.on_epoch_end(epoch, logs)
+
+        if state.wait.numpy() >= patience and epoch > 0:
+            best_epoch = int(state.best_epoch.numpy())
+            if is_chief:
+                print(
+                    f"Epoch {epoch + 1}: early stopping, restoring the weights of the "
+                    f"best epoch: {best_epoch + 1}."
+                )
+            for best, weight in zip(state.best_weights, model.weights):
+                weight.assign(best)
+            model.stop_training = True
+
+        state.epoch.assign(epoch + 1)
+        state.step.assign(0)
+        state.save()
+        if model.stop_training:
+            break
+
+    callbacks.on_train_end()
+    state.delete()
+    return model, history
+
+
+def _run_scaling_worker(args):
+    """Train for a few epochs as one worker and write the chief's throughput to a file."""
+    from models.performance import configure_threads
+
+    _, num_workers = worker_environment()
+    # Workers of one host share its cores
+    configure_threads(max(1, (os.cpu_count() or 1) // num_workers))
+    strategy = create_strategy()
+
+    from models.train_model import build_model, load_preprocessed_data
+
+    X_train, y_train, X_dev, y_dev, _, _, _, input_shape, num_classes = (
+        load_preprocessed_data(args.data)
+    )
+    with strategy.scope():
+        model = build_model(input_shape, num_classes, args.backbone)
+    state_dir = tempfile.mkdtemp(prefix="scaling_state_")
+    try:
+        _, history = train_resumable(
+            model,
+            X_train,
+            y_train,
+            X_dev,
+            y_dev,
+            state_dir=state_dir,
+            batch_size=args.batch_size * num_workers,
+            epochs=args.epochs,
+            patience=args.epochs,
+        )
+    finally:
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+    if worker_environment()[0] == 0:
+        # The first epoch includes tracing the training step
+        throughputs = history.history["samples_per_second"]
+        with open(args.worker_output, "w") as f:
+            json.dump({"samples_per_second": throughputs[-1]}, f)
+
+
+def measure_scaling(data_path, worker_counts, backbone, batch_size, epochs):
+    """
+    Measure the training throughput with 1, 2, ... local workers.
+
+    Every worker keeps the same batch size, so that a worker does the same work per step
+    whatever the number of workers (weak scaling); the scaling efficiency is the
+    throughput of N workers divided by N times the throughput of one worker.
+
+    Args:
+        data_path (str): Path to the sharded store or .npz file to train on.
+        worker_counts (list): Numbers of workers to measure; 1 is added if missing.
+        backbone (str): Backbone of the model trained.
+        batch_size (int): Batch size of every worker.
+        epochs (int): Epochs trained; the last one is timed.
+
+    Returns:
+        dict: For every number of workers, the samples/sec, speedup and efficiency.
+    """
+    results = {}
+    for num_workers in sorted(set(worker_counts) | {1}):
+        with tempfile.TemporaryDirectory(prefix="scaling_") as work_dir:
+            output = os.path.join(work_dir, "result.json")
+            command = [
+                sys.executable,
+                "-m",
+                "models.distributed",
+                "--data",
+                data_path,
+                "--backbone",
+                backbone,
+                "--batch-size",
+                str(batch_size),
+                "--epochs",
+                str(epochs),
+                "--worker-output",
+                output,
+            ]
+            if num_workers == 1:
+                code = subprocess.call(command)
+            else:
+                code = launch_local_workers(num_workers, command, work_dir)
+            if code != 0:
+                raise RuntimeError(f"Training with {num_workers} workers failed")
+            with open(output) as f:
+                samples_per_second = json.load(f)["samples_per_second"]
+
+        baseline = results[1]["samples_per_second"] if results else samples_per_second
+        results[num_workers] = {
+            "samples_per_second": samples_per_second,
+            "speedup": samples_per_second / baseline,
+            "scaling_efficiency": samples_per_second / (num_workers * baseline),
+        }
+    return results
+
+
+def main():
+    """
+    Report the training throughput and scaling efficiency of several local workers.
+    """
+    parser = argparse.ArgumentParser(
+        description="Measure multi-worker training scaling against one worker."
+    )
+    parser.add_argument("--data", default="data/processed_data/math_notation_dataset")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--backbone", default="small_cnn")
+    parser.add_argument(
+        "--batch-size", type=int, default=64, help="Batch size of every worker."
+    )
+    parser.add_argument("--epochs", type=int, default=2)
+    parser.add_argument("--report", default="scaling_report.json")
+    parser.add_argument("--worker-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    from utils.dataset_store import is_sharded_dataset
+
+    if not is_sharded_dataset(args.data) and not args.data.endswith(".npz"):
+        args.data += ".npz"  # Dataset preprocessed with the previous format
+    if args.worker_output:  # Started by measure_scaling as one of the workers
+        _run_scaling_worker(args)
+        return
+
+    results = measure_scaling(
+        args.data, args.workers, args.backbone, args.batch_size, args.epochs
+    )
+    print(f"{'workers':>8}{'samples/s':>12}{'speedup':>10}{'efficiency':>12}")
+    for num_workers, result in results.items():
+        print(
+            f"{num_workers:>8}{result['samples_per_second']:>12.0f}"
+            f"{result['speedup']:>10.2f}{result['scaling_efficiency']:>12.1%}"
+        )
+    report = {
+        "cpu_count": os.cpu_count(),
+        "backbone": args.backbone,
+        "batch_size_per_worker": args.batch_size,
+        "workers": results,
+    }
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Scaling report saved to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
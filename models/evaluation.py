@@ -0,0 +1,303 @@
+import argparse
+import json
+import time
+
+import numpy as np
+
+from utils import profiling
+from utils.dataset_store import ShardedSplit, is_sharded_dataset
+
+DEFAULT_TOP_K = (1, 5)
+NUM_TOP_CONFUSIONS = 20  # Most frequent (true, predicted) pairs listed in the report
+EPSILON = 1e-7  # Probabilities are clipped like Keras does before taking the log
+
+
+class StreamingMetrics:
+    """
+    Classification metrics accumulated one batch at a time.
+
+    Only the confusion matrix, the top-k hit counts and the summed loss are kept, so memory
+    use depends on the number of classes and not on the number of samples evaluated.
+    """
+
+    def __init__(self, num_classes, top_k=DEFAULT_TOP_K):
+        """
+        Args:
+            num_classes (int): Number of classes of the model output.
+            top_k (tuple): Values of k to count top-k hits for; larger values than the
+                number of classes are dropped.
+        """
+        self.num_classes = num_classes
+        self.top_k = tuple(k for k in top_k if k <= num_classes)
+        self.confusion = np.zeros((num_classes, num_classes), dtype=np.int64)
+        self.top_k_hits = np.zeros(len(self.top_k), dtype=np.int64)
+        self.loss_sum = 0.0
+        self.count = 0
+
+    def update(self, labels, probabilities):
+        """
+        Add one batch of predictions.
+
+        Args:
+            labels (np.ndarray): Integer labels of shape (N,).
+            probabilities (np.ndarray): Predicted probabilities of shape (N, num_classes).
+        """
+        labels = np.asarray(labels, dtype=np.int64).reshape(-1)
+        probabilities = np.asarray(probabilities, dtype=np.float32)
+        predictions = probabilities.argmax(axis=1)
+
+        self.confusion += np.bincount(
+            labels * self.num_classes + predictions, minlength=self.num_classes**2
+        ).reshape(self.num_classes, self.num_classes)
+
+        # Rank of the true class: the number of classes given a higher probability
+        true_probabilities = probabilities[np.arange(len(labels)), labels]
+        ranks = (probabilities > true_probabilities[:, np.newaxis]).sum(axis=1)
+        self.top_k_hits += (ranks[:, np.newaxis] < np.array(self.top_k)).sum(axis=0)
+
+        self.loss_sum -= float(
+            np.log(np.clip(true_probabilities, EPSILON, 1.0)).astype(np.float64).sum()
+        )
+        self.count += len(labels)
+
+    def result(self, class_names=None):
+        """
+        Compute the metrics of everything added so far.
+
+        Args:
+            class_names (list): Name of every class, used in the report.
+
+        Returns:
+            dict: Loss, accuracy, top-k accuracy, macro and support-weighted averages,
+                per-class precision/recall/F1/support, the most frequent confusions and
+                the confusion matrix (rows are true classes, columns predictions).
+        """
+        if class_names is None:
+            class_names = [str(index) for index in range(self.num_classes)]
+        confusion = self.confusion
+        true_positives = np.diag(confusion).astype(np.float64)
+        support = confusion.sum(axis=1)
+        predicted = confusion.sum(axis=0)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            precision = np.where(predicted > 0, true_positives / predicted, 0.0)
+            recall = np.where(support > 0, true_positives / support, 0.0)
+            f1 = np.where(
+                precision + recall > 0,
+                2 * precision * recall / (precision + recall),
+                0.0,
+            )
+
+        # Classes without test samples would only drag the averages down
+        present = support > 0
+        weights = support[present] / max(int(support.sum()), 1)
+
+        off_diagonal = confusion.copy()
+        np.fill_diagonal(off_diagonal, 0)
+        order = np.argsort(off_diagonal, axis=None)[::-1][:NUM_TOP_CONFUSIONS]
+        top_confusions = [
+            {
+                "true": class_names[true],
+                "predicted": class_names[predicted_class],
+                "count": int(off_diagonal[true, predicted_class]),
+            }
+            for true, predicted_class in zip(*np.unravel_index(order, confusion.shape))
+            if off_diagonal[true, predicted_class] > 0
+        ]
+
+        count = max(self.count, 1)
+        return {
+            "num_samples": self.count,
+            "loss": self.loss_sum / count,
+            "accuracy": float(true_positives.sum() / count),
+            "top_k_accuracy": {
+                str(k): float(hits / count)
+                for k, hits in zip(self.top_k, self.top_k_hits)
+            },
+            "macro": {
+                "precision": float(precision[present].mean()) if present.any() else 0.0,
+                "recall": float(recall[present].mean()) if present.any() else 0.0,
+                "f1": float(f1[present].mean()) if present.any() else 0.0,
+            },
+            "weighted": {
+                "precision": float((precision[present] * weights).sum()),
+                "recall": float((recall[present] * weights).sum()),
+                "f1": float((f1[present] * weights).sum()),
+            },
+            "per_class": {
+                name: {
+                    "precision": float(precision[index]),
+                    "recall": float(recall[index]),
+                    "f1": float(f1[index]),
+                    "support": int(support[index]),
+                }
+                for index, name in enumerate(class_names)
+            },
+            "top_confusions": top_confusions,
+            "confusion_matrix": confusion.tolist(),
+        }
+
+
+def iter_batches(X, y=None, batch_size=256):
+    """
+    Iterate over any evaluation data source in (images, labels) batches.
+
+    Args:
+        X: A ShardedSplit, an array of images (a memory-mapped array is read one batch at
+            a time), or an iterable of (images, labels) batches such as a tf.data.Dataset.
+        y (np.ndarray): Labels, when X is a ShardedSplit or an array.
+        batch_size (int): Number of samples per batch, when X is a ShardedSplit or an array.
+
+    Yields:
+        tuple: (images, labels) numpy arrays for each batch.
+    """
+    if isinstance(X, ShardedSplit):
+        yield from X.iter_batches(batch_size)
+    elif y is not None:
+        for start in range(0, len(X), batch_size):
+            yield (
+                np.asarray(X[start : start + batch_size], dtype=np.float32),
+                np.asarray(y[start : start + batch_size]),
+            )
+    else:
+        for images, labels in X:
+            yield np.asarray(images), np.asarray(labels)
+
+
+def evaluate_streaming(
+    predict_fn, batches, num_classes, class_names=None, top_k=DEFAULT_TOP_K
+):
+    """
+    Run batched predictions over a data source and accumulate metrics incrementally.
+
+    Args:
+        predict_fn (callable): Function mapping a batch of images to probabilities, e.g.
+            model.predict_on_batch or InferenceSession.predict.
+        batches (iterable): (images, labels) batches, e.g. from iter_batches.
+        num_classes (int): Number of classes of the model output.
+        class_names (list): Name of every class, used in the report.
+        top_k (tuple): Values of k to report top-k accuracy for.
+
+    Returns:
+        dict: The metrics of StreamingMetrics.result, with the evaluation throughput.
+    """
+    metrics = StreamingMetrics(num_classes, top_k)
+    predict_seconds = 0.0
+    start = time.perf_counter()
+    for images, labels in batches:
+        predict_start = time.perf_counter()
+        with profiling.span("evaluate.predict", batch_size=len(images)):
+            probabilities = np.asarray(predict_fn(images))
+        predict_seconds += time.perf_counter() - predict_start
+        metrics.update(labels, probabilities)
+    seconds = time.perf_counter() - start
+
+    report = metrics.result(class_names)
+    report["throughput"] = {
+        "seconds": seconds,
+        "predict_seconds": predict_seconds,
+        "images_per_second": metrics.count / seconds if seconds else 0.0,
+    }
+    return report
+
+
+def print_report(report, num_classes_shown=5):
+    """
+    Print the headline metrics, the weakest classes and the most frequent confusions.
+
+    Args:
+        report (dict): Output of evaluate_streaming.
+        num_classes_shown (int): Number of weakest classes and confusions to list.
+    """
+    print(f"Test loss: {report['loss']:.4f}")
+    print(f"Test accuracy: {report['accuracy']:.4f}")
+    for k, accuracy in report["top_k_accuracy"].items():
+        if k != "1":
+            print(f"Test top-{k} accuracy: {accuracy:.4f}")
+    print(
+        f"Macro precision {report['macro']['precision']:.4f}, "
+        f"recall {report['macro']['recall']:.4f}, F1 {report['macro']['f1']:.4f}"
+    )
+    throughput = report["throughput"]
+    print(
+        f"Evaluated {report['num_samples']} samples in {throughput['seconds']:.2f}s "
+        f"({throughput['images_per_second']:.0f} images/s)"
+    )
+
+    weakest = sorted(
+        (item for item in report["per_class"].items() if item[1]["support"]),
+        key=lambda item: item[1]["f1"],
+    )[:num_classes_shown]
+    if weakest:
+        print("Weakest classes (F1, precision, recall, support):")
+        for name, stats in weakest:
+            print(
+                f"  {name:<12}{stats['f1']:>7.3f}{stats['precision']:>7.3f}"
+                f"{stats['recall']:>7.3f}{stats['support']:>7}"
+            )
+    confusions = report["top_confusions"][:num_classes_shown]
+    if confusions:
+        print("Most frequent confusions (true -> predicted):")
+        for confusion in confusions:
+            print(
+                f"  {confusion['true']} -> {confusion['predicted']}: "
+                f"{confusion['count']}"
+            )
+
+
+def save_report(report, report_path):
+    """Write an evaluation report as JSON."""
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Evaluation report saved to {report_path}")
+
+
+def main():
+    """
+    Evaluate a saved model (Keras or TFLite) on one split of the processed dataset.
+    """
+    from models.inference import BACKENDS, InferenceSession
+    from models.train_model import load_preprocessed_data
+
+    parser = argparse.ArgumentParser(
+        description="Evaluate a model with per-class metrics and a confusion matrix."
+    )
+    parser.add_argument("--model", default="models/saved_models/trained_model.h5")
+    parser.add_argument("--data", default="data/processed_data/math_notation_dataset")
+    parser.add_argument("--split", choices=["train", "dev", "test"], default="test")
+    parser.add_argument("--backend", choices=BACKENDS, default=None)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--top-k", type=int, nargs="+", default=list(DEFAULT_TOP_K))
+    parser.add_argument("--report", default="evaluation_report.json")
+    args = parser.parse_args()
+
+    data_path = args.data
+    if not is_sharded_dataset(data_path) and not data_path.endswith(".npz"):
+        data_path += ".npz"  # Dataset preprocessed with the previous format
+    X_train, y_train, X_dev, y_dev, X_test, y_test, class_names, _, num_classes = (
+        load_preprocessed_data(data_path)
+    )
+    X, y = {
+        "train": (X_train, y_train),
+        "dev": (X_dev, y_dev),
+        "test": (X_test, y_test),
+    }[args.split]
+
+    session = InferenceSession(args.model, backend=args.backend)
+    session.wait_until_ready()
+    report = evaluate_streaming(
+        session.predict,
+        iter_batches(X, y, args.batch_size),
+        num_classes,
+        list(class_names),
+        args.top_k,
+    )
+    report["model"] = args.model
+    report["data"] = data_path
+    report["split"] = args.split
+    print_report(report)
+    save_report(report, args.report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from models.inference import DEFAULT_MODEL_PATH, InferenceSession
+from models.train_model import load_preprocessed_data
+from utils.dataset_store import ShardedSplit, is_sharded_dataset
+
+QUANTIZATIONS = ("dynamic", "int8")
+
+
+def get_batch(X, indices):
+    """
+    Read normalized images by index from an in-memory array or a ShardedSplit.
+
+    Args:
+    - X (numpy.ndarray or ShardedSplit): Preprocessed images.
+    - indices (numpy.ndarray): Indices of the images to read.
+
+    Returns:
+    - numpy.ndarray: float32 batch of shape (len(indices), 45, 45, 3).
+    """
+    if isinstance(X, ShardedSplit):
+        return X.get_batch(indices)[0]
+    return np.asarray(X[indices], dtype=np.float32)
+
+
+def representative_dataset(X, num_samples=300, seed=42):
+    """
+    Build the calibration data generator for full-integer quantization.
+
+    Args:
+    - X (numpy.ndarray or ShardedSplit): Preprocessed training images.
+    - num_samples (int): Number of images sampled for calibration.
+    - seed (int): Seed of the sample.
+
+    Returns:
+    - callable: Generator function yielding single-image batches, as the TFLite
+      converter expects.
+    """
+    rng = np.random.default_rng(seed)
+    indices = np.sort(rng.choice(len(X), size=min(num_samples, len(X)), replace=False))
+    images = get_batch(X, indices)
+
+    def generator():
+        for image in images:
+            yield [image[np.newaxis]]
+
+    return generator
+
+
+def export_tflite(model, output_path, quantization, representative_data=None):
+    """
+    Convert a Keras model to a quantized TFLite model.
+
+    Args:
+    - model (TensorFlow Keras Model): Trained model.
+    - output_path (str): Path of the .tflite file to write.
+    - quantization (str): "dynamic" for int8 weights with float activations, or "int8"
+      for full-integer quantization (int8 weights, activations, input and output).
+    - representative_data (callable): Calibration generator, required for "int8".
+
+    Returns:
+    - int: Size of the written file in bytes.
+    """
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == "int8":
+        if representative_data is None:
+            raise ValueError("Full-integer quantization needs representative data")
+        converter.representative_dataset = representative_data
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+    elif quantization != "dynamic":
+        raise ValueError(f"Unknown quantization {quantization!r}")
+
+    tflite_model = converter.convert()
+    with open(output_path, "wb") as f:
+        f.write(tflite_model)
+    print(f"{quantization} TFLite model saved to {output_path}")
+    return len(tflite_model)
+
+
+def benchmark_backend(session, X_test, y_test, batch_size=256, latency_runs=50):
+    """
+    Measure the test accuracy and latency of a model through an InferenceSession.
+
+    Args:
+    - session (InferenceSession): Session of the model to measure.
+    - X_test (numpy.ndarray or ShardedSplit): Test images.
+    - y_test (numpy.ndarray): Test labels.
+    - batch_size (int): Batch size for accuracy and throughput.
+    - latency_runs (int): Number of single-image predictions timed.
+
+    Returns:
+    - dict: Accuracy, predicted classes, single-image latency (ms) and batch
+      throughput (images/s).
+    """
+    session.start()
+    session.wait_until_ready()
+
+    predictions = np.empty(len(X_test), dtype=np.int64)
+    predict_seconds = 0.0
+    for start in range(0, len(X_test), batch_size):
+        indices = np.arange(start, min(start + batch_size, len(X_test)))
+        batch = get_batch(X_test, indices)
+        begin = time.perf_counter()
+        probabilities = session.predict(batch)
+        predict_seconds += time.perf_counter() - begin
+        predictions[indices] = np.argmax(probabilities, axis=1)
+
+    single = get_batch(X_test, np.arange(1))
+    timings = []
+    for _ in range(latency_runs):
+        begin = time.perf_counter()
+        session.predict(single)
+        timings.append(time.perf_counter() - begin)
+
+    return {
+        "accuracy": float(np.mean(predictions == np.asarray(y_test))),
+        "predictions": predictions,
+        "latency_ms": float(np.median(timings) * 1000),
+        "images_per_second": float(len(X_test) / max(predict_seconds, 1e-9)),
+    }
+
+
+def main():
+    """
+    Export quantized TFLite models and report accuracy, latency and size per backend.
+    """
+    parser = argparse.ArgumentParser(
+        description="Export quantized TFLite models of the trained model."
+    )
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--data", default="data/processed_data/math_notation_dataset")
+    parser.add_argument("--output-dir", default="models/saved_models")
+    parser.add_argument("--calibration-samples", type=int, default=300)
+    parser.add_argument(
+        "--quantization", nargs="+", choices=QUANTIZATIONS, default=list(QUANTIZATIONS)
+    )
+    parser.add_argument(
+        "--report", default=None, help="JSON report path (default: in --output-dir)"
+    )
+    args = parser.parse_args()
+
+    data_path = args.data
+    if not is_sharded_dataset(data_path) and not data_path.endswith(".npz"):
+        data_path += ".npz"  # Dataset preprocessed with the previous format
+    X_train, _, _, _, X_test, y_test, _, _, _ = load_preprocessed_data(data_path)
+
+    from tensorflow.keras.models import load_model
+
+    model = load_model(args.model, compile=False)
+    base_name = os.path.splitext(os.path.basename(args.model))[0]
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    paths = {"keras": args.model}
+    for quantization in args.quantization:
+        path = os.path.join(args.output_dir, f"{base_name}_{quantization}.tflite")
+        representative_data = None
+        if quantization == "int8":
+            representative_data = representative_dataset(
+                X_train, args.calibration_samples
+            )
+        export_tflite(model, path, quantization, representative_data)
+        paths[quantization] = path
+
+    results = {}
+    for name, path in paths.items():
+        result = benchmark_backend(InferenceSession(path), X_test, y_test)
+        result["size_mb"] = os.path.getsize(path) / 1e6
+        result["path"] = path
+        results[name] = result
+
+    reference = results["keras"]
+    print(
+        f"{'backend':<10}{'size (MB)':>10}{'accuracy':>10}{'delta':>9}"
+        f"{'agreement':>11}{'latency (ms)':>14}{'images/s':>10}"
+    )
+    for name, result in results.items():
+        result["accuracy_delta"] = result["accuracy"] - reference["accuracy"]
+        result["agreement"] = float(
+            np.mean(result.pop("predictions") == reference["predictions"])
+            if name != "keras"
+            else 1.0
+        )
+        print(
+            f"{name:<10}{result['size_mb']:>10.2f}{result['accuracy']:>10.4f}"
+            f"{result['accuracy_delta']:>+9.4f}{result['agreement']:>11.4f}"
+            f"{result['latency_ms']:>14.2f}{result['images_per_second']:>10.0f}"
+        )
+    reference.pop("predictions")
+
+    report_path = args.report or os.path.join(args.output_dir, "export_report.json")
+    with open(report_path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Report saved to {report_path}")
+
+
+if __name__ == "__main__":
+    main()
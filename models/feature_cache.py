@@ -0,0 +1,202 @@
+import hashlib
+import os
+import shutil
+
+import numpy as np
+from tensorflow.keras.callbacks import EarlyStopping
+from tensorflow.keras.layers import Flatten, Input
+from tensorflow.keras.models import Model
+from tensorflow.keras.optimizers import Adam
+
+from utils.dataset_store import ShardedSplit
+
+DEFAULT_CACHE_ROOT = "models/cache/features"
+
+
+def split_frozen_base(model):
+    """
+    Split a model built by build_model into its frozen feature extractor and its head.
+
+    The head reuses the model's own Dense/Dropout layers, so training the head trains the
+    full model in place; nothing has to be copied back before saving.
+
+    Args:
+    - model (TensorFlow Keras Model): Model whose convolutional base ends in a Flatten layer.
+
+    Returns:
+    - Tuple of TensorFlow Keras Models: (feature extractor, head)
+    """
+    flatten_index = next(
+        i for i, layer in enumerate(model.layers) if isinstance(layer, Flatten)
+    )
+    flatten = model.layers[flatten_index]
+    extractor = Model(inputs=model.input, outputs=flatten.output)
+
+    features = Input(shape=flatten.output.shape[1:])
+    x = features
+    for layer in model.layers[flatten_index + 1 :]:
+        x = layer(x)
+    head = Model(inputs=features, outputs=x)
+
+    return extractor, head
+
+
+def backbone_hash(extractor):
+    """
+    Hash the architecture and weights of a feature extractor.
+
+    Args:
+    - extractor (TensorFlow Keras Model): The frozen feature extractor.
+
+    Returns:
+    - str: Hex digest identifying the backbone.
+    """
+    digest = hashlib.sha256()
+    digest.update(str(extractor.input.shape).encode("utf-8"))
+    for layer in extractor.layers:
+        digest.update(f"{layer.__class__.__name__}:{layer.name}".encode("utf-8"))
+    for weights in extractor.get_weights():
+        digest.update(np.ascontiguousarray(weights).tobytes())
+    return digest.hexdigest()
+
+
+class FeatureCache:
+    """
+    On-disk cache of the flattened outputs of a frozen backbone, one file per split.
+
+    Entries are stored under a directory keyed by a hash of the dataset and of the backbone
+    weights, so any change to either selects a new directory; stale entries are removed.
+    """
+
+    def __init__(
+        self, extractor, dataset_hash, cache_root=DEFAULT_CACHE_ROOT, batch_size=256
+    ):
+        self.extractor = extractor
+        self.batch_size = batch_size
+        self.cache_root = cache_root
+
+        key = hashlib.sha256(
+            f"{dataset_hash}:{backbone_hash(extractor)}".encode("utf-8")
+        ).hexdigest()
+        self.key = key[:16]
+        self.directory = os.path.join(cache_root, self.key)
+
+    def prune(self):
+        """Remove cache entries that belong to other datasets or backbones."""
+        if not os.path.isdir(self.cache_root):
+            return
+        for name in os.listdir(self.cache_root):
+            if name != self.key:
+                shutil.rmtree(os.path.join(self.cache_root, name), ignore_errors=True)
+
+    def features(self, split, X):
+        """
+        Get the cached features of a split, running the backbone once if they are missing.
+
+        Args:
+        - split (str): Name of the split (train/dev/test).
+        - X (numpy.ndarray or ShardedSplit): Images of the split.
+
+        Returns:
+        - numpy.ndarray: Memory-mapped float32 features of shape (N, feature_size).
+        """
+        path = os.path.join(self.directory, f"{split}_features.npy")
+        if not os.path.exists(path):
+            self.prune()
+            os.makedirs(self.directory, exist_ok=True)
+            self._extract(X, path)
+        return np.load(path, mmap_mode="r")
+
+    def _extract(self, X, path):
+        """Run the backbone over a split in batches and write the features to path."""
+        feature_shape = tuple(self.extractor.output.shape[1:])
+        partial_path = path + ".partial"
+        features = np.lib.format.open_memmap(
+            partial_path, mode="w+", dtype=np.float32, shape=(len(X),) + feature_shape
+        )
+
+        print(f"Extracting backbone features for {len(X)} samples into {path}")
+        for start in range(0, len(X), self.batch_size):
+            stop = min(start + self.batch_size, len(X))
+            if isinstance(X, ShardedSplit):
+                batch, _ = X.get_batch(np.arange(start, stop))
+            else:
+                batch = np.asarray(X[start:stop], dtype=np.float32)
+            features[start:stop] = self.extractor.predict_on_batch(batch)
+
+        features.flush()
+        del features
+        os.replace(partial_path, path)  # Only complete files are ever picked up
+
+
+def train_head_on_cached_features(
+    model,
+    X_train,
+    y_train,
+    X_dev,
+    y_dev,
+    dataset_hash,
+    batch_size=32,
+    epochs=20,
+    weights_path="models/saved_models/model_weights.weights.h5",
+    cache_root=DEFAULT_CACHE_ROOT,
+):
+    """
+    Train only the classification head of a model on cached features of its frozen base.
+
+    The backbone is run once per split (or not at all when the cache is warm); every epoch
+    then only runs the Flatten/Dense/Dropout head on the cached features.
+
+    Args:
+    - model (TensorFlow Keras Model): Model built by build_model with a frozen base.
+    - X_train (numpy.ndarray or ShardedSplit): Training data.
+    - y_train (numpy.ndarray): Training labels.
+    - X_dev (numpy.ndarray or ShardedSplit): Validation data.
+    - y_dev (numpy.ndarray): Validation labels.
+    - dataset_hash (str): Hash identifying the dataset (e.g. from its manifest).
+    - batch_size (int): Batch size for training.
+    - epochs (int): Number of epochs for training.
+    - weights_path (str): File path to save the best weights of the full model to.
+    - cache_root (str): Directory holding the feature cache.
+
+    Returns:
+    - Tuple of TensorFlow Keras Model and History:
+      (Trained full model, Training history of the head)
+    """
+    extractor, head = split_frozen_base(model)
+    cache = FeatureCache(extractor, dataset_hash, cache_root)
+    train_features = cache.features("train", X_train)
+    dev_features = cache.features("dev", X_dev)
+
+    head.compile(
+        optimizer=Adam(learning_rate=0.001),
+        loss="sparse_categorical_crossentropy",
+        metrics=["accuracy"],
+    )
+    early_stopping_callback = EarlyStopping(
+        patience=5,
+        monitor="val_loss",
+        mode="min",
+        verbose=1,
+        restore_best_weights=True,
+    )
+    history = head.fit(
+        train_features,
+        np.asarray(y_train),
+        epochs=epochs,
+        batch_size=batch_size,
+        validation_data=(dev_features, np.asarray(y_dev)),
+        callbacks=[early_stopping_callback],
+    )
+
+    # The head shares its layers with the full model, which now holds the best weights
+    model.compile(
+        optimizer=Adam(learning_rate=0.001),
+        loss="sparse_categorical_crossentropy",
+        metrics=["accuracy"],
+    )
+    os.makedirs(os.path.dirname(weights_path), exist_ok=True)
+    model.save_weights(weights_path)
+    print(f"Model weights saved to {weights_path}")
+
+    return model, history
@@ -0,0 +1,502 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from utils import profiling
+
+DEFAULT_MODEL_PATH = "models/saved_models/trained_model.h5"
+DEFAULT_INPUT_SHAPE = (45, 45, 3)
+MIN_CONFIDENCE = 60  # Percent; less confident predictions are reported as unreliable
+BACKENDS = ("keras", "tflite")
+DEFAULT_CACHE_SIZE = 1024  # Predictions kept by the app, classify.py and server.py
+
+
+def backend_for(model_path):
+    """Return the inference backend for a model file, from its extension."""
+    return "tflite" if model_path.lower().endswith(".tflite") else "keras"
+
+
+def _tflite_interpreter_class():
+    """Return the TFLite interpreter class, preferring the standalone LiteRT runtime."""
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+
+        Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+class TFLiteModel:
+    """
+    Run a TFLite model on float32 batches, like a Keras model's predict.
+
+    Inputs of a fully quantized model are quantized with the input tensor's scale and zero
+    point, and its outputs are dequantized, so callers always exchange float32 arrays.
+    The interpreter is resized only when the batch size changes.
+    """
+
+    def __init__(self, model_path, interpreter_class=None, num_threads=None):
+        """
+        Args:
+            model_path (str): Path to the .tflite file.
+            interpreter_class (type): TFLite interpreter class to use.
+            num_threads (int): Number of interpreter threads. Defaults to the number of CPUs.
+        """
+        interpreter_class = interpreter_class or _tflite_interpreter_class()
+        self.interpreter = interpreter_class(
+            model_path=model_path, num_threads=num_threads or os.cpu_count()
+        )
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.batch_size = None
+        self.lock = threading.Lock()  # The interpreter is not thread-safe
+
+    def __call__(self, batch):
+        """
+        Args:
+            batch (np.ndarray): float32 array of shape (N, *input_shape).
+
+        Returns:
+            np.ndarray: float32 class probabilities of shape (N, num_classes).
+        """
+        batch = np.asarray(batch, dtype=np.float32)
+        with self.lock:
+            if len(batch) != self.batch_size:
+                self.interpreter.resize_tensor_input(self.input["index"], batch.shape)
+                self.interpreter.allocate_tensors()
+                self.batch_size = len(batch)
+
+            scale, zero_point = self.input["quantization"]
+            if self.input["dtype"] != np.float32 and scale:
+                limits = np.iinfo(self.input["dtype"])
+                batch = np.clip(
+                    np.round(batch / scale + zero_point), limits.min, limits.max
+                ).astype(self.input["dtype"])
+            self.interpreter.set_tensor(self.input["index"], batch)
+            self.interpreter.invoke()
+            output = self.interpreter.get_tensor(self.output["index"])
+
+        scale, zero_point = self.output["quantization"]
+        if self.output["dtype"] != np.float32 and scale:
+            output = (output.astype(np.float32) - zero_point) * scale
+        return output
+
+
+def interpret_prediction(probabilities, class_names):
+    """
+    Interpret the class probabilities of one image the way the GUI reports a prediction.
+
+    Args:
+        probabilities (np.ndarray): Class probabilities of shape (num_classes,).
+        class_names (list): Class names, indexed by model output.
+
+    Returns:
+        dict: "class_index", "class_name" (None if the index has no class name),
+            "confidence" (percent) and "reliable" (confidence of at least MIN_CONFIDENCE).
+    """
+    class_index = int(np.argmax(probabilities))
+    confidence = float(probabilities[class_index]) * 100
+    return {
+        "class_index": class_index,
+        "class_name": (
+            str(class_names[class_index]) if class_index < len(class_names) else None
+        ),
+        "confidence": confidence,
+        "reliable": confidence >= MIN_CONFIDENCE,
+    }
+
+
+class PredictionCache:
+    """
+    Thread-safe LRU cache of model outputs, keyed by a hash of the normalized model input.
+
+    A canvas that has not changed, or has been undone back to an earlier state, rasterizes
+    to the same input, so its prediction is returned without running the model. Keys are
+    Python's 64-bit SipHash of the input bytes. clear() starts a new generation, and outputs
+    computed by a model that has been replaced meanwhile are not stored.
+    """
+
+    def __init__(self, max_entries=DEFAULT_CACHE_SIZE):
+        """
+        Args:
+            max_entries (int): Number of outputs kept; the least recently used are evicted.
+        """
+        self.max_entries = max_entries
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(image):
+        """Return the cache key of one normalized model input."""
+        return hash(np.ascontiguousarray(image).tobytes())
+
+    def lookup(self, keys):
+        """
+        Look up the outputs of several inputs, counting hits and misses.
+
+        Args:
+            keys (list): Cache keys of the inputs.
+
+        Returns:
+            list: The cached output of every key, or None where there is none.
+        """
+        results = []
+        with self._lock:
+            for key in keys:
+                value = self._entries.get(key)
+                if value is None:
+                    self.misses += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                results.append(value)
+        return results
+
+    def store(self, keys, values, generation):
+        """
+        Store the outputs of several inputs.
+
+        Args:
+            keys (list): Cache keys of the inputs.
+            values (np.ndarray): Output of every input.
+            generation (int): Generation read before the outputs were computed; outputs of
+                an older generation are dropped.
+        """
+        with self._lock:
+            if generation != self.generation:
+                return
+            for key, value in zip(keys, values):
+                value = np.array(value)  # Callers may modify the arrays they are given
+                value.setflags(write=False)
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop all entries, e.g. when the model changes."""
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+
+    def stats(self):
+        """Return the entry count and the hit, miss and eviction counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else None,
+            }
+
+
+class InferenceSession:
+    """
+    Keep a trained model resident in memory and serve predictions from it.
+
+    The model is loaded once in a background thread, warmed up with a dummy batch so the
+    compiled prediction graph is traced before the first real request, and reloaded
+    automatically when the model file on disk changes. TensorFlow itself is imported by
+    the loader thread, so creating a session never blocks on the TensorFlow import.
+    With a cache_size, predictions are cached per input image (see PredictionCache), and
+    the cache is cleared whenever a new model is swapped in. The cache is off by default,
+    so that latency measurements of repeated inputs time the model and not a lookup.
+    Keras models run as a compiled tf.function; exported TFLite models (see
+    models/export_model.py) run in the TFLite interpreter.
+    """
+
+    def __init__(
+        self,
+        model_path=DEFAULT_MODEL_PATH,
+        input_shape=DEFAULT_INPUT_SHAPE,
+        warmup_runs=3,
+        backend=None,
+        cache_size=0,
+    ):
+        """
+        Args:
+            model_path (str): Path to the trained Keras (.h5) or TFLite (.tflite) model file.
+            input_shape (tuple): Shape of a single model input (excluding batch dimension).
+            warmup_runs (int): Number of dummy inferences used to measure steady-state latency
+                after the first (tracing) call.
+            backend (str): "keras" or "tflite"; by default chosen from the file extension.
+            cache_size (int): Number of predictions cached, e.g. DEFAULT_CACHE_SIZE; 0
+                disables the cache.
+        """
+        self.model_path = model_path
+        self.backend = backend or backend_for(model_path)
+        if self.backend not in BACKENDS:
+            raise ValueError(
+                f"Unknown backend {self.backend!r}, expected one of {BACKENDS}"
+            )
+        self.input_shape = tuple(input_shape)
+        self.warmup_runs = warmup_runs
+        self.cache = PredictionCache(cache_size)
+
+        self.model = None
+        self.load_error = None
+        self.stats = {
+            "import_seconds": None,
+            "load_seconds": None,
+            "first_prediction_seconds": None,
+            "steady_prediction_seconds": None,
+            "last_prediction_seconds": None,
+            "predictions": 0,
+            "reloads": 0,
+        }
+
+        self._predict_fn = None
+        self._signature = None
+        self._failed_signature = None  # Of the file that last failed to load
+        self._ready = threading.Event()
+        self._load_lock = threading.Lock()
+        self._loader = None
+
+    def start(self):
+        """
+        Start loading the model in a background thread.
+
+        This is a no-op if a load is already running or the loaded model is up to date.
+        """
+        with self._load_lock:
+            if self._loader is not None and self._loader.is_alive():
+                return
+            if self._ready.is_set() and self._file_signature() == self._signature:
+                return
+            self._loader = threading.Thread(
+                target=self._load, name="InferenceSessionLoader", daemon=True
+            )
+            self._loader.start()
+
+    def is_ready(self):
+        """
+        Return True once a model has been loaded and warmed up.
+
+        While the session is not ready because loading failed, a new load is started in
+        the background once the model file appears or changes.
+        """
+        if not self._ready.is_set():
+            self._reload_if_changed()
+        return self._ready.is_set()
+
+    def wait_until_ready(self, timeout=None):
+        """
+        Block until the model is loaded.
+
+        Args:
+            timeout (float): Maximum number of seconds to wait, or None to wait forever.
+
+        Returns:
+            bool: True if the model is ready.
+
+        Raises:
+            Exception: The error raised while loading the model, if loading failed.
+        """
+        if self._ready.is_set():
+            return True  # A reload in progress keeps serving the current model
+        if self._loader is None:
+            self.start()
+        self._loader.join(timeout)
+        if not self._ready.is_set() and self.load_error is not None:
+            raise self.load_error
+        return self._ready.is_set()
+
+    def predict(self, batch, valid=None):
+        """
+        Run the model on a batch of preprocessed images.
+
+        Images predicted before are answered from the cache. The others are run through
+        the model as one batch, zero-padded back to the size of the input batch, so the
+        model sees the same batch sizes as without the cache (a fixed batch size is never
+        resized or retraced).
+
+        Args:
+            batch (np.ndarray): Array of shape (N, *input_shape) with values in [0, 1].
+            valid (np.ndarray): Boolean mask of the real images of a padded batch. Other
+                rows are neither looked up nor cached, and with the cache their
+                probabilities are zero. Defaults to every row.
+
+        Returns:
+            np.ndarray: Class probabilities of shape (N, num_classes).
+        """
+        self._reload_if_changed()
+        self.wait_until_ready()
+        batch = np.asarray(batch, dtype=np.float32)
+        if self.cache.max_entries <= 0:
+            return self._forward(batch)
+
+        # Read before the model runs, so outputs of a replaced model are not cached
+        generation = self.cache.generation
+        start = time.perf_counter()
+        rows = np.arange(len(batch)) if valid is None else np.flatnonzero(valid)
+        keys = [self.cache.key(batch[row]) for row in rows]
+        results = self.cache.lookup(keys)
+        missing = [i for i, result in enumerate(results) if result is None]
+        profiling.record(
+            "predict.cache",
+            start,
+            time.perf_counter() - start,
+            hits=len(rows) - len(missing),
+            misses=len(missing),
+        )
+        if len(missing) == len(batch):
+            probabilities = self._forward(batch)
+            self.cache.store(keys, probabilities, generation)
+            return probabilities
+
+        if missing:
+            padded = np.zeros_like(batch)
+            padded[: len(missing)] = batch[rows[missing]]
+            computed = self._forward(padded)[: len(missing)]
+            self.cache.store([keys[i] for i in missing], computed, generation)
+            for i, row in zip(missing, computed):
+                results[i] = row
+        if not len(rows):
+            return self._forward(batch)  # Nothing to look up
+        output = np.zeros((len(batch),) + results[0].shape, dtype=results[0].dtype)
+        output[rows] = np.stack(results)
+        return output
+
+    def _forward(self, batch):
+        """Run the model on a float32 batch and record the latency."""
+        start = time.perf_counter()
+        probabilities = self._predict_fn(batch)
+        seconds = time.perf_counter() - start
+        self._record_prediction(seconds)
+        profiling.record("predict.forward", start, seconds, batch_size=len(batch))
+
+        return probabilities
+
+    def _file_signature(self):
+        """Return (mtime, size) of the model file, or None if it does not exist."""
+        try:
+            st = os.stat(self.model_path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _reload_if_changed(self):
+        """
+        Reload the model in the background if the file on disk has changed, or retry a
+        failed load once there is a different file than the one that failed.
+        """
+        signature = self._file_signature()
+        if signature is None or signature == self._failed_signature:
+            return
+        if self._ready.is_set():
+            if signature != self._signature:
+                self.start()
+        elif self.load_error is not None:
+            self.start()
+
+    def _load(self):
+        """Load, compile and warm up the model; swap it in once it is ready."""
+        signature = self._file_signature()
+        try:
+            start = time.perf_counter()
+            if self.backend == "tflite":
+                interpreter_class = _tflite_interpreter_class()
+            else:
+                import tensorflow as tf
+                from tensorflow.keras.models import load_model
+
+            import_seconds = time.perf_counter() - start
+            profiling.record("model.import", start, import_seconds)
+
+            start = time.perf_counter()
+            if self.backend == "tflite":
+                model = TFLiteModel(self.model_path, interpreter_class)
+                predict_fn = model
+            else:
+                model = load_model(self.model_path, compile=False)
+                graph_fn = tf.function(
+                    lambda x: model(x, training=False),
+                    input_signature=[
+                        tf.TensorSpec(
+                            shape=(None,) + self.input_shape, dtype=tf.float32
+                        )
+                    ],
+                )
+                predict_fn = lambda x: graph_fn(x).numpy()
+            load_seconds = time.perf_counter() - start
+            profiling.record("model.load", start, load_seconds, backend=self.backend)
+
+            # The first call traces and optimizes the graph (or allocates the
+            # interpreter's tensors); later calls reuse it
+            dummy = np.zeros((1,) + self.input_shape, dtype=np.float32)
+            start = time.perf_counter()
+            predict_fn(dummy)
+            first_seconds = time.perf_counter() - start
+            profiling.record("model.first_prediction", start, first_seconds)
+
+            timings = []
+            for _ in range(self.warmup_runs):
+                start = time.perf_counter()
+                predict_fn(dummy)
+                timings.append(time.perf_counter() - start)
+        except Exception as error:  # Keep serving the previous model, if any
+            self.load_error = error
+            self._failed_signature = signature
+            print(f"Failed to load model from {self.model_path}: {error}")
+            return
+
+        if self._ready.is_set():
+            self.stats["reloads"] += 1
+        self.model = model
+        self._predict_fn = predict_fn
+        self.cache.clear()  # After the swap, so no prediction of the old model is stored
+        self._signature = signature
+        self.load_error = None
+        self.stats["import_seconds"] = import_seconds
+        self.stats["load_seconds"] = load_seconds
+        self.stats["first_prediction_seconds"] = first_seconds
+        if timings:
+            self.stats["steady_prediction_seconds"] = float(np.median(timings))
+        self._ready.set()
+
+        print(
+            f"Model loaded from {self.model_path} in {load_seconds:.3f}s "
+            f"(first prediction {first_seconds * 1000:.1f} ms, "
+            f"steady state {np.median(timings) * 1000 if timings else float('nan'):.1f} ms)"
+        )
+
+    def _record_prediction(self, seconds):
+        """Update the latency statistics with one prediction time."""
+        self.stats["predictions"] += 1
+        self.stats["last_prediction_seconds"] = seconds
+        steady = self.stats["steady_prediction_seconds"]
+        # Exponential moving average keeps the steady-state figure current
+        self.stats["steady_prediction_seconds"] = (
+            seconds if steady is None else 0.9 * steady + 0.1 * seconds
+        )
+
+
+# Example usage
+if __name__ == "__main__":
+    session = InferenceSession(cache_size=DEFAULT_CACHE_SIZE)
+    session.start()
+    session.wait_until_ready()
+    probabilities = session.predict(np.zeros((1,) + DEFAULT_INPUT_SHAPE))
+    print(f"Predicted class index: {np.argmax(probabilities)}")
+
+    # The same input again is answered from the cache
+    start = time.perf_counter()
+    session.predict(np.zeros((1,) + DEFAULT_INPUT_SHAPE))
+    print(f"Repeated prediction: {(time.perf_counter() - start) * 1e6:.0f} us")
+    print(f"Cache: {session.cache.stats()}")
+    print(f"Latency statistics: {session.stats}")
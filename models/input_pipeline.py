@@ -0,0 +1,344 @@
+import math
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.callbacks import Callback
+
+from models.augmentation import augment_batch, augmentation_seeds
+from utils import profiling
+from utils.dataset_store import ShardedSplit
+
+AUTOTUNE = tf.data.AUTOTUNE
+DEFAULT_BLOCK_SIZE = 1024  # Samples read from disk per parallel read
+
+
+def _block_reader(X, y, block_size):
+    """
+    Create a function that reads one contiguous block of samples from a data source.
+
+    Args:
+        X (numpy.ndarray or ShardedSplit): Images; raw uint8 for a ShardedSplit, otherwise
+            already normalized arrays (e.g. from a legacy .npz archive).
+        y (numpy.ndarray): Labels.
+        block_size (int): Number of samples per block.
+
+    Returns:
+        callable: Function mapping a block index to (images, labels) arrays.
+    """
+
+    def read_block(block):
+        start = int(block) * block_size
+        stop = min(start + block_size, len(X))
+        if isinstance(X, ShardedSplit):
+            images = X.get_images(np.arange(start, stop))
+        else:
+            images = np.asarray(X[start:stop], dtype=np.float32)
+        return images, np.asarray(y[start:stop], dtype=np.int32)
+
+    return read_block
+
+
+def _derived_seed(*entropy):
+    """Derive an independent 32-bit seed from a base seed and e.g. an epoch."""
+    return int(np.random.SeedSequence(entropy).generate_state(1)[0])
+
+
+def make_dataset(
+    X,
+    y,
+    batch_size=32,
+    shuffle=False,
+    shuffle_buffer=10000,
+    cache=False,
+    seed=42,
+    block_size=DEFAULT_BLOCK_SIZE,
+    channels=3,
+    augment=False,
+    epoch=None,
+    skip_batches=0,
+    num_shards=1,
+    shard_index=0,
+    drop_remainder=False,
+):
+    """
+    Build a streaming tf.data input pipeline over an on-disk or in-memory data source.
+
+    Contiguous blocks are read in parallel, optionally cached (before normalization, so a
+    sharded store is cached as compact uint8), shuffled through a buffer, batched,
+    normalized in the graph and prefetched so input preparation overlaps with training.
+    No data source is ever copied into a constant tensor. With augment, every batch is
+    randomly augmented as a whole (see models.augmentation) in parallel map calls, with
+    per-batch seeds derived from seed, so augmented epochs are reproducible.
+
+    With epoch, the dataset covers that one epoch of a resumable run: its shuffle order and
+    augmentation depend only on seed and epoch, not on how often the dataset was iterated,
+    so an interrupted epoch can be rebuilt and continued after skip_batches. With
+    num_shards, the shuffled samples are split between workers, and batch k of every shard
+    together holds the same samples as batch k of a single worker with a batch size
+    num_shards times larger.
+
+    Args:
+        X (numpy.ndarray or ShardedSplit): Images of the split.
+        y (numpy.ndarray): Labels of the split.
+        batch_size (int): Number of samples per batch.
+        shuffle (bool): Whether to shuffle samples (reshuffled every epoch).
+        shuffle_buffer (int): Number of samples in the shuffle buffer.
+        cache (bool or str): True to cache in memory, a file path to cache on disk, or False.
+        seed (int): Seed for the shuffle order and the augmentation.
+        block_size (int): Number of samples read from disk per parallel read.
+        channels (int): Number of channels the model expects; grayscale is repeated to fill them.
+        augment (bool): Whether to randomly augment the images (for training data only).
+        epoch (int): Epoch of a resumable run to build the dataset for, or None for a
+            dataset reshuffled every time it is iterated.
+        skip_batches (int): Number of batches already trained on, skipped from the start.
+        num_shards (int): Number of workers the samples are split between.
+        shard_index (int): Index of the worker whose share is returned.
+        drop_remainder (bool): Whether to drop the last, smaller batch.
+
+    Returns:
+        tf.data.Dataset: Dataset of (images, labels) batches.
+    """
+    num_samples = len(X)
+    num_blocks = math.ceil(num_samples / block_size)
+    raw = isinstance(X, ShardedSplit)
+    image_shape = tuple(X.image_shape) if raw else tuple(X.shape[1:])
+    image_dtype = tf.uint8 if raw else tf.float32
+    read_block = _block_reader(X, y, block_size)
+
+    def read(block):
+        images, labels = tf.numpy_function(
+            read_block, [block], (image_dtype, tf.int32), stateful=False
+        )
+        images.set_shape((None,) + image_shape)
+        labels.set_shape((None,))
+        return images, labels
+
+    dataset = tf.data.Dataset.range(num_blocks).map(read, num_parallel_calls=AUTOTUNE)
+    if cache:
+        dataset = dataset.cache("" if cache is True else cache)
+    dataset = dataset.unbatch()
+    shuffle_seed = augment_seed = seed
+    if epoch is not None:
+        # A fixed order per epoch, the same whenever the epoch is rebuilt and on every
+        # worker, while every worker augments its share differently
+        shuffle_seed = _derived_seed(seed, epoch)
+        augment_seed = _derived_seed(seed, epoch, shard_index)
+    if shuffle:
+        dataset = dataset.shuffle(
+            shuffle_buffer, seed=shuffle_seed, reshuffle_each_iteration=epoch is None
+        )
+    if num_shards > 1:
+        dataset = dataset.shard(num_shards, shard_index)
+        num_samples = len(range(shard_index, num_samples, num_shards))
+    dataset = dataset.batch(batch_size, drop_remainder=drop_remainder)
+    num_batches = (
+        num_samples // batch_size
+        if drop_remainder
+        else math.ceil(num_samples / batch_size)
+    )
+    if skip_batches:
+        dataset = dataset.skip(skip_batches)
+        num_batches = max(num_batches - skip_batches, 0)
+
+    scale = tf.constant(1.0 / 255.0, dtype=tf.float32)
+
+    def prepare(images, labels, seeds=None):
+        if raw:  # Augment the single grayscale channel before it is repeated
+            images = tf.cast(images, tf.float32)[..., tf.newaxis] * scale
+        if seeds is not None:
+            images = augment_batch(images, seeds)
+        if raw:
+            images = tf.repeat(images, channels, axis=-1)
+        return images, labels
+
+    if augment:
+        seeds = augmentation_seeds(augment_seed, epoch is not None, skip_batches)
+        dataset = tf.data.Dataset.zip((dataset, seeds))
+        dataset = dataset.map(
+            lambda batch, seeds: prepare(*batch, seeds), num_parallel_calls=AUTOTUNE
+        )
+    elif raw:
+        dataset = dataset.map(prepare, num_parallel_calls=AUTOTUNE)
+
+    dataset = dataset.apply(tf.data.experimental.assert_cardinality(num_batches))
+    return dataset.prefetch(AUTOTUNE)
+
+
+class InputStallMonitor(Callback):
+    """
+    Keras callback that reports how long training waited on the input pipeline.
+
+    The training dataset has to be wrapped with monitor.wrap(dataset): every time the
+    training step asks for the next batch, the time until the pipeline delivers it is
+    recorded. With a well-fed pipeline the prefetch buffer is already full and the wait is
+    close to zero; a large share of the epoch spent waiting means training is input-bound.
+    """
+
+    def __init__(self, verbose=1):
+        super().__init__()
+        self.verbose = verbose
+        self.wait_seconds = 0.0
+        self.history = []
+        self._epoch_start = None
+
+    def wrap(self, dataset):
+        """
+        Wrap a dataset so that the time spent waiting for each batch is recorded.
+
+        Args:
+            dataset (tf.data.Dataset): The training dataset.
+
+        Returns:
+            tf.data.Dataset: A dataset yielding the same batches.
+        """
+
+        def timed_batches():
+            iterator = iter(dataset)
+            while True:
+                start = time.perf_counter()
+                try:
+                    batch = next(iterator)
+                except StopIteration:
+                    return
+                self.wait_seconds += time.perf_counter() - start
+                yield batch
+
+        monitored = tf.data.Dataset.from_generator(
+            timed_batches, output_signature=dataset.element_spec
+        )
+        return monitored.apply(
+            tf.data.experimental.assert_cardinality(dataset.cardinality())
+        )
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.wait_seconds = 0.0
+        self._epoch_start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        epoch_seconds = time.perf_counter() - self._epoch_start
+        stall_fraction = self.wait_seconds / epoch_seconds if epoch_seconds else 0.0
+        self.history.append(
+            {
+                "epoch": epoch,
+                "epoch_seconds": epoch_seconds,
+                "input_stall_seconds": self.wait_seconds,
+                "input_stall_fraction": stall_fraction,
+            }
+        )
+        if logs is not None:
+            logs["input_stall_seconds"] = self.wait_seconds
+        if self.verbose:
+            print(
+                f"\nEpoch {epoch + 1}: waited {self.wait_seconds:.2f}s on the input "
+                f"pipeline ({stall_fraction:.1%} of {epoch_seconds:.2f}s)"
+            )
+
+
+class StepTimer(Callback):
+    """
+    Keras callback that records the duration of every training step and the training
+    throughput, and with an InputStallMonitor, how long each step waited for its batch.
+
+    Every step is also recorded as a "train.step" profiling span (see utils.profiling), and
+    a tf.profiler trace of a few steps of the first epoch can be captured.
+    """
+
+    def __init__(
+        self,
+        batch_size,
+        input_monitor=None,
+        tf_profile_dir=None,
+        tf_profile_steps=(10, 20),
+        verbose=1,
+    ):
+        """
+        Args:
+            batch_size (int): Training batch size, to convert step times to samples/sec.
+            input_monitor (InputStallMonitor): Monitor wrapping the training dataset, to
+                attribute its input wait to steps.
+            tf_profile_dir (str): TensorBoard log directory for a tf.profiler capture.
+            tf_profile_steps (tuple): First and last (exclusive) step of the first epoch to
+                capture; the first steps are skipped since they include tracing.
+            verbose (int): Whether to print a summary after every epoch.
+        """
+        super().__init__()
+        self.batch_size = batch_size
+        self.input_monitor = input_monitor
+        self.tf_profile_dir = tf_profile_dir
+        self.tf_profile_steps = tf_profile_steps
+        self.verbose = verbose
+        self.history = []
+        self._epoch = 0
+        self._profiling = False
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._epoch = epoch
+        self.step_seconds = []
+        self.wait_seconds = []
+
+    def on_train_batch_begin(self, batch, logs=None):
+        if (
+            self.tf_profile_dir
+            and self._epoch == 0
+            and batch == self.tf_profile_steps[0]
+        ):
+            profiling.start_tf_profiler(self.tf_profile_dir)
+            self._profiling = True
+        if self.input_monitor is not None:
+            self._wait_start = self.input_monitor.wait_seconds
+        self._step_start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        seconds = time.perf_counter() - self._step_start
+        wait = 0.0
+        if self.input_monitor is not None:
+            wait = self.input_monitor.wait_seconds - self._wait_start
+        self.step_seconds.append(seconds)
+        self.wait_seconds.append(wait)
+        profiling.record(
+            "train.step",
+            self._step_start,
+            seconds,
+            epoch=self._epoch,
+            step=batch,
+            input_wait_ms=wait * 1000,
+        )
+
+        if self._profiling and batch + 1 >= self.tf_profile_steps[1]:
+            self._stop_tf_profiler()
+
+    def on_epoch_end(self, epoch, logs=None):
+        if not self.step_seconds:
+            return
+        steps = np.array(self.step_seconds)
+        p50, p95 = np.percentile(steps, [50, 95]) * 1000
+        samples_per_second = self.batch_size * len(steps) / steps.sum()
+        wait_fraction = sum(self.wait_seconds) / steps.sum()
+        self.history.append(
+            {
+                "epoch": epoch,
+                "steps": len(steps),
+                "step_ms_p50": float(p50),
+                "step_ms_p95": float(p95),
+                "samples_per_second": float(samples_per_second),
+                "input_wait_fraction": float(wait_fraction),
+            }
+        )
+        if logs is not None:
+            logs["samples_per_second"] = samples_per_second
+        if self.verbose:
+            print(
+                f"\nEpoch {epoch + 1}: step p50 {p50:.1f} ms, p95 {p95:.1f} ms, "
+                f"{samples_per_second:.0f} samples/s, "
+                f"{wait_fraction:.1%} of step time waiting for input"
+            )
+
+    def on_train_end(self, logs=None):
+        if self._profiling:  # The epoch had fewer steps than the capture range
+            self._stop_tf_profiler()
+
+    def _stop_tf_profiler(self):
+        profiling.stop_tf_profiler()
+        self._profiling = False
+        print(f"\nTensorFlow profile saved to {self.tf_profile_dir}")
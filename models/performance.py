@@ -0,0 +1,274 @@
+import os
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import mixed_precision
+from tensorflow.keras.optimizers import Adam
+
+from utils.dataset_store import ShardedSplit
+
+BASE_BATCH_SIZE = 32
+BASE_LEARNING_RATE = 0.001
+BF16_CPU_FLAGS = ("avx512_bf16", "amx_bf16")  # Native bfloat16 instructions on x86
+
+
+def configure_threads(intra_op_threads=0, inter_op_threads=0):
+    """
+    Size TensorFlow's thread pools; 0 leaves the choice to TensorFlow.
+
+    Must be called before TensorFlow runs its first operation.
+
+    Args:
+    - intra_op_threads (int): Threads used within one operation (e.g. a convolution).
+    - inter_op_threads (int): Threads used to run independent operations concurrently.
+    """
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+
+
+def cpu_supports_bf16():
+    """
+    Return True if the CPU has native bfloat16 instructions.
+
+    Without them bfloat16 is emulated, which is slower than float32.
+
+    Returns:
+    - bool: Whether a bfloat16 instruction set was found (Linux only).
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("flags"):
+                    return any(flag in line.split() for flag in BF16_CPU_FLAGS)
+    except OSError:
+        pass
+    return False
+
+
+def set_precision(precision):
+    """
+    Set the global Keras dtype policy for the models built afterwards.
+
+    Args:
+    - precision (str): "float32" or "mixed_bfloat16" (bfloat16 compute, float32 weights).
+    """
+    mixed_precision.set_global_policy(precision)
+
+
+def training_sample(X, y, num_samples, seed=42):
+    """
+    Read a random in-memory sample of the training data for throughput measurements.
+
+    Args:
+    - X (numpy.ndarray or ShardedSplit): Training images.
+    - y (numpy.ndarray): Training labels.
+    - num_samples (int): Number of samples; drawn with replacement from small datasets.
+
+    Returns:
+    - Tuple of numpy arrays: (images, labels)
+    """
+    rng = np.random.default_rng(seed)
+    indices = np.sort(rng.choice(len(X), num_samples, replace=num_samples > len(X)))
+    if isinstance(X, ShardedSplit):
+        images = X.get_batch(indices)[0]
+    else:
+        images = np.asarray(X[indices], dtype=np.float32)
+    return images, np.asarray(y[indices])
+
+
+def measure_throughput(
+    build_fn, images, labels, batch_size, precision, jit_compile, steps=10, warmup=3
+):
+    """
+    Measure the training throughput of one configuration on in-memory batches.
+
+    Args:
+    - build_fn (callable): Function returning a new, uncompiled model.
+    - images (numpy.ndarray): Training images, at least batch_size of them.
+    - labels (numpy.ndarray): Training labels.
+    - batch_size (int): Batch size to measure.
+    - precision (str): Keras dtype policy, "float32" or "mixed_bfloat16".
+    - jit_compile (bool): Whether to compile the train step with XLA.
+    - steps (int): Number of timed training steps.
+    - warmup (int): Number of untimed steps, which include tracing and compilation.
+
+    Returns:
+    - float: Training samples per second.
+    """
+    tf.keras.backend.clear_session()
+    set_precision(precision)
+    try:
+        model = build_fn()
+        model.compile(
+            optimizer=Adam(learning_rate=BASE_LEARNING_RATE),
+            loss="sparse_categorical_crossentropy",
+            jit_compile=jit_compile,
+        )
+        batches = [
+            (images[start : start + batch_size], labels[start : start + batch_size])
+            for start in range(0, len(images) - batch_size + 1, batch_size)
+        ]
+        for step in range(warmup):
+            model.train_on_batch(*batches[step % len(batches)])
+        start = time.perf_counter()
+        for step in range(steps):
+            model.train_on_batch(*batches[step % len(batches)])
+        seconds = time.perf_counter() - start
+    finally:
+        set_precision("float32")
+    return batch_size * steps / seconds
+
+
+def tune_performance(
+    build_fn,
+    X_train,
+    y_train,
+    precision="auto",
+    jit_compile=True,
+    max_batch_size=1024,
+    min_gain=0.05,
+    base_batch_size=BASE_BATCH_SIZE,
+    base_learning_rate=BASE_LEARNING_RATE,
+):
+    """
+    Pick the fastest training configuration with a short measurement phase.
+
+    The baseline is float32 without XLA at the base batch size. XLA and bfloat16 are kept
+    only if they run, and bfloat16 only if the CPU supports it and it is faster than
+    float32. The batch size is then doubled while samples/sec improves by more than
+    min_gain, and the learning rate is scaled linearly with it.
+
+    Args:
+    - build_fn (callable): Function returning a new, uncompiled model.
+    - X_train (numpy.ndarray or ShardedSplit): Training images.
+    - y_train (numpy.ndarray): Training labels.
+    - precision (str): "auto", "float32" or "mixed_bfloat16".
+    - jit_compile (bool): Whether to try XLA-compiled train steps.
+    - max_batch_size (int): Largest batch size tried.
+    - min_gain (float): Relative throughput gain a larger batch size must bring.
+    - base_batch_size (int): Batch size of the baseline.
+    - base_learning_rate (float): Learning rate at the base batch size.
+
+    Returns:
+    - dict: The chosen precision, jit_compile, batch_size and learning_rate, with the
+      baseline and chosen samples/sec and the speedup. If the baseline fails to run,
+      the default configuration (with the requested precision) is returned with None
+      for the measurements.
+
+    Raises:
+    - RuntimeError: If precision is "mixed_bfloat16" and it fails to run.
+    """
+    images, labels = training_sample(X_train, y_train, max_batch_size * 2)
+
+    def measure(batch_size, precision, jit_compile):
+        try:
+            samples_per_second = measure_throughput(
+                build_fn, images, labels, batch_size, precision, jit_compile
+            )
+        except (tf.errors.ResourceExhaustedError, MemoryError):
+            print(
+                f"  batch {batch_size}, {precision}, XLA {jit_compile}: out of memory"
+            )
+            return None
+        except Exception as error:  # E.g. an operation XLA cannot compile
+            print(f"  batch {batch_size}, {precision}, XLA {jit_compile}: {error}")
+            return None
+        print(
+            f"  batch {batch_size}, {precision}, XLA {jit_compile}: "
+            f"{samples_per_second:.0f} samples/s"
+        )
+        return samples_per_second
+
+    print("Tuning the training configuration (float32, no XLA first as the baseline)")
+    baseline = measure(base_batch_size, "float32", False)
+    if baseline is None:
+        # Nothing to compare against, so train with the baseline configuration
+        print("  The baseline failed to run, keeping the default configuration")
+        tf.keras.backend.clear_session()
+        return {
+            # An explicitly requested precision is still honored
+            "precision": (
+                "mixed_bfloat16" if precision == "mixed_bfloat16" else "float32"
+            ),
+            "jit_compile": False,
+            "batch_size": base_batch_size,
+            "learning_rate": base_learning_rate,
+            "baseline_samples_per_second": None,
+            "samples_per_second": None,
+            "speedup": None,
+        }
+    best = {"precision": "float32", "jit_compile": False, "throughput": baseline}
+
+    if jit_compile:
+        throughput = measure(base_batch_size, "float32", True)
+        if throughput is not None and throughput > best["throughput"]:
+            best = {
+                "precision": "float32",
+                "jit_compile": True,
+                "throughput": throughput,
+            }
+
+    if precision == "auto" and not cpu_supports_bf16():
+        print("  bfloat16: no native support on this CPU, keeping float32")
+    elif precision != "float32":
+        throughput = measure(base_batch_size, "mixed_bfloat16", best["jit_compile"])
+        if throughput is None and precision == "mixed_bfloat16":
+            raise RuntimeError(
+                "mixed_bfloat16 was requested, but training failed with it (see above)"
+            )
+        if throughput is not None and (
+            precision == "mixed_bfloat16" or throughput > best["throughput"]
+        ):
+            best = dict(best, precision="mixed_bfloat16", throughput=throughput)
+        elif throughput is None:
+            print("  bfloat16: failed to run, keeping float32")
+        else:
+            print("  bfloat16: not faster than float32, keeping float32")
+
+    batch_size = base_batch_size
+    while batch_size * 2 <= max_batch_size:
+        throughput = measure(batch_size * 2, best["precision"], best["jit_compile"])
+        if throughput is None or throughput < best["throughput"] * (1 + min_gain):
+            break
+        batch_size *= 2
+        best["throughput"] = throughput
+
+    tf.keras.backend.clear_session()
+    return {
+        "precision": best["precision"],
+        "jit_compile": best["jit_compile"],
+        "batch_size": batch_size,
+        "learning_rate": base_learning_rate * batch_size / base_batch_size,
+        "baseline_samples_per_second": baseline,
+        "samples_per_second": best["throughput"],
+        "speedup": best["throughput"] / baseline,
+    }
+
+
+def print_configuration(config, intra_op_threads=0, inter_op_threads=0):
+    """Print a configuration chosen by tune_performance."""
+
+    def threads(count):
+        return count or f"auto ({os.cpu_count()} CPUs)"
+
+    print(
+        f"Training configuration: precision {config['precision']}, "
+        f"XLA {'on' if config['jit_compile'] else 'off'}, "
+        f"batch size {config['batch_size']}, "
+        f"learning rate {config['learning_rate']:g}, "
+        f"intra-op threads {threads(intra_op_threads)}, "
+        f"inter-op threads {threads(inter_op_threads)}"
+    )
+    if config["speedup"] is None:
+        print("Training throughput could not be measured")
+        return
+    print(
+        f"Measured {config['samples_per_second']:.0f} samples/s against "
+        f"{config['baseline_samples_per_second']:.0f} for the baseline "
+        f"(float32, no XLA, batch size {BASE_BATCH_SIZE}): "
+        f"{config['speedup']:.2f}x speedup"
+    )
@@ -1,22 +1,99 @@
+import argparse
+import json
+import math
+import os
+import sys
 import numpy as np
 from tensorflow.keras.callbacks import ModelCheckpoint, EarlyStopping
 from tensorflow.keras.optimizers import Adam
 from tensorflow.keras.applications import VGG16
-from tensorflow.keras.layers import Flatten, Dense, Dropout
+from tensorflow.keras.layers import (
+    BatchNormalization,
+    Conv2D,
+    Dense,
+    DepthwiseConv2D,
+    Dropout,
+    Flatten,
+    GlobalAveragePooling2D,
+    Input,
+    MaxPooling2D,
+    ReLU,
+)
 from tensorflow.keras.models import Model, save_model
+from tensorflow.keras.utils import Sequence
+from models.distributed import (
+    DEFAULT_SAVE_EVERY_STEPS,
+    DEFAULT_STATE_DIR,
+    create_strategy,
+    is_worker_process,
+    launch_local_workers,
+    train_resumable,
+    worker_environment,
+)
+from models.evaluation import (
+    evaluate_streaming,
+    iter_batches,
+    print_report,
+    save_report,
+)
+from models.feature_cache import (
+    FeatureCache,
+    split_frozen_base,
+    train_head_on_cached_features,
+)
+from models.performance import (
+    configure_threads,
+    print_configuration,
+    set_precision,
+    tune_performance,
+)
+from models.input_pipeline import InputStallMonitor, StepTimer, make_dataset
+from utils import profiling
+from utils.dataset_store import ShardedDataset, ShardedSplit, is_sharded_dataset
+from utils.manifest import file_hash, load_manifest
+
+BACKBONES = ("vgg16", "mobilenet", "small_cnn")
+DEFAULT_BACKBONE = "vgg16"
+# Where Keras stores the ImageNet weights it downloads; copy the file here (or pass
+# --vgg-weights) on machines without network access
+DEFAULT_VGG16_WEIGHTS = os.path.join(
+    os.path.expanduser("~"),
+    ".keras",
+    "models",
+    "vgg16_weights_tf_dim_ordering_tf_kernels_notop.h5",
+)
+CHECKPOINT_PATH = "models/saved_models/model_weights.weights.h5"
 
 
 def load_preprocessed_data(data_path):
     """
     Load preprocessed dataset from the given file path.
 
+    A sharded store (see utils.dataset_store) is memory-mapped rather than read: its splits
+    are returned as ShardedSplit objects that produce normalized batches on demand, and the
+    labels as memory-mapped arrays. A legacy .npz archive is loaded fully into memory.
+
     Args:
-    - data_path (str): Path to the preprocessed data file.
+    - data_path (str): Path to the sharded store directory or the .npz file.
 
     Returns:
-    - Tuple of numpy arrays and variables:
+    - Tuple of numpy arrays (or ShardedSplit objects) and variables:
       (X_train, y_train, X_dev, y_dev, X_test, y_test, class_names, input_shape, num_classes)
     """
+    if is_sharded_dataset(data_path):
+        dataset = ShardedDataset(data_path)
+        return (
+            dataset["train"],
+            dataset["train"].labels,
+            dataset["dev"],
+            dataset["dev"].labels,
+            dataset["test"],
+            dataset["test"].labels,
+            np.array(dataset.class_names),
+            dataset.input_shape,
+            len(dataset.class_names),
+        )
+
     # Load the preprocessed dataset
     data = np.load(data_path, allow_pickle=True)
 
@@ -44,20 +121,58 @@ def load_preprocessed_data(data_path):
     )
 
 
-def build_model(input_shape, num_classes):
+class ShardedBatchSequence(Sequence):
+    """
+    Keras Sequence that reads batches lazily from a memory-mapped ShardedSplit, expanding
+    channels and normalizing one batch at a time.
+    """
+
+    def __init__(self, split, batch_size, shuffle=False, seed=None, **kwargs):
+        super().__init__(**kwargs)
+        self.split = split
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.rng = np.random.default_rng(seed)
+        self.order = np.arange(len(split))
+        if shuffle:
+            self.rng.shuffle(self.order)
+
+    def __len__(self):
+        return math.ceil(len(self.split) / self.batch_size)
+
+    def __getitem__(self, idx):
+        indices = self.order[idx * self.batch_size : (idx + 1) * self.batch_size]
+        # Sorted indices read each shard sequentially
+        return self.split.get_batch(np.sort(indices))
+
+    def on_epoch_end(self):
+        if self.shuffle:
+            self.rng.shuffle(self.order)
+
+
+def build_vgg16(input_shape, num_classes, weights=DEFAULT_VGG16_WEIGHTS):
     """
-    Build a convolutional neural network model based on VGG16 architecture.
+    Build a frozen VGG16 base with a dense classification head.
 
     Args:
     - input_shape (tuple): Shape of the input data (excluding batch dimension).
     - num_classes (int): Number of output classes.
+    - weights (str): Path to the ImageNet VGG16 weights without the top layers, or None
+      to start from random weights. The weights are never downloaded.
 
     Returns:
-    - TensorFlow Keras Model: Compiled CNN model.
+    - TensorFlow Keras Model: Uncompiled CNN model.
     """
+    if weights is not None and not os.path.exists(weights):
+        raise FileNotFoundError(
+            f"VGG16 weights not found at {weights}. Copy "
+            "vgg16_weights_tf_dim_ordering_tf_kernels_notop.h5 there, or choose another "
+            "backbone."
+        )
+
     # Load pre-trained VGG16 model, exclude top layers
     base_model = VGG16(
-        weights="imagenet",
+        weights=weights,
         include_top=False,
         input_shape=(input_shape[0], input_shape[1], 3),  # Adjusted for RGB input
     )
@@ -66,7 +181,8 @@ def build_model(input_shape, num_classes):
     x = Flatten()(base_model.output)
     x = Dense(512, activation="relu")(x)
     x = Dropout(0.5)(x)
-    predictions = Dense(num_classes, activation="softmax")(x)
+    # Softmax in float32 keeps the probabilities accurate under mixed precision
+    predictions = Dense(num_classes, activation="softmax", dtype="float32")(x)
 
     # Final model
     model = Model(inputs=base_model.input, outputs=predictions)
@@ -78,33 +194,205 @@ def build_model(input_shape, num_classes):
     return model
 
 
-def train_model(model, X_train, y_train, X_dev, y_dev, batch_size=32, epochs=20):
+def build_mobilenet(input_shape, num_classes, alpha=1.0):
+    """
+    Build a MobileNet-style network of depthwise separable convolutions, sized for 45x45
+    symbols and trained from scratch.
+
+    Args:
+    - input_shape (tuple): Shape of the input data (excluding batch dimension).
+    - num_classes (int): Number of output classes.
+    - alpha (float): Width multiplier applied to the number of filters of every layer.
+
+    Returns:
+    - TensorFlow Keras Model: Uncompiled CNN model.
+    """
+    inputs = Input(shape=input_shape)
+    x = Conv2D(int(32 * alpha), 3, padding="same", use_bias=False)(inputs)
+    x = BatchNormalization()(x)
+    x = ReLU(6.0)(x)
+
+    # (filters, stride): 45x45 -> 23x23 -> 12x12 -> 6x6
+    for filters, strides in ((64, 1), (128, 2), (128, 1), (256, 2), (256, 1), (512, 2)):
+        x = DepthwiseConv2D(3, strides=strides, padding="same", use_bias=False)(x)
+        x = BatchNormalization()(x)
+        x = ReLU(6.0)(x)
+        x = Conv2D(int(filters * alpha), 1, use_bias=False)(x)
+        x = BatchNormalization()(x)
+        x = ReLU(6.0)(x)
+
+    x = GlobalAveragePooling2D()(x)
+    x = Dropout(0.3)(x)
+    # Softmax in float32 keeps the probabilities accurate under mixed precision
+    predictions = Dense(num_classes, activation="softmax", dtype="float32")(x)
+
+    return Model(inputs=inputs, outputs=predictions)
+
+
+def build_small_cnn(input_shape, num_classes):
+    """
+    Build a small purpose-built CNN for 45x45 grayscale symbols, trained from scratch.
+
+    The inputs keep the pipeline's shape, with the grayscale image in every channel, so
+    the model is a drop-in replacement for the other backbones.
+
+    Args:
+    - input_shape (tuple): Shape of the input data (excluding batch dimension).
+    - num_classes (int): Number of output classes.
+
+    Returns:
+    - TensorFlow Keras Model: Uncompiled CNN model.
+    """
+    inputs = Input(shape=input_shape)
+    x = inputs
+    # Two conv layers per stage: 45x45 -> 22x22 -> 11x11
+    for filters in (32, 64):
+        for _ in range(2):
+            x = Conv2D(filters, 3, padding="same", use_bias=False)(x)
+            x = BatchNormalization()(x)
+            x = ReLU()(x)
+        x = MaxPooling2D()(x)
+    x = Conv2D(128, 3, padding="same", use_bias=False)(x)
+    x = BatchNormalization()(x)
+    x = ReLU()(x)
+
+    x = GlobalAveragePooling2D()(x)
+    x = Dropout(0.3)(x)
+    # Softmax in float32 keeps the probabilities accurate under mixed precision
+    predictions = Dense(num_classes, activation="softmax", dtype="float32")(x)
+
+    return Model(inputs=inputs, outputs=predictions)
+
+
+def build_model(
+    input_shape,
+    num_classes,
+    backbone=DEFAULT_BACKBONE,
+    vgg_weights=DEFAULT_VGG16_WEIGHTS,
+):
+    """
+    Build a convolutional neural network model on the chosen backbone.
+
+    Args:
+    - input_shape (tuple): Shape of the input data (excluding batch dimension).
+    - num_classes (int): Number of output classes.
+    - backbone (str): "vgg16" (frozen, pre-trained on ImageNet), "mobilenet" or
+      "small_cnn" (both trained from scratch).
+    - vgg_weights (str): Local path to the VGG16 weights, for the "vgg16" backbone.
+
+    Returns:
+    - TensorFlow Keras Model: Uncompiled CNN model.
+    """
+    if backbone == "vgg16":
+        return build_vgg16(input_shape, num_classes, vgg_weights)
+    if backbone == "mobilenet":
+        return build_mobilenet(input_shape, num_classes)
+    if backbone == "small_cnn":
+        return build_small_cnn(input_shape, num_classes)
+    raise ValueError(f"Unknown backbone {backbone!r}, expected one of {BACKBONES}")
+
+
+def train_model(
+    model,
+    X_train,
+    y_train,
+    X_dev,
+    y_dev,
+    batch_size=32,
+    epochs=20,
+    streaming=False,
+    cache=False,
+    cached_features=False,
+    dataset_hash=None,
+    checkpoint_path=CHECKPOINT_PATH,
+    callbacks=(),
+    tf_profile_dir=None,
+    learning_rate=0.001,
+    jit_compile=False,
+    augment=False,
+    state_dir=None,
+    save_every_steps=DEFAULT_SAVE_EVERY_STEPS,
+):
     """
     Train the convolutional neural network model.
 
+    In streaming mode the training and validation data are read through a tf.data pipeline
+    (see models.input_pipeline) instead of being handed to Keras as whole arrays, and the
+    time spent waiting on the input pipeline is reported after every epoch. In cached-features
+    mode the frozen base is run once and only the head is trained, on features cached on disk
+    (see models.feature_cache). Augmentation is part of the tf.data pipeline, so it implies
+    streaming. With a state directory, the full training state is checkpointed there and
+    training resumes from it, with a training loop that also runs on several workers (see
+    models.distributed); the data is then always streamed, and the model has to be built
+    in the scope of models.distributed.create_strategy().
+
     Args:
     - model (TensorFlow Keras Model): Compiled CNN model to train.
-    - X_train (numpy.ndarray): Training data.
+    - X_train (numpy.ndarray or ShardedSplit): Training data.
     - y_train (numpy.ndarray): Training labels.
-    - X_dev (numpy.ndarray): Validation data.
+    - X_dev (numpy.ndarray or ShardedSplit): Validation data.
     - y_dev (numpy.ndarray): Validation labels.
     - batch_size (int): Batch size for training.
     - epochs (int): Number of epochs for training.
+    - streaming (bool): Whether to stream the data through a tf.data pipeline.
+    - cache (bool or str): In streaming mode, True to cache the data in memory after the
+      first epoch, or a file path to cache it on disk.
+    - cached_features (bool): Whether to train only the head on cached backbone features.
+    - dataset_hash (str): Hash identifying the dataset; required for cached features.
+    - checkpoint_path (str): File the best weights are saved to during training.
+    - callbacks (list): Additional Keras callbacks.
+    - tf_profile_dir (str): TensorBoard log directory for a tf.profiler capture of a few
+      training steps. Step times are recorded when this is set or profiling is enabled.
+    - learning_rate (float): Learning rate of the Adam optimizer.
+    - jit_compile (bool): Whether to compile the train step with XLA.
+    - augment (bool): Whether to randomly augment every training batch (see
+      models.augmentation).
+    - state_dir (str): Directory of the resumable training-state checkpoints, or None.
+    - save_every_steps (int): With a state directory, the number of steps between
+      checkpoints within an epoch.
 
     Returns:
     - Tuple of TensorFlow Keras Model and History:
       (Trained model, Training history)
     """
+    if cached_features:
+        return train_head_on_cached_features(
+            model, X_train, y_train, X_dev, y_dev, dataset_hash, batch_size, epochs
+        )
+
+    if state_dir:
+        if profiling.is_enabled() or tf_profile_dir:
+            callbacks = list(callbacks) + [StepTimer(batch_size, None, tf_profile_dir)]
+        return train_resumable(
+            model,
+            X_train,
+            y_train,
+            X_dev,
+            y_dev,
+            state_dir,
+            batch_size,
+            epochs,
+            checkpoint_path,
+            callbacks,
+            learning_rate,
+            jit_compile,
+            augment,
+            save_every_steps,
+        )
+
+    streaming = streaming or augment
+
     # Compile the model
     model.compile(
-        optimizer=Adam(learning_rate=0.001),
+        optimizer=Adam(learning_rate=learning_rate),
         loss="sparse_categorical_crossentropy",
         metrics=["accuracy"],
+        jit_compile=jit_compile,
     )
 
     # Callbacks
     checkpoint_callback = ModelCheckpoint(
-        "models/saved_models/model_weights.weights.h5",
+        checkpoint_path,
         save_best_only=True,
         save_weights_only=True,
         monitor="val_loss",
@@ -119,32 +407,105 @@ def train_model(model, X_train, y_train, X_dev, y_dev, batch_size=32, epochs=20)
         restore_best_weights=True,
     )
 
+    callbacks = [checkpoint_callback, early_stopping_callback] + list(callbacks)
+    stall_monitor = InputStallMonitor() if streaming else None
+    if stall_monitor is not None:
+        callbacks.append(stall_monitor)
+    if profiling.is_enabled() or tf_profile_dir:
+        callbacks.append(StepTimer(batch_size, stall_monitor, tf_profile_dir))
+
     # Train the model
-    history = model.fit(
-        X_train,
-        y_train,
-        epochs=epochs,
-        batch_size=batch_size,
-        validation_data=(X_dev, y_dev),
-        callbacks=[checkpoint_callback, early_stopping_callback],
-    )
+    if streaming:
+        train_data = make_dataset(
+            X_train, y_train, batch_size, shuffle=True, cache=cache, augment=augment
+        )
+        dev_cache = f"{cache}_dev" if isinstance(cache, str) else cache
+        history = model.fit(
+            stall_monitor.wrap(train_data),
+            epochs=epochs,
+            validation_data=make_dataset(X_dev, y_dev, batch_size, cache=dev_cache),
+            callbacks=callbacks,
+        )
+    elif isinstance(X_train, ShardedSplit):
+        history = model.fit(
+            ShardedBatchSequence(X_train, batch_size, shuffle=True, seed=42),
+            epochs=epochs,
+            validation_data=ShardedBatchSequence(X_dev, batch_size),
+            callbacks=callbacks,
+        )
+    else:
+        history = model.fit(
+            X_train,
+            y_train,
+            epochs=epochs,
+            batch_size=batch_size,
+            validation_data=(X_dev, y_dev),
+            callbacks=callbacks,
+        )
 
     return model, history
 
 
-def evaluate_model(model, X_test, y_test):
+def evaluate_model(
+    model,
+    X_test,
+    y_test,
+    streaming=False,
+    batch_size=256,
+    class_names=None,
+    report_path=None,
+):
     """
     Evaluate the convolutional neural network model on the test set.
 
+    Predictions are made batch by batch and accumulated into a confusion matrix, per-class
+    precision/recall/F1 and top-k accuracy (see models.evaluation), so memory use does not
+    grow with the size of the test set.
+
     Args:
     - model (TensorFlow Keras Model): Trained CNN model.
-    - X_test (numpy.ndarray): Test data.
+    - X_test (numpy.ndarray or ShardedSplit): Test data.
     - y_test (numpy.ndarray): Test labels.
+    - streaming (bool): Whether to stream the data through a tf.data pipeline.
+    - batch_size (int): Batch size for evaluation.
+    - class_names (list): Name of every class, used in the report.
+    - report_path (str): File to write the JSON evaluation report to, or None.
+
+    Returns:
+    - dict: Evaluation report.
     """
     # Evaluate the model
-    loss, accuracy = model.evaluate(X_test, y_test, verbose=0)
-    print(f"Test loss: {loss:.4f}")
-    print(f"Test accuracy: {accuracy:.4f}")
+    if streaming:
+        batches = iter_batches(make_dataset(X_test, y_test, batch_size))
+    else:
+        batches = iter_batches(X_test, y_test, batch_size)
+    report = evaluate_streaming(
+        model.predict_on_batch, batches, model.output_shape[-1], class_names
+    )
+    print_report(report)
+    if report_path:
+        save_report(report, report_path)
+    return report
+
+
+def copy_model(model, input_shape, num_classes, backbone, vgg_weights):
+    """
+    Rebuild a model with the current dtype policy and no distribution strategy, and copy
+    the weights of the given model into it.
+
+    Args:
+    - model (TensorFlow Keras Model): Trained CNN model.
+    - input_shape (tuple): Shape of the input data (excluding batch dimension).
+    - num_classes (int): Number of output classes.
+    - backbone (str): Backbone the model was built on.
+    - vgg_weights (str): Local path to the VGG16 weights, for the "vgg16" backbone.
+
+    Returns:
+    - TensorFlow Keras Model: Uncompiled copy of the model.
+    """
+    copy = build_model(input_shape, num_classes, backbone, vgg_weights)
+    copy.set_weights(model.get_weights())
+    return copy
 
 
 def save_trained_model(model, model_path):
@@ -164,34 +525,269 @@ def main():
     """
     Main function to load data, build, train, evaluate, and save the CNN model.
     """
+    parser = argparse.ArgumentParser(description="Train the math notation CNN model.")
+    parser.add_argument(
+        "--config",
+        help='JSON file of option defaults, e.g. {"backbone": "small_cnn"}.',
+    )
+    parser.add_argument(
+        "--backbone",
+        choices=BACKBONES,
+        default=DEFAULT_BACKBONE,
+        help="Convolutional base of the model.",
+    )
+    parser.add_argument(
+        "--vgg-weights",
+        default=DEFAULT_VGG16_WEIGHTS,
+        help="Local VGG16 ImageNet weights file (no top), for the vgg16 backbone.",
+    )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Stream data from disk through a tf.data input pipeline.",
+    )
+    parser.add_argument(
+        "--cache",
+        nargs="?",
+        const=True,
+        default=False,
+        help="In streaming mode, cache data in memory (or in the given file).",
+    )
+    parser.add_argument(
+        "--augment",
+        action="store_true",
+        help="Randomly augment every training batch (implies --streaming).",
+    )
+    parser.add_argument(
+        "--cached-features",
+        action="store_true",
+        help="Run the frozen base once and train only the head on cached features.",
+    )
+    parser.add_argument(
+        "--performance",
+        action="store_true",
+        help="Tune XLA, bfloat16 mixed precision and the batch size before training.",
+    )
+    parser.add_argument(
+        "--precision",
+        choices=["auto", "float32", "mixed_bfloat16"],
+        default="auto",
+        help="With --performance; auto uses bfloat16 if the CPU supports it and it is faster.",
+    )
+    parser.add_argument(
+        "--no-xla", action="store_true", help="With --performance, do not try XLA."
+    )
+    parser.add_argument(
+        "--max-batch-size",
+        type=int,
+        default=1024,
+        help="With --performance, the largest batch size tried.",
+    )
+    parser.add_argument(
+        "--intra-op-threads",
+        type=int,
+        default=0,
+        help="Threads used within one operation (0: TensorFlow's default).",
+    )
+    parser.add_argument(
+        "--inter-op-threads",
+        type=int,
+        default=0,
+        help="Threads running independent operations (0: TensorFlow's default).",
+    )
+    parser.add_argument(
+        "--state-dir",
+        help="Checkpoint the full training state here and resume from it automatically.",
+    )
+    parser.add_argument(
+        "--save-every-steps",
+        type=int,
+        default=DEFAULT_SAVE_EVERY_STEPS,
+        help="With --state-dir, the number of steps between checkpoints within an epoch.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Train data-parallel on this many local worker processes (implies "
+        f"--state-dir {DEFAULT_STATE_DIR}).",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="TRACE",
+        help="Record stage and step timings and write them as a Chrome trace.",
+    )
+    parser.add_argument(
+        "--tf-profile",
+        metavar="LOGDIR",
+        help="Capture a tf.profiler trace of a few training steps for TensorBoard.",
+    )
+    args, _ = parser.parse_known_args()
+    if args.config:
+        # Options given on the command line override the config file
+        with open(args.config) as f:
+            config = json.load(f)
+        parser.set_defaults(
+            **{key.replace("-", "_"): value for key, value in config.items()}
+        )
+    args = parser.parse_args()
+    if args.backbone not in BACKBONES:  # Defaults from the config are not checked
+        parser.error(f"unknown backbone {args.backbone!r}, expected one of {BACKBONES}")
+    if args.cached_features and args.backbone != "vgg16":
+        parser.error("--cached-features needs the frozen vgg16 backbone")
+    if args.cached_features and args.performance:
+        parser.error("--performance does not apply to --cached-features")
+    if args.cached_features and args.augment:
+        parser.error("--augment does not apply to --cached-features")
+    if args.workers > 1 and not args.state_dir:
+        args.state_dir = DEFAULT_STATE_DIR
+    if args.state_dir and args.cached_features:
+        parser.error("--state-dir and --workers do not apply to --cached-features")
+    if args.state_dir and args.cache:
+        parser.error("--cache does not apply to --state-dir and --workers")
+    if args.workers > 1 and args.performance:
+        parser.error("--performance does not apply to --workers")
+
+    if args.workers > 1 and not is_worker_process():
+        # Start the workers, which run this same command, and wait for them
+        sys.exit(
+            launch_local_workers(
+                args.workers,
+                [sys.executable, "-m", "models.train_model"] + sys.argv[1:],
+                log_dir=args.state_dir,
+            )
+        )
+    worker_index, num_workers = worker_environment()
+    intra_op_threads = args.intra_op_threads
+    if num_workers > 1 and not intra_op_threads:
+        intra_op_threads = max(1, (os.cpu_count() or 1) // num_workers)
+    # Thread pools can only be sized before TensorFlow runs its first operation
+    configure_threads(intra_op_threads, args.inter_op_threads)
+    # Every worker waits here for the others
+    strategy = create_strategy()
+    if args.profile:
+        profiling.enable()
+
     # Constants
-    data_path = "data/processed_data/math_notation_dataset.npz"
+    data_path = "data/processed_data/math_notation_dataset"
+    if not is_sharded_dataset(data_path):
+        data_path += ".npz"  # Dataset preprocessed with the previous format
     trained_model_path = "models/saved_models/trained_model.h5"
+    evaluation_report_path = "models/saved_models/evaluation_report.json"
 
     # Load preprocessed data and determine input shape and number of classes
-    (
-        X_train,
-        y_train,
-        X_dev,
-        y_dev,
-        X_test,
-        y_test,
-        class_names,
-        input_shape,
-        num_classes,
-    ) = load_preprocessed_data(data_path)
+    with profiling.span("train.load_data"):
+        (
+            X_train,
+            y_train,
+            X_dev,
+            y_dev,
+            X_test,
+            y_test,
+            class_names,
+            input_shape,
+            num_classes,
+        ) = load_preprocessed_data(data_path)
+
+    # Identify the dataset, e.g. to key cached features
+    manifest = load_manifest(data_path)
+    dataset_hash = manifest["dataset_hash"] if manifest else file_hash(data_path)
+
+    # Pick the precision, XLA and batch size with a short measurement phase
+    config = {
+        "precision": "float32",
+        "jit_compile": False,
+        "batch_size": 32,
+        "learning_rate": 0.001,
+    }
+    if args.performance:
+        with profiling.span("train.tune"):
+            config = tune_performance(
+                lambda: build_model(
+                    input_shape, num_classes, args.backbone, args.vgg_weights
+                ),
+                X_train,
+                y_train,
+                precision=args.precision,
+                jit_compile=not args.no_xla,
+                max_batch_size=args.max_batch_size,
+            )
+        print_configuration(config, args.intra_op_threads, args.inter_op_threads)
 
     # Build the model
-    model = build_model(input_shape, num_classes)
+    with profiling.span("train.build_model", backbone=args.backbone):
+        set_precision(config["precision"])
+        with strategy.scope():
+            model = build_model(
+                input_shape, num_classes, args.backbone, args.vgg_weights
+            )
 
     # Train the model
-    model, history = train_model(model, X_train, y_train, X_dev, y_dev)
+    with profiling.span("train.fit"):
+        model, history = train_model(
+            model,
+            X_train,
+            y_train,
+            X_dev,
+            y_dev,
+            streaming=args.streaming,
+            cache=args.cache,
+            cached_features=args.cached_features,
+            dataset_hash=dataset_hash,
+            tf_profile_dir=args.tf_profile,
+            batch_size=config["batch_size"],
+            learning_rate=config["learning_rate"],
+            jit_compile=config["jit_compile"],
+            augment=args.augment,
+            state_dir=args.state_dir,
+            save_every_steps=args.save_every_steps,
+        )
+
+    if num_workers > 1:
+        if worker_index != 0:
+            return  # Only the chief evaluates and saves the model
+        # Predictions with the multi-worker model would wait for the other workers
+        model = copy_model(
+            model, input_shape, num_classes, args.backbone, args.vgg_weights
+        )
 
     # Evaluate the model
-    evaluate_model(model, X_test, y_test)
+    with profiling.span("train.evaluate"):
+        if args.cached_features:
+            extractor, head = split_frozen_base(model)
+            test_features = FeatureCache(extractor, dataset_hash).features(
+                "test", X_test
+            )
+            evaluate_model(
+                head,
+                test_features,
+                y_test,
+                class_names=list(class_names),
+                report_path=evaluation_report_path,
+            )
+        else:
+            evaluate_model(
+                model,
+                X_test,
+                y_test,
+                streaming=args.streaming,
+                class_names=list(class_names),
+                report_path=evaluation_report_path,
+            )
 
     # Save the trained model
-    save_trained_model(model, trained_model_path)
+    with profiling.span("train.save"):
+        if config["precision"] != "float32":
+            # Save a float32 copy, so that inference does not need bfloat16 support
+            set_precision("float32")
+            model = copy_model(
+                model, input_shape, num_classes, args.backbone, args.vgg_weights
+            )
+        save_trained_model(model, trained_model_path)
+
+    if args.profile:
+        count = profiling.export_chrome_trace(args.profile)
+        print(f"Wrote {count} spans to {args.profile}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,399 @@
+"""
+Serve predictions over HTTP to other local processes, with one resident model.
+
+Concurrent requests are merged into micro-batches: the batcher waits at most
+--max-delay-ms after the first queued image for more images, up to --max-batch-size,
+and runs them through the model in one forward pass. When more than --max-queue images
+are waiting, new requests are rejected with 503 so that clients back off instead of
+piling up latency.
+
+Endpoints:
+    POST /predict   An image file as the request body, or JSON {"images": [base64, ...]}.
+    GET  /health    Model status; 503 until the model is loaded.
+    GET  /metrics   Request counts, batch sizes, p50/p99 latencies and prediction cache hits.
+
+Usage:
+    python server.py --port 8080 --max-batch-size 64 --max-delay-ms 5
+"""
+
+import argparse
+import base64
+import binascii
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from models.inference import (
+    BACKENDS,
+    DEFAULT_CACHE_SIZE,
+    DEFAULT_MODEL_PATH,
+    InferenceSession,
+    interpret_prediction,
+)
+from utils.data_processing import decode_image_bytes
+from utils.manifest import load_class_names
+from utils.preprocessing import normalize_batch
+
+DATASET_PATH = "data/processed_data/math_notation_dataset"
+MAX_BODY_BYTES = 32 * 1024 * 1024
+LATENCY_WINDOW = 10000  # Number of recent requests the latency percentiles cover
+
+
+class Overloaded(Exception):
+    """Raised when the batching queue is full."""
+
+
+class PendingRequest:
+    """Images of one request waiting in the batching queue, and their result."""
+
+    def __init__(self, images):
+        self.images = images
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.probabilities = None
+        self.error = None
+
+
+class MicroBatcher:
+    """
+    Merge concurrent prediction requests into micro-batches run by one worker thread.
+
+    A batch is started by the oldest waiting request and closed once it holds
+    max_batch_size images or max_delay seconds have passed since that request arrived.
+    Requests are never split, so a request larger than max_batch_size forms its own batch.
+
+    Every forward pass is run at exactly max_batch_size images, the batch zero-padded and
+    a larger batch run in chunks, so a model with a fixed input shape (like a TFLite
+    interpreter) is never resized between batches.
+    """
+
+    def __init__(self, predict, max_batch_size=64, max_delay=0.005, max_queue=1024):
+        """
+        Args:
+            predict (callable): Function mapping a normalized batch and the boolean mask of
+                its real images (the other rows are padding) to class probabilities, like
+                InferenceSession.predict.
+            max_batch_size (int): Maximum number of images per forward pass.
+            max_delay (float): Maximum seconds a request waits for others to join its batch.
+            max_queue (int): Maximum number of queued images before requests are rejected.
+        """
+        self.predict = predict
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.max_queue = max_queue
+
+        self.queue = deque()
+        self.queued_images = 0
+        self.condition = threading.Condition()
+        self.batch_sizes = deque(maxlen=LATENCY_WINDOW)
+        self.queue_waits = deque(maxlen=LATENCY_WINDOW)
+        self.inference_times = deque(maxlen=LATENCY_WINDOW)
+
+        self.worker = threading.Thread(
+            target=self._run, name="MicroBatcher", daemon=True
+        )
+        self.worker.start()
+
+    def submit(self, images):
+        """
+        Queue a batch of uint8 grayscale images and wait for their class probabilities.
+
+        Args:
+            images (np.ndarray): uint8 array of shape (N, 45, 45).
+
+        Returns:
+            np.ndarray: Class probabilities of shape (N, num_classes).
+
+        Raises:
+            Overloaded: If the queue is full.
+        """
+        request = PendingRequest(images)
+        with self.condition:
+            if self.queued_images + len(images) > self.max_queue and self.queue:
+                raise Overloaded()
+            self.queue.append(request)
+            self.queued_images += len(images)
+            self.condition.notify()
+
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.probabilities
+
+    def _next_batch(self):
+        """Wait for the oldest request, then collect requests until the batch closes."""
+        with self.condition:
+            while not self.queue:
+                self.condition.wait()
+            deadline = self.queue[0].enqueued_at + self.max_delay
+
+            batch = [self.queue.popleft()]
+            size = len(batch[0].images)
+            while size < self.max_batch_size:
+                if self.queue:
+                    if size + len(self.queue[0].images) > self.max_batch_size:
+                        break
+                    request = self.queue.popleft()
+                    batch.append(request)
+                    size += len(request.images)
+                    continue
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            self.queued_images -= size
+        return batch
+
+    def _predict_padded(self, batch):
+        """Run a normalized batch through the model in zero-padded chunks of max_batch_size."""
+        chunks = []
+        for start in range(0, len(batch), self.max_batch_size):
+            chunk = batch[start : start + self.max_batch_size]
+            padded = np.zeros(
+                (self.max_batch_size,) + chunk.shape[1:], dtype=chunk.dtype
+            )
+            padded[: len(chunk)] = chunk
+            valid = np.arange(self.max_batch_size) < len(chunk)
+            chunks.append(self.predict(padded, valid)[: len(chunk)])
+        return np.concatenate(chunks)
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            started = time.perf_counter()
+            try:
+                images = np.concatenate([request.images for request in batch])
+                probabilities = self._predict_padded(normalize_batch(images))
+            except Exception as error:
+                for request in batch:
+                    request.error = error
+                    request.done.set()
+                continue
+
+            finished = time.perf_counter()
+            self.batch_sizes.append(len(images))
+            self.inference_times.append(finished - started)
+            start = 0
+            for request in batch:
+                self.queue_waits.append(started - request.enqueued_at)
+                request.probabilities = probabilities[
+                    start : start + len(request.images)
+                ]
+                start += len(request.images)
+                request.done.set()
+
+
+def percentiles_ms(values):
+    """Return the p50 and p99 of durations in seconds, in milliseconds."""
+    if not values:
+        return {"p50": None, "p99": None}
+    p50, p99 = np.percentile(np.fromiter(values, dtype=np.float64), [50, 99]) * 1000
+    return {"p50": round(float(p50), 3), "p99": round(float(p99), 3)}
+
+
+class PredictionServer(ThreadingHTTPServer):
+    """HTTP server holding the inference session, batcher and request metrics."""
+
+    daemon_threads = True
+
+    def __init__(self, address, session, class_names, batcher):
+        super().__init__(address, PredictionHandler)
+        self.session = session
+        self.class_names = class_names
+        self.batcher = batcher
+        self.started_at = time.time()
+        self.metrics_lock = threading.Lock()
+        self.counters = {"requests": 0, "images": 0, "rejected": 0, "errors": 0}
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def count(self, name, amount=1):
+        with self.metrics_lock:
+            self.counters[name] += amount
+
+    def metrics(self):
+        """Return the metrics served at /metrics."""
+        with self.metrics_lock:
+            counters = dict(self.counters)
+            latencies = list(self.latencies)
+        batch_sizes = list(self.batcher.batch_sizes)
+        return {
+            **counters,
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "queued_images": self.batcher.queued_images,
+            "batches": len(batch_sizes),
+            "mean_batch_size": (
+                round(float(np.mean(batch_sizes)), 2) if batch_sizes else None
+            ),
+            "latency_ms": percentiles_ms(latencies),
+            "queue_wait_ms": percentiles_ms(list(self.batcher.queue_waits)),
+            "inference_ms": percentiles_ms(list(self.batcher.inference_times)),
+            "cache": self.session.cache.stats(),
+        }
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, so clients can reuse connections
+
+    def log_message(self, format, *args):
+        pass  # One line per request would dominate the output under load
+
+    def send_json(self, status, payload, headers=()):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            session = self.server.session
+            if session.is_ready():
+                status, state = 200, "ok"
+            elif session.load_error is not None:
+                status, state = 503, "error"
+            else:
+                status, state = 503, "loading"
+            self.send_json(
+                status,
+                {
+                    "status": state,
+                    "model": session.model_path,
+                    "error": (
+                        None if session.load_error is None else str(session.load_error)
+                    ),
+                    "queued_images": self.server.batcher.queued_images,
+                },
+            )
+        elif self.path == "/metrics":
+            self.send_json(200, self.server.metrics())
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/predict":
+            self.send_json(404, {"error": "not found"})
+            return
+
+        start = time.perf_counter()
+        length = int(self.headers.get("Content-Length", 0))
+        if length > MAX_BODY_BYTES:
+            self.send_json(413, {"error": "request body too large"})
+            self.close_connection = True
+            return
+        body = self.rfile.read(length)
+
+        if not self.server.session.is_ready():
+            self.server.count("rejected")
+            self.send_json(
+                503, {"error": "model not ready"}, headers=[("Retry-After", "1")]
+            )
+            return
+
+        try:
+            images = self.decode_images(body)
+        except ValueError as error:
+            self.server.count("errors")
+            self.send_json(400, {"error": str(error)})
+            return
+
+        try:
+            probabilities = self.server.batcher.submit(images)
+        except Overloaded:
+            self.server.count("rejected")
+            self.send_json(503, {"error": "overloaded"}, headers=[("Retry-After", "1")])
+            return
+        except Exception as error:
+            self.server.count("errors")
+            self.send_json(500, {"error": f"prediction failed: {error}"})
+            return
+
+        predictions = [
+            interpret_prediction(row, self.server.class_names) for row in probabilities
+        ]
+        self.send_json(200, {"predictions": predictions})
+
+        self.server.count("requests")
+        self.server.count("images", len(images))
+        with self.server.metrics_lock:
+            self.server.latencies.append(time.perf_counter() - start)
+
+    def decode_images(self, body):
+        """Decode a raw image body, or a JSON body with base64-encoded images."""
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            try:
+                payload = json.loads(body)
+                encoded = (
+                    payload["images"] if "images" in payload else [payload["image"]]
+                )
+                files = [base64.b64decode(item, validate=True) for item in encoded]
+            except (ValueError, KeyError, TypeError, binascii.Error):
+                raise ValueError(
+                    'expected JSON {"images": [base64, ...]} or {"image": base64}'
+                )
+        else:
+            files = [body]
+        if not files:
+            raise ValueError("no images in request")
+
+        images = []
+        for i, data in enumerate(files):
+            image = decode_image_bytes(data)
+            if image is None:
+                raise ValueError(f"image {i} could not be decoded")
+            images.append(image)
+        return np.stack(images)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve predictions over HTTP with one resident model."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument(
+        "--backend", choices=BACKENDS, help="Default: from the model file extension"
+    )
+    parser.add_argument("--dataset", default=DATASET_PATH, help="For the class names")
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-delay-ms", type=float, default=5.0)
+    parser.add_argument("--max-queue", type=int, default=1024)
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_CACHE_SIZE,
+        help="Predictions cached per image content (0 disables the cache)",
+    )
+    args = parser.parse_args()
+
+    class_names = load_class_names(args.dataset)
+    session = InferenceSession(
+        args.model, backend=args.backend, cache_size=args.cache_size
+    )
+    session.start()  # /health reports "loading" until the model is ready
+
+    batcher = MicroBatcher(
+        session.predict,
+        max_batch_size=args.max_batch_size,
+        max_delay=args.max_delay_ms / 1000,
+        max_queue=args.max_queue,
+    )
+    server = PredictionServer((args.host, args.port), session, class_names, batcher)
+    print(f"Serving predictions on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,19 @@
-from PyQt5.QtGui import QPainter, QImage, QPen, QColor
-from PyQt5.QtCore import Qt, QPoint, QRect, QSize
+from PyQt5.QtGui import QPainter, QImage, QPen, QColor, QPolygon
+from PyQt5.QtCore import Qt, QPoint, QRect, QSize, QTimer, pyqtSignal
 from PyQt5.QtWidgets import QWidget
 
+from ui.undo_history import TileUndoHistory
+from utils.strokes import CLEAR, REDO, STROKE, UNDO, StrokeModel
+
+GROWTH_FACTOR = 1.5  # The backing image grows at least by this factor when enlarged
+
 
 class CanvasWidget(QWidget):
+    strokeStarted = pyqtSignal()  # Emitted when the user starts drawing a stroke
+    drawingChanged = (
+        pyqtSignal()
+    )  # Emitted when a stroke, undo, redo or clear completes
+
     def __init__(self, class_names, parent=None):
         super().__init__(parent)
         self.initUI()
@@ -18,19 +28,30 @@ class CanvasWidget(QWidget):
         self.last_point = QPoint()  # Last drawn point
         self.pen_color = QColor(Qt.black)  # Default pen color
         self.pen_width = 5  # Default pen width
-        self.undo_stack = []  # Stack to hold undo actions
-        self.redo_stack = []  # Stack to hold redo actions
+        self.update_pen()
+        self.history = TileUndoHistory()  # Tile-based undo/redo history
+        self.stroke_model = StrokeModel()  # Vector record of the strokes
+        self.coalesce_moves = True  # Draw mouse moves once per frame, not per event
+        self.pending_points = []  # Mouse positions not drawn yet
+        self.stroke_painter = None  # Painter kept open on the image during a stroke
 
     def paintEvent(self, event):
-        """Paint event handler."""
+        """Paint event handler; repaints only the exposed part of the canvas."""
+        self.flush_pending()
+        rect = event.rect()
         canvas_painter = QPainter(self)
-        canvas_painter.drawImage(self.rect(), self.image, self.image.rect())
+        canvas_painter.drawImage(rect, self.image, rect)
 
     def resizeEvent(self, event):
         """Resize event handler to resize the canvas image."""
         if self.width() > self.image.width() or self.height() > self.image.height():
-            new_width = max(self.width(), self.image.width())
-            new_height = max(self.height(), self.image.height())
+            # Grow geometrically, in whole tiles, so that dragging the window larger
+            # does not reallocate and copy the image on every resize step
+            tile = self.history.tile_size
+            new_width = max(self.width(), int(self.image.width() * GROWTH_FACTOR))
+            new_height = max(self.height(), int(self.image.height() * GROWTH_FACTOR))
+            new_width = -(-new_width // tile) * tile
+            new_height = -(-new_height // tile) * tile
             self.resize_image(self.image, QSize(new_width, new_height))
             self.update()
         super().resizeEvent(event)
@@ -38,82 +59,204 @@ class CanvasWidget(QWidget):
     def mousePressEvent(self, event):
         """Mouse press event handler."""
         if event.button() == Qt.LeftButton:
-            self.drawing = True
-            self.last_point = event.pos()
+            self.begin_stroke(event.pos())
 
     def mouseMoveEvent(self, event):
         """Mouse move event handler."""
         if event.buttons() & Qt.LeftButton and self.drawing:
-            self.draw_line_to(event.pos())
+            if self.coalesce_moves:
+                self.queue_point(event.pos())
+            else:
+                self.draw_line_to(event.pos())
 
     def mouseReleaseEvent(self, event):
         """Mouse release event handler."""
         if event.button() == Qt.LeftButton:
-            self.draw_line_to(event.pos())
-            self.drawing = False
-            self.save_snapshot()
+            self.end_stroke(event.pos())
+
+    def begin_stroke(self, point):
+        """Start a stroke at the given point."""
+        self.drawing = True
+        self.last_point = QPoint(point)
+        self.pending_points = []
+        self.history.begin_action()
+        self.begin_painting()
+        self.stroke_model.begin_stroke(
+            point.x(), point.y(), self.pen_width, self.pen_color.rgba()
+        )
+        self.strokeStarted.emit()
+
+    def end_stroke(self, point):
+        """Finish the stroke at the given point."""
+        self.draw_line_to(point)
+        self.end_painting()
+        self.drawing = False
+        self.save_snapshot()
+        self.drawingChanged.emit()
+
+    def finish_stroke(self):
+        """End a stroke still in progress, e.g. before an undo or clear."""
+        if self.drawing:
+            self.flush_pending()
+            self.end_stroke(self.last_point)
+
+    def begin_painting(self):
+        """Open the painter used on the image for the rest of the stroke."""
+        self.stroke_painter = QPainter(self.image)
+        self.stroke_painter.setPen(self.pen)
+
+    def end_painting(self):
+        """Close the painter of the current stroke."""
+        if self.stroke_painter is not None:
+            self.stroke_painter.end()
+            self.stroke_painter = None
+
+    def queue_point(self, point):
+        """Queue a mouse position; queued positions are drawn together once per frame."""
+        self.stroke_model.add_point(point.x(), point.y())
+        if not self.pending_points:
+            # Runs after the input events already waiting in the event loop
+            QTimer.singleShot(0, self.flush_pending)
+        self.pending_points.append(QPoint(point))
+
+    def flush_pending(self):
+        """Draw the queued mouse positions as one polyline."""
+        if not self.pending_points:
+            return
+        polygon = QPolygon([self.last_point] + self.pending_points)
+        self.last_point = self.pending_points[-1]
+        self.pending_points = []
+
+        dirty_rect = polygon.boundingRect().adjusted(
+            -self.pen_width, -self.pen_width, self.pen_width, self.pen_width
+        )
+        self.history.before_paint(self.image, dirty_rect)
+        self.paint(lambda painter: painter.drawPolyline(polygon))
+        self.update(dirty_rect)
 
     def draw_line_to(self, end_point):
         """Draw a line from the last point to the current point."""
-        painter = QPainter(self.image)
-        painter.setPen(
-            QPen(
-                self.pen_color, self.pen_width, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin
-            )
-        )
-        painter.drawLine(self.last_point, end_point)
+        self.flush_pending()
+        dirty_rect = self.segment_rect(self.last_point, end_point)
+        self.history.before_paint(self.image, dirty_rect)
+        self.stroke_model.add_point(end_point.x(), end_point.y())
+
+        self.paint(lambda painter: painter.drawLine(self.last_point, end_point))
         # Update the area where the line was drawn for optimization
-        self.update(
-            QRect(self.last_point, end_point)
+        self.update(dirty_rect)
+        self.last_point = QPoint(end_point)
+
+    def paint(self, draw):
+        """Call draw with the stroke's painter, or a temporary one outside a stroke."""
+        if self.stroke_painter is not None:
+            draw(self.stroke_painter)
+            return
+        painter = QPainter(self.image)
+        painter.setPen(self.pen)
+        draw(painter)
+        painter.end()
+
+    def segment_rect(self, start, end):
+        """Return the region painted by a line segment with the current pen."""
+        return (
+            QRect(start, end)
             .normalized()
             .adjusted(-self.pen_width, -self.pen_width, self.pen_width, self.pen_width)
         )
-        self.last_point = QPoint(end_point)
 
     def clear_canvas(self):
         """Clear the canvas (reset to white)."""
+        self.finish_stroke()
+        self.history.begin_action()
+        self.history.before_paint(self.image, self.image.rect())
         self.image.fill(Qt.white)
+        if self.history.end_action(self.image):
+            self.stroke_model.clear()
         self.update()
+        self.drawingChanged.emit()
 
     def resize_image(self, image, new_size):
         """Resize the image maintaining its content."""
         if image.size() == new_size:
             return
+        painting = self.stroke_painter is not None
+        self.end_painting()
         new_image = QImage(new_size, QImage.Format_RGB32)
         new_image.fill(Qt.white)
         painter = QPainter(new_image)
         painter.drawImage(QPoint(0, 0), image)
+        painter.end()
         self.image = new_image
+        if painting:
+            self.begin_painting()
 
     def set_pen_color(self, color):
         """Set the pen color."""
         self.pen_color = color
+        self.update_pen()
 
     def set_pen_width(self, width):
         """Set the pen width."""
         self.pen_width = width
+        self.update_pen()
+
+    def update_pen(self):
+        """Create the pen once, rather than for every segment drawn."""
+        self.pen = QPen(
+            self.pen_color, self.pen_width, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin
+        )
 
     def undo(self):
         """Undo the last drawing action."""
-        if len(self.undo_stack) > 0:
-            last_change = self.undo_stack.pop()
-            self.redo_stack.append(self.image.copy())
-            self.image = last_change
+        self.finish_stroke()
+        if self.history.undo(self.image) is not None:
+            self.stroke_model.undo()
             self.update()
+            self.drawingChanged.emit()
 
     def redo(self):
         """Redo the last undone drawing action."""
-        if len(self.redo_stack) > 0:
-            last_change = self.redo_stack.pop()
-            self.undo_stack.append(self.image.copy())
-            self.image = last_change
+        self.finish_stroke()
+        if self.history.redo(self.image) is not None:
+            self.stroke_model.redo()
             self.update()
+            self.drawingChanged.emit()
 
     def save_snapshot(self):
-        """Save a snapshot of the current image for undo."""
-        self.undo_stack.append(self.image.copy())
-        self.redo_stack = []
+        """Record the finished stroke and the tiles it changed for undo."""
+        if self.history.end_action(self.image):
+            self.stroke_model.end_stroke()
+        else:
+            self.stroke_model.cancel_stroke()  # It changed no pixels
 
     def get_drawing(self):
         """Get the current drawing."""
+        self.flush_pending()
         return self.image
+
+    def get_strokes(self):
+        """Get a snapshot of the visible strokes, safe to hand to another thread."""
+        return list(self.stroke_model.strokes)
+
+    def replay(self, events):
+        """
+        Replay a recorded session (see utils.strokes.load_session) through the canvas.
+
+        Args:
+            events (list): Session log of (event, Stroke or None).
+        """
+        for event, stroke in events:
+            if event == STROKE:
+                self.set_pen_width(int(round(stroke.width)))
+                self.set_pen_color(QColor.fromRgba(stroke.color))
+                points = [QPoint(round(x), round(y)) for x, y in stroke.points.tolist()]
+                self.begin_stroke(points[0])
+                for point in points[1:-1]:
+                    self.draw_line_to(point)
+                self.end_stroke(points[-1])
+            elif event == CLEAR:
+                self.clear_canvas()
+            elif event == UNDO:
+                self.undo()
+            elif event == REDO:
+                self.redo()
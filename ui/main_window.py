@@ -1,6 +1,5 @@
-import numpy as np
-from PIL import Image
-from tensorflow.keras.models import load_model
+import time
+from collections import deque
 from PyQt5.QtWidgets import (
     QMainWindow,
     QVBoxLayout,
@@ -9,17 +8,44 @@ from PyQt5.QtWidgets import (
     QInputDialog,
     QHBoxLayout,
     QMessageBox,
+    QLabel,
+    QCheckBox,
+    QShortcut,
+)
+from PyQt5.QtCore import Qt, QFile, QThread, QTimer, pyqtSignal
+from PyQt5.QtGui import QKeySequence
+from models.inference import (
+    DEFAULT_CACHE_SIZE,
+    DEFAULT_MODEL_PATH,
+    InferenceSession,
+    interpret_prediction,
 )
-from PyQt5.QtCore import Qt, QFile
 from ui.canvas_widget import CanvasWidget
-from utils.data_processing import preprocess_image
+from ui.performance_overlay import PerformanceOverlay
+from ui.prediction_worker import PredictionWorker
+from utils import profiling
+from utils.manifest import load_class_names
+from utils.strokes import strokes_to_model_input
+
+DATASET_PATH = "data/processed_data/math_notation_dataset"
+LIVE_DEBOUNCE_MS = 250  # Quiet time after a stroke before live recognition runs
 
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    # id, kind, payload, time of the triggering input
+    predictionRequested = pyqtSignal(int, str, object, float)
+
+    def __init__(
+        self, model_path=DEFAULT_MODEL_PATH, dataset_path=DATASET_PATH, backend=None
+    ):
         super().__init__()
+        self.model_path = model_path
+        self.dataset_path = dataset_path
+        self.backend = backend
         self.setGeometry(100, 100, 800, 600)
         self.initUI()
+        self.setupInferenceSession()
+        self.setupPredictionWorker()
 
     def initUI(self):
         """Initialize the user interface."""
@@ -30,6 +56,8 @@ class MainWindow(QMainWindow):
         self.loadClassNames()
         self.setupCanvas()
         self.setupButtons()
+        self.setupLivePanel()
+        self.setupPerformanceOverlay()
         self.loadStylesheet()
 
     def setupLayout(self):
@@ -37,11 +65,8 @@ class MainWindow(QMainWindow):
         self.layout = QVBoxLayout(self.central_widget)
 
     def loadClassNames(self):
-        """Load class names from processed dataset."""
-        data = np.load(
-            "data/processed_data/math_notation_dataset.npz", allow_pickle=True
-        )
-        self.class_names = data["class_names"]
+        """Load class names from the processed dataset's manifest."""
+        self.class_names = load_class_names(self.dataset_path)
 
     def setupCanvas(self):
         """Setup the drawing canvas."""
@@ -57,9 +82,15 @@ class MainWindow(QMainWindow):
         self.setupButton("Undo", self.canvas.undo, button_layout)
         self.setupButton("Redo", self.canvas.redo, button_layout)
         self.setupButton("Predict", self.predictDrawing, button_layout)
+        self.setupButton("Predict Expression", self.predictExpression, button_layout)
 
         self.layout.addLayout(button_layout)
 
+    def setupPerformanceOverlay(self):
+        """Setup the overlay of profiling span timings, toggled with F12."""
+        self.performance_overlay = PerformanceOverlay(self.canvas)
+        QShortcut(QKeySequence(Qt.Key_F12), self, self.performance_overlay.toggle)
+
     def setupButton(self, text, on_clicked, layout):
         """Setup a button with the given text, clicked function, and layout."""
         button = QPushButton(text)
@@ -74,6 +105,52 @@ class MainWindow(QMainWindow):
         if ok:
             self.canvas.set_pen_width(size)
 
+    def setupInferenceSession(self):
+        """Load and warm up the model in the background once the window has been shown."""
+        self.inference_session = InferenceSession(
+            self.model_path, backend=self.backend, cache_size=DEFAULT_CACHE_SIZE
+        )
+        # Deferring to the event loop keeps TensorFlow off the path to the first paint
+        QTimer.singleShot(0, self.inference_session.start)
+
+    def setupLivePanel(self):
+        """Setup the non-modal panel that shows live recognition results."""
+        panel_layout = QHBoxLayout()
+
+        self.live_checkbox = QCheckBox("Live Recognition")
+        self.live_checkbox.toggled.connect(self.onLiveRecognitionToggled)
+        panel_layout.addWidget(self.live_checkbox)
+
+        self.live_label = QLabel()
+        self.live_label.setTextFormat(Qt.RichText)
+        panel_layout.addWidget(self.live_label, 1)
+
+        self.layout.addLayout(panel_layout)
+
+    def setupPredictionWorker(self):
+        """Run predictions on a worker thread so the event loop never blocks on them."""
+        self.request_counter = 0
+        self.live_changed_at = 0.0
+        self.live_latencies = deque(maxlen=100)
+
+        self.prediction_thread = QThread(self)
+        self.prediction_worker = PredictionWorker(
+            self.inference_session, self.class_names
+        )
+        self.prediction_worker.moveToThread(self.prediction_thread)
+        self.predictionRequested.connect(self.prediction_worker.process)
+        self.prediction_worker.resultReady.connect(self.onPredictionReady)
+        self.prediction_worker.predictionFailed.connect(self.onPredictionFailed)
+        self.prediction_thread.start()
+
+        # Live requests are debounced so that only a pause in drawing triggers one
+        self.live_timer = QTimer(self)
+        self.live_timer.setSingleShot(True)
+        self.live_timer.setInterval(LIVE_DEBOUNCE_MS)
+        self.live_timer.timeout.connect(self.requestLivePrediction)
+        self.canvas.drawingChanged.connect(self.scheduleLivePrediction)
+        self.canvas.strokeStarted.connect(self.cancelLivePrediction)
+
     def loadStylesheet(self):
         """Load and apply the stylesheet to the main window."""
         style_file = QFile("ui/resources/styles/stylesheet.qss")
@@ -81,59 +158,192 @@ class MainWindow(QMainWindow):
         stylesheet = bytes(style_file.readAll()).decode("utf-8")
         self.setStyleSheet(stylesheet)
 
+    def ensureModelReady(self):
+        """Return True if the model is ready, otherwise tell the user why not."""
+        if self.inference_session.is_ready():
+            return True
+
+        message = "The model is still loading, please try again in a moment."
+        if self.inference_session.load_error is not None:
+            message = (
+                f"The model could not be loaded: {self.inference_session.load_error}"
+            )
+            self.inference_session.start()  # Retry in the background
+        QMessageBox.information(self, "Prediction", message)
+        return False
+
     def predictDrawing(self):
         """Predict the drawing on the canvas."""
-        drawing = self.canvas.get_drawing()
+        with profiling.span("predict.flush_canvas"):
+            drawing = self.canvas.get_drawing()
+
+        if not self.ensureModelReady():
+            return
 
         if drawing is not None:
-            img = self.qimageToPil(drawing).convert("RGB")
-            img_resized = img.resize((45, 45))
-            img_array = preprocess_image(img_resized)
-
-            model = load_model("models/saved_models/trained_model.h5")
-            prediction = model.predict(img_array)
-            class_index = np.argmax(prediction)
-
-            if class_index < len(self.class_names):
-                class_name = self.class_names[class_index]
-                confidence = prediction[0, class_index] * 100
-
-                if confidence >= 60:
-                    if confidence >= 90:
-                        confidence_color = "green"
-                    elif confidence >= 80:
-                        confidence_color = "yellow"
-                    else:
-                        confidence_color = "red"
-
-                    # Create the message with styled HTML text for prediction
-                    message = f"<p><b>Predicted Class:</b> {class_name}</p>"
-                    message += f"<p><b>Accuracy:</b> <font color='{confidence_color}'>{confidence:.2f}%</font></p>"
-
-                    # Create QMessageBox with HTML content
-                    msg_box = QMessageBox()
-                    msg_box.setWindowTitle("Prediction")
-                    msg_box.setTextFormat(Qt.RichText)
-                    msg_box.setText(message)
-                    msg_box.exec_()
+            # Rasterize the visible canvas straight at the model input size
+            with profiling.span("predict.rasterize"):
+                model_input = strokes_to_model_input(
+                    self.canvas.get_strokes(),
+                    (self.canvas.width(), self.canvas.height()),
+                )
+            self.submitPrediction("symbol", model_input)
+
+    def predictExpression(self):
+        """Recognize every symbol on the canvas with one batched prediction."""
+        if not self.ensureModelReady():
+            return
+
+        self.submitPrediction("expression", self.canvas.get_strokes())
+
+    def submitPrediction(self, kind, payload):
+        """Send a prediction request to the worker thread."""
+        self.request_counter += 1
+        self.predictionRequested.emit(
+            self.request_counter, kind, payload, time.perf_counter()
+        )
+
+    def onLiveRecognitionToggled(self, checked):
+        """Start or stop live recognition."""
+        if checked:
+            self.scheduleLivePrediction()
+        else:
+            self.cancelLivePrediction()
+            self.live_label.clear()
+
+    def scheduleLivePrediction(self):
+        """(Re)start the debounce timer after the drawing changed."""
+        if self.live_checkbox.isChecked():
+            self.live_changed_at = time.perf_counter()
+            self.live_timer.start()
+
+    def cancelLivePrediction(self):
+        """Cancel pending and in-flight live requests, e.g. when a new stroke starts."""
+        self.live_timer.stop()
+        self.request_counter += 1
+        self.prediction_worker.latest_live_request = self.request_counter
+
+    def requestLivePrediction(self):
+        """Send the current drawing to the worker for live recognition."""
+        if not self.inference_session.is_ready():
+            if self.inference_session.load_error is None:
+                self.live_label.setText("Loading model...")
+                self.live_timer.start()  # Try again once the model is ready
+            else:
+                self.live_label.setText("The model could not be loaded.")
+            return
+
+        self.cancelLivePrediction()
+        self.predictionRequested.emit(
+            self.request_counter,
+            "live",
+            self.canvas.get_strokes(),
+            self.live_changed_at,
+        )
+
+    def onPredictionReady(self, request_id, kind, result, latency):
+        """Show a prediction result delivered by the worker thread."""
+        if kind == "symbol":
+            self.showPrediction(result)
+        elif kind == "expression":
+            self.showExpression(result)
+        elif not self.prediction_worker.is_stale(request_id, kind):
+            self.showLiveResult(result, latency)
+
+    def onPredictionFailed(self, kind, message):
+        """Report a prediction that failed on the worker thread."""
+        if kind == "live":
+            self.live_label.setText(f"Prediction failed: {message}")
+        else:
+            QMessageBox.warning(self, "Prediction", f"Prediction failed: {message}")
+
+    def showLiveResult(self, symbols, latency):
+        """Show live recognition results and input-to-result latency in the panel."""
+        self.live_latencies.append(latency)
+        worst = max(self.live_latencies)
+        timing = f"<font color='gray'>{latency * 1000:.0f} ms (max {worst * 1000:.0f} ms)</font>"
+
+        if not symbols:
+            self.live_label.setText(timing)
+            return
+
+        expression = " ".join(symbol["class_name"] for symbol in symbols)
+        confidence = min(symbol["confidence"] for symbol in symbols)
+        self.live_label.setText(
+            f"<b>{expression}</b> &nbsp; {confidence:.0f}% &nbsp; {timing}"
+        )
+
+    def showPrediction(self, prediction):
+        """Show the prediction for the whole canvas."""
+        result = interpret_prediction(prediction[0], self.class_names)
+
+        if result["class_name"] is not None:
+            class_name = result["class_name"]
+            confidence = result["confidence"]
+
+            if result["reliable"]:
+                if confidence >= 90:
+                    confidence_color = "green"
+                elif confidence >= 80:
+                    confidence_color = "yellow"
                 else:
-                    # Low confidence warning message
-                    warning_message = "The prediction confidence is too low to make a reliable prediction."
-
-                    # Create QMessageBox for low confidence warning
-                    msg_box = QMessageBox()
-                    msg_box.setWindowTitle("Low Confidence Warning")
-                    msg_box.setIcon(QMessageBox.Warning)
-                    msg_box.setText(warning_message)
-                    msg_box.setStandardButtons(QMessageBox.Ok)
-                    msg_box.exec_()
+                    confidence_color = "red"
+
+                # Create the message with styled HTML text for prediction
+                message = f"<p><b>Predicted Class:</b> {class_name}</p>"
+                message += f"<p><b>Accuracy:</b> <font color='{confidence_color}'>{confidence:.2f}%</font></p>"
+
+                # Create QMessageBox with HTML content
+                msg_box = QMessageBox()
+                msg_box.setWindowTitle("Prediction")
+                msg_box.setTextFormat(Qt.RichText)
+                msg_box.setText(message)
+                msg_box.exec_()
             else:
-                QMessageBox.warning(self, "Prediction", "Invalid class index")
-
-    def qimageToPil(self, qimage):
-        """Convert QImage to PIL Image."""
-        width, height = qimage.width(), qimage.height()
-        image_data = qimage.bits().asstring(width * height * 4)
-        image = np.frombuffer(image_data, dtype=np.uint8).reshape((height, width, 4))
-        image_pil = Image.fromarray(image)
-        return image_pil
+                # Low confidence warning message
+                warning_message = "The prediction confidence is too low to make a reliable prediction."
+
+                # Create QMessageBox for low confidence warning
+                msg_box = QMessageBox()
+                msg_box.setWindowTitle("Low Confidence Warning")
+                msg_box.setIcon(QMessageBox.Warning)
+                msg_box.setText(warning_message)
+                msg_box.setStandardButtons(QMessageBox.Ok)
+                msg_box.exec_()
+        else:
+            QMessageBox.warning(self, "Prediction", "Invalid class index")
+
+    def showExpression(self, symbols):
+        """Show the recognized expression with per-symbol confidences."""
+        if not symbols:
+            QMessageBox.information(self, "Expression", "The canvas is empty.")
+            return
+
+        expression = " ".join(symbol["class_name"] for symbol in symbols)
+        message = f"<p><b>Predicted Expression:</b> {expression}</p><table>"
+        for symbol in symbols:
+            confidence = symbol["confidence"]
+            if confidence >= 90:
+                confidence_color = "green"
+            elif confidence >= 80:
+                confidence_color = "yellow"
+            else:
+                confidence_color = "red"
+            message += (
+                f"<tr><td>{symbol['class_name']}</td>"
+                f"<td><font color='{confidence_color}'>{confidence:.2f}%</font></td></tr>"
+            )
+        message += "</table>"
+
+        msg_box = QMessageBox()
+        msg_box.setWindowTitle("Expression")
+        msg_box.setTextFormat(Qt.RichText)
+        msg_box.setText(message)
+        msg_box.exec_()
+
+    def closeEvent(self, event):
+        """Stop the prediction worker thread when the window closes."""
+        self.cancelLivePrediction()
+        self.prediction_thread.quit()
+        self.prediction_thread.wait()
+        super().closeEvent(event)
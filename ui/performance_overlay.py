@@ -0,0 +1,70 @@
+import time
+
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtWidgets import QLabel
+
+from utils import profiling
+
+REFRESH_MS = 500
+WINDOW_SECONDS = 60  # Spans older than this are left out of the overlay
+
+
+class PerformanceOverlay(QLabel):
+    """
+    Translucent panel drawn over a widget, listing the recent timing of each profiling span.
+
+    Showing the overlay turns profiling on; it stays on when the overlay is hidden so that
+    a trace export still covers the whole session. Mouse events pass through to the
+    widget below, so drawing is not interrupted.
+    """
+
+    def __init__(self, parent):
+        """
+        Args:
+            parent (QWidget): Widget the overlay is drawn over, in its top right corner.
+        """
+        super().__init__(parent)
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.setTextFormat(Qt.RichText)
+        self.setStyleSheet(
+            "background-color: rgba(0, 0, 0, 170); color: white; padding: 6px;"
+            "font-family: monospace; font-size: 11px;"
+        )
+        self.hide()
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(REFRESH_MS)
+        self.timer.timeout.connect(self.refresh)
+
+    def toggle(self):
+        """Show or hide the overlay."""
+        if self.isVisible():
+            self.timer.stop()
+            self.hide()
+            return
+
+        profiling.enable()
+        self.refresh()
+        self.show()
+        self.raise_()
+        self.timer.start()
+
+    def refresh(self):
+        """Update the table of spans and keep the overlay in the corner of its parent."""
+        stats = profiling.summary(since=time.perf_counter() - WINDOW_SECONDS)
+        rows = "".join(
+            f"<tr><td>{name}</td><td align='right'>{s['count']}</td>"
+            f"<td align='right'>{s['last_ms']:.1f}</td>"
+            f"<td align='right'>{s['p50_ms']:.1f}</td>"
+            f"<td align='right'>{s['p95_ms']:.1f}</td></tr>"
+            for name, s in stats.items()
+        )
+        if not rows:
+            rows = "<tr><td colspan='5'>No spans yet: draw and predict</td></tr>"
+        self.setText(
+            f"<b>Last {WINDOW_SECONDS}s (ms)</b><table cellspacing='4'>"
+            "<tr><th align='left'>span</th><th>n</th><th>last</th><th>p50</th>"
+            f"<th>p95</th></tr>{rows}</table>"
+        )
+        self.adjustSize()
+        self.move(self.parentWidget().width() - self.width() - 8, 8)
@@ -0,0 +1,71 @@
+import time
+
+from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot
+
+from utils import profiling
+from utils.strokes import recognize_strokes
+
+
+class PredictionWorker(QObject):
+    """
+    Runs predictions on a worker thread so the GUI event loop never blocks on TensorFlow.
+
+    Requests arrive through the process slot (connected with a queued connection from the
+    GUI thread). Live requests carry an increasing id; a live request that has been
+    superseded by a newer one is dropped before and after inference, so stale results never
+    reach the GUI.
+    """
+
+    resultReady = pyqtSignal(int, str, object, float)  # id, kind, result, latency (s)
+    predictionFailed = pyqtSignal(str, str)  # kind, error message
+
+    def __init__(self, session, class_names):
+        super().__init__()
+        self.session = session
+        self.class_names = class_names
+        self.latest_live_request = 0  # Written by the GUI thread
+
+    def is_stale(self, request_id, kind):
+        """Return True if a live request has been superseded by a newer one."""
+        return kind == "live" and request_id < self.latest_live_request
+
+    @pyqtSlot(int, str, object, float)
+    def process(self, request_id, kind, payload, requested_at):
+        """
+        Run one prediction request.
+
+        Args:
+            request_id (int): Id of the request.
+            kind (str): "symbol" for a normalized batch, "expression" or "live" for the
+                strokes of the canvas to segment and recognize.
+            payload (np.ndarray or list): Input of the request.
+            requested_at (float): time.perf_counter() timestamp of the user input that
+                triggered the request, used to measure input-to-result latency.
+        """
+        if self.is_stale(request_id, kind):
+            return
+        # From the triggering input (for live requests, the end of the debounce pause is
+        # included) until the worker picks the request up
+        started = time.perf_counter()
+        profiling.record(
+            "predict.wait", requested_at, started - requested_at, kind=kind
+        )
+
+        try:
+            if kind == "symbol":
+                result = self.session.predict(payload)
+            else:
+                result = recognize_strokes(
+                    self.session.predict, payload, self.class_names
+                )
+        except Exception as error:
+            self.predictionFailed.emit(kind, str(error))
+            return
+
+        if self.is_stale(request_id, kind):
+            return
+        finished = time.perf_counter()
+        profiling.record(
+            "predict.total", requested_at, finished - requested_at, kind=kind
+        )
+        self.resultReady.emit(request_id, kind, result, finished - requested_at)
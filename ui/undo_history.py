@@ -0,0 +1,139 @@
+from collections import deque
+
+from PyQt5.QtCore import QPoint, QRect
+from PyQt5.QtGui import QPainter
+
+DEFAULT_TILE_SIZE = 64
+DEFAULT_MEMORY_BUDGET = 64 * 1024 * 1024  # Bytes of tile data kept for undo/redo
+
+
+class TileUndoHistory:
+    """
+    Undo/redo history that stores only the canvas tiles touched by each action.
+
+    While an action (a stroke) is in progress, every tile is copied once, just before it
+    is first painted on. When the action ends, the same tiles are copied again, so that
+    undo restores the "before" tiles and redo the "after" tiles. Applying either costs time
+    proportional to the number of tiles touched, not to the canvas size. Recorded actions
+    are evicted oldest-first once their tiles exceed the memory budget.
+    """
+
+    def __init__(
+        self, memory_budget=DEFAULT_MEMORY_BUDGET, tile_size=DEFAULT_TILE_SIZE
+    ):
+        self.memory_budget = memory_budget
+        self.tile_size = tile_size
+        self.undo_stack = deque()
+        self.redo_stack = deque()
+        self.memory_used = 0
+        self._before = None  # Tile origin -> tile copy of the action in progress
+
+    def begin_action(self):
+        """Start recording an action."""
+        self._before = {}
+
+    def before_paint(self, image, rect):
+        """
+        Record the tiles of a region before it is painted on.
+
+        Args:
+            image (QImage): The canvas image, not yet modified in rect.
+            rect (QRect): Region about to be painted on.
+        """
+        if self._before is None:
+            return
+        rect = rect.intersected(image.rect())
+        if rect.isEmpty():
+            return
+
+        size = self.tile_size
+        for y in range(rect.top() // size * size, rect.bottom() + 1, size):
+            for x in range(rect.left() // size * size, rect.right() + 1, size):
+                if (x, y) not in self._before:
+                    tile_rect = QRect(x, y, size, size).intersected(image.rect())
+                    self._before[(x, y)] = image.copy(tile_rect)
+
+    def end_action(self, image):
+        """
+        Finish recording an action and push it onto the undo stack.
+
+        Args:
+            image (QImage): The canvas image after the action.
+
+        Returns:
+            bool: True if the action changed any pixels and was recorded.
+        """
+        before, self._before = self._before, None
+        if not before:
+            return False
+
+        tiles = []
+        size = 0
+        for (x, y), before_tile in before.items():
+            after_tile = image.copy(QRect(QPoint(x, y), before_tile.size()))
+            if after_tile == before_tile:
+                continue  # E.g. clearing tiles that were already blank
+            tiles.append((QPoint(x, y), before_tile, after_tile))
+            size += before_tile.byteCount() + after_tile.byteCount()
+        if not tiles:
+            return False
+
+        self._drop(self.redo_stack, len(self.redo_stack))
+        self.undo_stack.append((tiles, size))
+        self.memory_used += size
+        self._evict()
+        return True
+
+    def undo(self, image):
+        """
+        Revert the last recorded action.
+
+        Args:
+            image (QImage): The canvas image to modify.
+
+        Returns:
+            QRect: The region that changed, or None if there was nothing to undo.
+        """
+        if not self.undo_stack:
+            return None
+        action = self.undo_stack.pop()
+        self.redo_stack.append(action)
+        return self._apply(image, action[0], 1)
+
+    def redo(self, image):
+        """
+        Re-apply the last undone action.
+
+        Args:
+            image (QImage): The canvas image to modify.
+
+        Returns:
+            QRect: The region that changed, or None if there was nothing to redo.
+        """
+        if not self.redo_stack:
+            return None
+        action = self.redo_stack.pop()
+        self.undo_stack.append(action)
+        return self._apply(image, action[0], 2)
+
+    def _apply(self, image, tiles, which):
+        """Paint the before (which=1) or after (which=2) tiles of an action into image."""
+        painter = QPainter(image)
+        painter.setCompositionMode(QPainter.CompositionMode_Source)
+        changed = QRect()
+        for tile in tiles:
+            painter.drawImage(tile[0], tile[which])
+            changed = changed.united(QRect(tile[0], tile[which].size()))
+        painter.end()
+        return changed
+
+    def _drop(self, stack, count):
+        """Remove count actions from the bottom (oldest end) of a stack."""
+        for _ in range(count):
+            _, size = stack.popleft()
+            self.memory_used -= size
+
+    def _evict(self):
+        """Evict the oldest actions until the history fits in its memory budget."""
+        while self.memory_used > self.memory_budget and len(self.undo_stack) > 1:
+            self._drop(self.undo_stack, 1)
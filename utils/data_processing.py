@@ -1,36 +1,227 @@
+import json
 import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import cv2
 import numpy as np
-from sklearn.model_selection import train_test_split
+from utils import profiling
+from utils.dataset_store import (
+    DEFAULT_SHARD_SIZE,
+    INDEX_FILENAME,
+    SPLITS,
+    update_sharded_dataset,
+    write_sharded_dataset,
+)
+from utils.dedup import (
+    DEFAULT_MAX_DISTANCE,
+    find_duplicate_groups,
+    first_of_each_group,
+    groups_across_splits,
+)
+from utils.manifest import manifest_path_for, write_manifest
+from utils.preprocessing import gray_to_model_input, resize_to_model
+from utils.source_manifest import (
+    SAMPLES_FILENAME,
+    SOURCE_MANIFEST_FILENAME,
+    assign_split,
+    content_hash,
+    load_source_manifest,
+    save_source_manifest,
+    shard_position,
+)
 
+IMAGE_SIZE = (45, 45)  # (height, width) of the dataset images
+DEDUP_MODES = ("group", "drop")
+DEDUP_REPORT_FILENAME = "dedup_report.json"
 
-def load_images_from_folder(folder):
+
+def list_image_files(folder):
     """
-    Load images and their corresponding labels from a folder structure where each subfolder represents a class.
+    List image files and their labels from a folder structure where each subfolder represents a class.
 
     Args:
         folder (str): Path to the root folder containing subfolders of class images.
 
     Returns:
         tuple: A tuple containing:
-            - images (list): List of loaded images.
-            - labels (list): List of labels corresponding to each image.
+            - paths (list): Paths of all image files.
+            - labels (np.ndarray): Label of each image file.
             - class_names (list): List of class names (subfolder names).
     """
-    images = []
+    paths = []
     labels = []
     class_names = sorted(
-        os.listdir(folder)
+        name for name in os.listdir(folder) if os.path.isdir(os.path.join(folder, name))
     )  # Assuming folder names are the class names
 
     for idx, class_name in enumerate(class_names):
         class_folder = os.path.join(folder, class_name)
-        for filename in os.listdir(class_folder):
-            img_path = os.path.join(class_folder, filename)
-            img = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)  # Load as grayscale
-            if img is not None:
-                images.append(img)
-                labels.append(idx)  # Assign label based on class index
+        for filename in sorted(os.listdir(class_folder)):
+            paths.append(os.path.join(class_folder, filename))
+            labels.append(idx)  # Assign label based on class index
+
+    return paths, np.array(labels, dtype=np.int64), class_names
+
+
+def _decode_chunk(paths, images, valid, start, stop):
+    """
+    Decode a contiguous chunk of image files into a preallocated array.
+
+    Args:
+        paths (list): Paths of all image files.
+        images (np.ndarray): Preallocated uint8 array of shape (N, height, width) to decode into.
+        valid (np.ndarray): Boolean array marking which rows were decoded successfully.
+        start (int): Index of the first image of the chunk.
+        stop (int): Index one past the last image of the chunk.
+
+    Returns:
+        tuple: (number of images processed, number of images that were resized)
+    """
+    height, width = images.shape[1:]
+    resized = 0
+    for i in range(start, stop):
+        img = cv2.imread(paths[i], cv2.IMREAD_GRAYSCALE)  # Load as grayscale
+        if img is None:
+            continue
+        if img.shape != (height, width):
+            img = resize_to_model(img, (height, width))
+            resized += 1
+        images[i] = img
+        valid[i] = True
+    return stop - start, resized
+
+
+def decode_image_bytes(data, image_size=IMAGE_SIZE):
+    """
+    Decode an encoded image (e.g. read from an archive) the same way as the training data.
+
+    Args:
+        data (bytes): Encoded image file contents.
+        image_size (tuple): (height, width) of the output.
+
+    Returns:
+        np.ndarray: uint8 grayscale array of shape image_size, or None if it cannot be decoded.
+    """
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        return None
+    return resize_to_model(img, image_size)
+
+
+def print_progress(done, total, images_per_second):
+    """
+    Progress callback for load_images_from_folder that prints a single updating line.
+
+    Args:
+        done (int): Number of image files processed so far.
+        total (int): Total number of image files.
+        images_per_second (float): Decoding throughput so far.
+    """
+    end = "\n" if done == total else ""
+    print(f"\rLoaded {done}/{total} images ({images_per_second:.0f} images/s)", end=end)
+
+
+def decode_images(
+    paths, workers=None, chunk_size=256, progress_callback=None, image_size=IMAGE_SIZE
+):
+    """
+    Decode image files in parallel into one preallocated, contiguous uint8 array.
+
+    A thread pool decodes the images (OpenCV releases the GIL while decoding). Images with
+    an unexpected size are resized to image_size.
+
+    Args:
+        paths (list): Paths of the image files.
+        workers (int): Number of decoding threads. Defaults to the number of CPUs.
+        chunk_size (int): Number of images decoded per task.
+        progress_callback (callable): Optional callback(done, total, images_per_second)
+            invoked after each chunk.
+        image_size (tuple): (height, width) of the images in the returned array.
+
+    Returns:
+        tuple: A tuple containing:
+            - images (np.ndarray): uint8 array of shape (len(paths), height, width).
+            - valid (np.ndarray): Boolean array marking the images that could be decoded.
+    """
+    total = len(paths)
+    images = np.empty((total,) + tuple(image_size), dtype=np.uint8)
+    valid = np.zeros(total, dtype=bool)
+
+    start_time = time.perf_counter()
+    done = 0
+    resized = 0
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = [
+            pool.submit(
+                _decode_chunk,
+                paths,
+                images,
+                valid,
+                start,
+                min(start + chunk_size, total),
+            )
+            for start in range(0, total, chunk_size)
+        ]
+        for future in as_completed(futures):
+            processed, chunk_resized = future.result()
+            done += processed
+            resized += chunk_resized
+            if progress_callback is not None:
+                elapsed = max(time.perf_counter() - start_time, 1e-9)
+                progress_callback(done, total, done / elapsed)
+
+    if resized:
+        print(f"Resized {resized} images that were not {image_size[0]}x{image_size[1]}")
+
+    return images, valid
+
+
+def load_images_from_folder(
+    folder, workers=None, chunk_size=256, progress_callback=None, image_size=IMAGE_SIZE
+):
+    """
+    Load images and their corresponding labels from a folder structure where each subfolder represents a class.
+
+    The file list is built first, then the images are decoded in parallel straight into one
+    preallocated, contiguous uint8 array (see decode_images). Images that cannot be decoded
+    are skipped, and images with an unexpected size are resized to image_size.
+
+    Args:
+        folder (str): Path to the root folder containing subfolders of class images.
+        workers (int): Number of decoding threads. Defaults to the number of CPUs.
+        chunk_size (int): Number of images decoded per task.
+        progress_callback (callable): Optional callback(done, total, images_per_second)
+            invoked after each chunk.
+        image_size (tuple): (height, width) of the images in the returned array.
+
+    Returns:
+        tuple: A tuple containing:
+            - images (np.ndarray): uint8 array of shape (N, height, width) with the loaded images.
+            - labels (np.ndarray): Labels corresponding to each image.
+            - class_names (list): List of class names (subfolder names).
+    """
+    with profiling.span("ingest.list_files"):
+        paths, labels, class_names = list_image_files(folder)
+        total = len(paths)
+
+    with profiling.span("ingest.decode", images=total):
+        images, valid = decode_images(
+            paths, workers, chunk_size, progress_callback, image_size
+        )
+
+    # Compact the successfully decoded images in place so no second copy is made
+    num_valid = int(valid.sum())
+    if num_valid < total:
+        with profiling.span("ingest.compact", skipped=total - num_valid):
+            destination = 0
+            for i in np.flatnonzero(valid):
+                if i != destination:
+                    images[destination] = images[i]
+                destination += 1
+            images = images[:num_valid]
+            labels = labels[valid]
+        print(f"Skipped {total - num_valid} images that could not be decoded")
 
     return images, labels, class_names
 
@@ -43,77 +234,427 @@ def preprocess_image(img):
         img (PIL.Image): Input image.
 
     Returns:
-        np.ndarray: Preprocessed image as a numpy array.
+        np.ndarray: Preprocessed image as a float32 array of shape (1, 45, 45, 3).
     """
-    # Resize image to model input size (45x45) and normalize
-    img_array = np.array(img.resize((45, 45))) / 255.0
-    img_input = np.expand_dims(img_array, axis=0)
-    return img_input
+    # Same grayscale, area-downscale and normalization steps as the training data
+    return gray_to_model_input(np.asarray(img.convert("L")))
 
 
-def preprocess_dataset(dataset_folder, save_path):
+def _group_split(indices, groups, test_size, random_state=42):
+    """
+    Split indices in two so that all indices of a group end up on the same side.
+
+    Args:
+        indices (np.ndarray): Indices to split.
+        groups (np.ndarray): Group id of each index.
+        test_size (float): Fraction of the groups in the second part.
+        random_state (int): Seed of the split.
+
+    Returns:
+        Tuple of np.ndarray: (first part, second part)
+    """
+    from sklearn.model_selection import GroupShuffleSplit
+
+    splitter = GroupShuffleSplit(
+        n_splits=1, test_size=test_size, random_state=random_state
+    )
+    first, second = next(splitter.split(indices, groups=groups))
+    return indices[first], indices[second]
+
+
+def preprocess_dataset(
+    dataset_folder,
+    save_path,
+    workers=None,
+    chunk_size=256,
+    dedup=None,
+    max_distance=DEFAULT_MAX_DISTANCE,
+):
     """
     Preprocess a dataset of images, split them into training, development (validation), and test sets,
-    and save the processed data.
+    and save the processed data together with a JSON manifest (class names, input shape, dataset hash).
+    The store is replaced as a whole, so the bookkeeping of earlier incremental updates
+    (see update_dataset) is removed.
+
+    With dedup, near-duplicate images of a class are found with perceptual hashes (see
+    utils.dedup) and either kept together in one split ("group") or reduced to one image
+    ("drop"), so that copies of test images do not also appear in training. The findings
+    are saved to dedup_report.json in the store.
 
     Args:
         dataset_folder (str): Path to the folder containing the dataset.
-        save_path (str): Path to save the preprocessed data.
+        save_path (str): Directory to save the preprocessed (sharded) data to.
+        workers (int): Number of threads used to decode images. Defaults to the number of CPUs.
+        chunk_size (int): Number of images decoded per task.
+        dedup (str): "group", "drop" or None to skip duplicate detection.
+        max_distance (int): Largest Hamming distance between near-duplicate hashes.
 
     Returns:
         None
     """
     # Load images and labels from dataset folder
-    images, labels, class_names = load_images_from_folder(dataset_folder)
-
-    # Convert lists to numpy arrays for easier manipulation
-    images = np.array(images)
-    labels = np.array(labels)
+    with profiling.span("ingest.load"):
+        images, labels, class_names = load_images_from_folder(
+            dataset_folder, workers, chunk_size, progress_callback=print_progress
+        )
 
     print(f"Number of images loaded: {len(images)}")
     print(f"Number of labels loaded: {len(labels)}")
     print(f"Class names: {class_names}")
 
-    # Convert grayscale images to RGB
-    images_rgb = np.repeat(images[..., np.newaxis], 3, -1)
+    # Find near-duplicate images, which would otherwise leak between the splits
+    groups = dedup_report = None
+    if dedup:
+        with profiling.span("ingest.dedup"):
+            groups, dedup_report = find_duplicate_groups(images, labels, max_distance)
+        dedup_report["mode"] = dedup
+        print(
+            f"Found {dedup_report['num_duplicates']} near-duplicate images in "
+            f"{dedup_report['num_duplicate_groups']} groups (largest "
+            f"{dedup_report['largest_group']}); hashing took "
+            f"{dedup_report['hash_seconds']:.2f}s, indexing "
+            f"{dedup_report['index_seconds']:.2f}s"
+        )
+        if dedup == "drop":
+            keep = first_of_each_group(groups)
+            images, labels, groups = images[keep], labels[keep], None
+            print(f"Dropped the duplicates, {len(keep)} images left")
 
-    # Normalize images to range [0, 1]
-    normalized_images = images_rgb / 255.0
+    # Imported here so that the GUI, which only needs preprocess_image, does not pay for it
+    from sklearn.model_selection import train_test_split
 
-    # Reshape images for model input (if necessary)
-    reshaped_images = normalized_images.reshape(-1, images.shape[1], images.shape[2], 3)
+    # Split sample indices into training, development (validation), and test sets; the
+    # images stay uint8 grayscale and are only normalized per batch at training time
+    with profiling.span("ingest.split"):
+        train_idx, temp_idx = train_test_split(
+            np.arange(len(labels)), test_size=0.3, random_state=42
+        )
+        dev_idx, test_idx = train_test_split(temp_idx, test_size=0.5, random_state=42)
 
-    print(f"Shape of reshaped images: {reshaped_images.shape}")
+        if groups is not None:
+            split_ids = np.zeros(len(labels), dtype=np.int64)
+            split_ids[dev_idx], split_ids[test_idx] = 1, 2
+            dedup_report["groups_across_random_splits"] = groups_across_splits(
+                groups, split_ids
+            )
+            # Whole groups go to one split instead
+            train_idx, temp_idx = _group_split(np.arange(len(labels)), groups, 0.3)
+            dev_idx, test_idx = _group_split(temp_idx, groups[temp_idx], 0.5)
+            print(
+                f"{dedup_report['groups_across_random_splits']} duplicate groups would "
+                "have been spread over several splits; each group is now in one split"
+            )
 
-    # Split data into training, development (validation), and test sets
-    X_train, X_temp, y_train, y_temp = train_test_split(
-        reshaped_images, labels, test_size=0.3, random_state=42
+    print(
+        f"Number of samples: train {len(train_idx)}, dev {len(dev_idx)}, test {len(test_idx)}"
     )
-    X_dev, X_test, y_dev, y_test = train_test_split(
-        X_temp, y_temp, test_size=0.5, random_state=42
+
+    # The bookkeeping of incremental updates would describe the replaced shards
+    for name in (SAMPLES_FILENAME, SOURCE_MANIFEST_FILENAME):
+        if os.path.exists(os.path.join(save_path, name)):
+            os.remove(os.path.join(save_path, name))
+
+    # Save preprocessed data as memory-mappable shards
+    with profiling.span("ingest.save"):
+        index = write_sharded_dataset(
+            save_path,
+            images,
+            labels,
+            {"train": train_idx, "dev": dev_idx, "test": test_idx},
+            class_names,
+        )
+
+    print(f"Preprocessed data saved to {save_path}")
+
+    if dedup_report is not None:
+        dedup_report_path = os.path.join(save_path, DEDUP_REPORT_FILENAME)
+        with open(dedup_report_path, "w") as f:
+            json.dump(dedup_report, f, indent=2)
+        print(f"Duplicate report saved to {dedup_report_path}")
+
+    # Write a small sidecar manifest so consumers need not open the store
+    write_manifest(save_path, class_names, index["input_shape"], len(labels))
+    print(f"Dataset manifest saved to {manifest_path_for(save_path)}")
+
+
+def _grow_samples(samples, samples_path, capacity, image_size):
+    """
+    Grow the on-disk sample pool to at least the given capacity.
+
+    Args:
+        samples (np.ndarray): Current memory-mapped pool, or None if there is none yet.
+        samples_path (str): Path of the pool file.
+        capacity (int): Number of rows needed.
+        image_size (tuple): (height, width) of the images.
+
+    Returns:
+        np.ndarray: Memory-mapped pool with room for at least capacity rows.
+    """
+    if samples is not None and len(samples) >= capacity:
+        return samples
+
+    # Grow geometrically so that repeated small additions rarely rewrite the pool
+    current = 0 if samples is None else len(samples)
+    capacity = max(capacity, int(current * 1.5), 1024)
+    grown = np.lib.format.open_memmap(
+        samples_path + ".partial",
+        mode="w+",
+        dtype=np.uint8,
+        shape=(capacity,) + tuple(image_size),
     )
+    if current:
+        grown[:current] = samples
+    grown.flush()
+    del grown, samples
+    os.replace(samples_path + ".partial", samples_path)
+    return np.load(samples_path, mmap_mode="r+")
+
+
+def _num_shards(num_samples, previous=None, shard_size=DEFAULT_SHARD_SIZE):
+    """
+    Choose the number of shards of a split for an incremental update.
 
-    print(f"Shape of X_train: {X_train.shape}, y_train: {y_train.shape}")
-    print(f"Shape of X_dev: {X_dev.shape}, y_dev: {y_dev.shape}")
-    print(f"Shape of X_test: {X_test.shape}, y_test: {y_test.shape}")
+    The previous number is kept until the split outgrows its shards or shrinks well below
+    them, and then doubled or halved, so that adding or removing a few files does not move
+    samples between shards.
 
-    # Save preprocessed data
-    np.savez_compressed(
+    Args:
+        num_samples (int): Number of samples of the split.
+        previous (int): Number of shards of the previous update, or None.
+        shard_size (int): Target number of images per shard.
+
+    Returns:
+        int: Number of shards.
+    """
+    count = previous or 1
+    while num_samples > count * shard_size:
+        count *= 2
+    while count > 1 and num_samples < count * shard_size // 4:
+        count //= 2
+    return count
+
+
+def _store_file_stats(save_path):
+    """
+    Record the size and mtime of the index, labels and shards of a store.
+
+    Returns:
+        dict: Mapping of file name to [size, mtime_ns], or None without an index.
+    """
+    index_path = os.path.join(save_path, INDEX_FILENAME)
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path) as f:
+        splits = json.load(f)["splits"]
+    names = [INDEX_FILENAME] + [
+        name
+        for split in splits.values()
+        for name in [split["labels"]] + [shard["file"] for shard in split["shards"]]
+    ]
+    stats = {}
+    for name in names:
+        try:
+            st = os.stat(os.path.join(save_path, name))
+        except OSError:
+            return None
+        stats[name] = [st.st_size, st.st_mtime_ns]
+    return stats
+
+
+def update_dataset(dataset_folder, save_path, workers=None, chunk_size=256):
+    """
+    Incrementally preprocess a dataset: decode only new or changed images and update the
+    processed store in place.
+
+    A manifest records the size, mtime and content hash of every source image together with
+    the row holding its decoded pixels in an on-disk sample pool. Files whose size and mtime
+    are unchanged are skipped without being read, files whose content hash is unchanged are
+    not decoded again, and rows of deleted files are reused. Each file is assigned to a split
+    and to a shard of that split from hashes of its path, so existing samples never move
+    between splits, every shard mixes all classes, and only the shards with new, changed or
+    deleted files are written again.
+
+    Args:
+        dataset_folder (str): Path to the folder containing the dataset.
+        save_path (str): Directory of the preprocessed (sharded) data to update.
+        workers (int): Number of threads used to decode images. Defaults to the number of CPUs.
+        chunk_size (int): Number of images decoded per task.
+
+    Returns:
+        None
+    """
+    start_time = time.perf_counter()
+    os.makedirs(save_path, exist_ok=True)
+    paths, _, class_names = list_image_files(dataset_folder)
+
+    manifest = load_source_manifest(save_path)
+    samples_path = os.path.join(save_path, SAMPLES_FILENAME)
+    samples = None
+    if os.path.exists(samples_path):
+        samples = np.load(samples_path, mmap_mode="r+")
+    else:
+        manifest = {"num_rows": 0, "entries": {}}
+    entries = manifest["entries"]
+
+    # Compare every source file against the manifest
+    current = {}
+    to_decode = []
+    for path in paths:
+        key = os.path.relpath(path, dataset_folder).replace(os.sep, "/")
+        st = os.stat(path)
+        entry = entries.get(key)
+        if (
+            entry
+            and entry["size"] == st.st_size
+            and entry["mtime_ns"] == st.st_mtime_ns
+        ):
+            current[key] = entry
+            continue
+
+        digest = content_hash(path)
+        if entry and entry["sha1"] == digest:
+            entry.update(size=st.st_size, mtime_ns=st.st_mtime_ns)
+            current[key] = entry
+            continue
+
+        current[key] = {
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "sha1": digest,
+            "class_name": key.split("/")[0],
+            "split": assign_split(key),
+            "row": entry["row"] if entry else None,
+        }
+        to_decode.append(key)
+
+    # Rows of deleted files are reused for new ones
+    deleted = [key for key in entries if key not in current]
+    free_rows = [
+        entries[key]["row"] for key in deleted if entries[key]["row"] is not None
+    ]
+    num_rows = manifest["num_rows"]
+
+    print(
+        f"{len(current) - len(to_decode)} images unchanged, "
+        f"{len(to_decode)} new or changed, {len(deleted)} deleted"
+    )
+
+    # Decode only the new and changed images
+    with profiling.span("ingest.decode", images=len(to_decode)):
+        images, valid = decode_images(
+            [os.path.join(dataset_folder, key) for key in to_decode],
+            workers,
+            chunk_size,
+            progress_callback=print_progress if to_decode else None,
+        )
+    for i, key in enumerate(to_decode):
+        entry = current[key]
+        if not valid[i]:
+            if entry["row"] is not None:
+                free_rows.append(entry["row"])
+            entry["row"] = None
+            continue
+        if entry["row"] is None:
+            if free_rows:
+                entry["row"] = free_rows.pop()
+            else:
+                entry["row"] = num_rows
+                num_rows += 1
+        samples = _grow_samples(samples, samples_path, num_rows, IMAGE_SIZE)
+        samples[entry["row"]] = images[i]
+    if not valid.all():
+        print(f"Skipped {int((~valid).sum())} images that could not be decoded")
+    if samples is None:
+        samples = _grow_samples(samples, samples_path, 1, IMAGE_SIZE)
+    samples.flush()
+
+    # Samples are grouped into shards, and ordered within them, by a hash of their path
+    class_index = {name: idx for idx, name in enumerate(class_names)}
+    labels = np.zeros(len(samples), dtype=np.int64)
+    split_keys = {split: [] for split in SPLITS}
+    for key, entry in current.items():
+        if entry["row"] is not None:
+            labels[entry["row"]] = class_index[entry["class_name"]]
+            split_keys[entry["split"]].append(key)
+    changed = [(key, current[key]["split"]) for key in to_decode] + [
+        (key, entries[key]["split"]) for key in deleted
+    ]
+    previous_shards = manifest.get("num_shards", {})
+    if manifest.get("store_files") != _store_file_stats(save_path):
+        # The shards on disk were not written by the previous update (e.g. a full run
+        # replaced them), so none of them can be kept
+        previous_shards = {}
+    num_shards, split_shards, rewrite = {}, {}, {}
+    for split, keys in split_keys.items():
+        count = _num_shards(len(keys), previous_shards.get(split))
+        shards = [[] for _ in range(count)]
+        for key in sorted(keys, key=shard_position):
+            shards[int(shard_position(key) * count)].append(current[key]["row"])
+        num_shards[split] = count
+        split_shards[split] = [np.array(rows, dtype=np.int64) for rows in shards]
+        if count != previous_shards.get(split):
+            rewrite[split] = set(range(count))
+        else:
+            rewrite[split] = {
+                int(shard_position(key) * count)
+                for key, key_split in changed
+                if key_split == split
+            }
+    with profiling.span("ingest.save"):
+        index = update_sharded_dataset(
+            save_path, samples, labels, split_shards, class_names, rewrite
+        )
+    print(
+        f"Rewrote {sum(len(shards) for shards in rewrite.values())} of "
+        f"{sum(num_shards.values())} shards"
+    )
+
+    manifest = {
+        "num_rows": num_rows,
+        "num_shards": num_shards,
+        "store_files": _store_file_stats(save_path),
+        "entries": current,
+    }
+    save_source_manifest(save_path, manifest)
+
+    # The sample pool and the source manifest are bookkeeping, not training data
+    split_rows = {split: index["splits"][split]["num_samples"] for split in SPLITS}
+    write_manifest(
         save_path,
-        X_train=X_train,
-        y_train=y_train,
-        X_dev=X_dev,
-        y_dev=y_dev,
-        X_test=X_test,
-        y_test=y_test,
-        class_names=class_names,
+        class_names,
+        index["input_shape"],
+        sum(split_rows.values()),
+        exclude=(SAMPLES_FILENAME, SOURCE_MANIFEST_FILENAME),
     )
 
-    print(f"Preprocessed data saved to {save_path}")
+    print(
+        f"Number of samples: train {split_rows['train']}, "
+        f"dev {split_rows['dev']}, test {split_rows['test']}"
+    )
+    print(
+        f"Preprocessed data updated at {save_path} "
+        f"in {time.perf_counter() - start_time:.2f}s"
+    )
 
 
 # Example usage
 if __name__ == "__main__":
     dataset_folder = "data/dataset"
-    save_path = "data/processed_data/math_notation_dataset.npz"
-    preprocess_dataset(dataset_folder, save_path)
+    save_path = "data/processed_data/math_notation_dataset"
+    # --profile TRACE writes a Chrome trace of the ingestion stages
+    trace_path = None
+    if "--profile" in sys.argv:
+        trace_path = sys.argv[sys.argv.index("--profile") + 1]
+    # --dedup group|drop keeps near-duplicates in one split or keeps one of each
+    dedup = None
+    if "--dedup" in sys.argv:
+        dedup = sys.argv[sys.argv.index("--dedup") + 1]
+        if dedup not in DEDUP_MODES:
+            sys.exit(f"--dedup must be one of {DEDUP_MODES}")
+    if dedup and "--incremental" in sys.argv:
+        sys.exit("--dedup does not apply to --incremental updates")
+    with profiling.profile_to(trace_path):
+        if "--incremental" in sys.argv:
+            update_dataset(dataset_folder, save_path)
+        else:
+            preprocess_dataset(dataset_folder, save_path, dedup=dedup)
@@ -0,0 +1,327 @@
+import glob
+import json
+import os
+
+import numpy as np
+
+from utils.manifest import write_manifest
+from utils.preprocessing import normalize_batch
+
+INDEX_FILENAME = "index.json"
+FORMAT_VERSION = 1
+SPLITS = ("train", "dev", "test")
+DEFAULT_SHARD_SIZE = 16384  # About 33 MB of 45x45 uint8 images per shard
+
+
+def is_sharded_dataset(path):
+    """
+    Check whether a path points to a sharded dataset store.
+
+    Args:
+        path (str): Path to check.
+
+    Returns:
+        bool: True if the path is a directory containing a sharded dataset index.
+    """
+    return os.path.isfile(os.path.join(path, INDEX_FILENAME))
+
+
+def _write_split(store_dir, split, images, labels, indices, shard_size):
+    """
+    Write the shards and labels of one split.
+
+    Args:
+        store_dir (str): Directory of the store.
+        split (str): Name of the split.
+        images (np.ndarray): uint8 array of shape (N, height, width) to take images from.
+        labels (np.ndarray): Labels corresponding to each image.
+        indices (np.ndarray): Indices of the samples belonging to the split.
+        shard_size (int): Maximum number of images per shard.
+
+    Returns:
+        dict: Index entry describing the split.
+    """
+    indices = np.asarray(indices)
+    labels_file = f"{split}_labels.npy"
+    np.save(os.path.join(store_dir, labels_file), labels[indices].astype(np.int32))
+
+    shards = []
+    for shard_number, start in enumerate(range(0, len(indices), shard_size)):
+        shard_indices = indices[start : start + shard_size]
+        shard_file = f"{split}_images_{shard_number:05d}.npy"
+        np.save(os.path.join(store_dir, shard_file), images[shard_indices])
+        shards.append({"file": shard_file, "num_samples": int(len(shard_indices))})
+
+    # Remove shards left over from an earlier, larger version of the split
+    shard_number = len(shards)
+    while os.path.exists(
+        os.path.join(store_dir, f"{split}_images_{shard_number:05d}.npy")
+    ):
+        os.remove(os.path.join(store_dir, f"{split}_images_{shard_number:05d}.npy"))
+        shard_number += 1
+
+    return {"num_samples": int(len(indices)), "labels": labels_file, "shards": shards}
+
+
+def _write_index(store_dir, class_names, image_shape, splits):
+    """
+    Write the JSON index of a store.
+
+    Args:
+        store_dir (str): Directory of the store.
+        class_names (list): Class names, indexed by label.
+        image_shape (tuple): (height, width) of the stored images.
+        splits (dict): Mapping of split name to its index entry.
+
+    Returns:
+        dict: The index that was written.
+    """
+    index = {
+        "format_version": FORMAT_VERSION,
+        "class_names": [str(name) for name in class_names],
+        "image_shape": [int(dim) for dim in image_shape],
+        "input_shape": [int(dim) for dim in image_shape] + [3],
+        "splits": splits,
+    }
+    with open(os.path.join(store_dir, INDEX_FILENAME), "w") as f:
+        json.dump(index, f, indent=2)
+    return index
+
+
+def write_sharded_dataset(
+    store_dir, images, labels, split_indices, class_names, shard_size=DEFAULT_SHARD_SIZE
+):
+    """
+    Write a dataset as uint8 grayscale .npy shards plus labels and a JSON index.
+
+    Shards are written one at a time from index arrays, so no split is ever copied in full.
+
+    Args:
+        store_dir (str): Directory to write the store to (created if needed).
+        images (np.ndarray): uint8 array of shape (N, height, width) with all images.
+        labels (np.ndarray): Labels corresponding to each image.
+        split_indices (dict): Mapping of split name to the indices of its samples.
+        class_names (list): Class names, indexed by label.
+        shard_size (int): Maximum number of images per shard.
+
+    Returns:
+        dict: The index that was written.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    splits = {
+        split: _write_split(store_dir, split, images, labels, indices, shard_size)
+        for split, indices in split_indices.items()
+    }
+    # Written last so a store is only recognized once all of its shards exist
+    return _write_index(store_dir, class_names, images.shape[1:], splits)
+
+
+def update_sharded_dataset(
+    store_dir, images, labels, split_shards, class_names, rewrite
+):
+    """
+    Write a dataset whose splits are already divided into shards, skipping unchanged shards.
+
+    Incremental preprocessing keeps every sample in the same shard from one update to the
+    next, so only the shards whose samples changed are written again. The labels and the
+    index are small and always rewritten.
+
+    Args:
+        store_dir (str): Directory of the store (created if needed).
+        images (np.ndarray): uint8 array of shape (N, height, width) with all images.
+        labels (np.ndarray): Labels corresponding to each image.
+        split_shards (dict): Mapping of split name to a list with the indices of the
+            samples of every shard, in order; empty shards get no file.
+        class_names (list): Class names, indexed by label.
+        rewrite (dict): Mapping of split name to the numbers of the shards to write; the
+            other shards are only written if their file is missing.
+
+    Returns:
+        dict: The index that was written.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    splits = {}
+    for split, shards in split_shards.items():
+        indices = np.concatenate(shards) if shards else np.empty(0, dtype=np.int64)
+        labels_file = f"{split}_labels.npy"
+        np.save(os.path.join(store_dir, labels_file), labels[indices].astype(np.int32))
+
+        entries = []
+        for shard_number, shard_indices in enumerate(shards):
+            shard_file = f"{split}_images_{shard_number:05d}.npy"
+            shard_path = os.path.join(store_dir, shard_file)
+            if not len(shard_indices):
+                continue  # Empty files cannot be memory-mapped
+            if shard_number in rewrite.get(split, ()) or not os.path.exists(shard_path):
+                np.save(shard_path, images[shard_indices])
+            entries.append({"file": shard_file, "num_samples": int(len(shard_indices))})
+
+        # Remove shards that are empty now or left over from more shards
+        kept = {entry["file"] for entry in entries}
+        for path in glob.glob(os.path.join(store_dir, f"{split}_images_*.npy")):
+            if os.path.basename(path) not in kept:
+                os.remove(path)
+
+        splits[split] = {
+            "num_samples": int(len(indices)),
+            "labels": labels_file,
+            "shards": entries,
+        }
+    # The index is replaced once every shard it lists is on disk
+    return _write_index(store_dir, class_names, images.shape[1:], splits)
+
+
+class ShardedSplit:
+    """One split (train/dev/test) of a sharded dataset, memory-mapped from disk."""
+
+    def __init__(self, store_dir, split_index, image_shape):
+        # Empty files cannot be memory-mapped
+        mmap_mode = "r" if split_index["num_samples"] else None
+        self.labels = np.load(
+            os.path.join(store_dir, split_index["labels"]), mmap_mode=mmap_mode
+        )
+        self.shards = [
+            np.load(os.path.join(store_dir, shard["file"]), mmap_mode="r")
+            for shard in split_index["shards"]
+        ]
+        self.image_shape = tuple(image_shape)
+        self.offsets = np.cumsum([0] + [len(shard) for shard in self.shards])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    @property
+    def shape(self):
+        """Shape of the normalized model input for the whole split."""
+        return (len(self),) + self.image_shape + (3,)
+
+    def get_images(self, indices):
+        """
+        Gather raw uint8 images by their index within the split.
+
+        Args:
+            indices (np.ndarray): Indices of the images to read.
+
+        Returns:
+            np.ndarray: uint8 array of shape (len(indices), height, width).
+        """
+        indices = np.asarray(indices)
+        images = np.empty((len(indices),) + self.image_shape, dtype=np.uint8)
+        shard_ids = np.searchsorted(self.offsets, indices, side="right") - 1
+        for shard_id in np.unique(shard_ids):
+            mask = shard_ids == shard_id
+            images[mask] = self.shards[shard_id][indices[mask] - self.offsets[shard_id]]
+        return images
+
+    def get_batch(self, indices, channels=3):
+        """
+        Read a normalized batch and its labels.
+
+        Args:
+            indices (np.ndarray): Indices of the samples to read.
+            channels (int): Number of channels the model expects.
+
+        Returns:
+            tuple: (float32 images of shape (N, height, width, channels), labels)
+        """
+        indices = np.asarray(indices)
+        return (
+            normalize_batch(self.get_images(indices), channels),
+            np.asarray(self.labels[indices]),
+        )
+
+    def iter_batches(self, batch_size, shuffle=False, seed=None, channels=3):
+        """
+        Iterate over the split in normalized batches.
+
+        Args:
+            batch_size (int): Number of samples per batch.
+            shuffle (bool): Whether to visit the samples in random order.
+            seed (int): Seed for the shuffle order.
+            channels (int): Number of channels the model expects.
+
+        Yields:
+            tuple: (float32 images, labels) for each batch.
+        """
+        order = np.arange(len(self))
+        if shuffle:
+            np.random.default_rng(seed).shuffle(order)
+        for start in range(0, len(order), batch_size):
+            # Sorted indices read each shard sequentially
+            yield self.get_batch(np.sort(order[start : start + batch_size]), channels)
+
+
+class ShardedDataset:
+    """A sharded dataset store: memory-mapped uint8 shards, labels and a JSON index."""
+
+    def __init__(self, store_dir):
+        with open(os.path.join(store_dir, INDEX_FILENAME)) as f:
+            self.index = json.load(f)
+        if self.index.get("format_version") != FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported dataset format version {self.index.get('format_version')}"
+            )
+
+        self.store_dir = store_dir
+        self.class_names = self.index["class_names"]
+        self.input_shape = tuple(self.index["input_shape"])
+        self.splits = {
+            split: ShardedSplit(store_dir, split_index, self.index["image_shape"])
+            for split, split_index in self.index["splits"].items()
+        }
+
+    def __getitem__(self, split):
+        return self.splits[split]
+
+
+def convert_npz_to_sharded(npz_path, store_dir, shard_size=DEFAULT_SHARD_SIZE):
+    """
+    Convert a dataset saved by the previous .npz format into a sharded store.
+
+    The float RGB images of the archive are converted back to uint8 grayscale one split at
+    a time, so only a single split is held in memory during the conversion. A manifest is
+    written next to the store, as for freshly preprocessed data.
+
+    Args:
+        npz_path (str): Path to the .npz archive.
+        store_dir (str): Directory to write the sharded store to.
+        shard_size (int): Maximum number of images per shard.
+
+    Returns:
+        ShardedDataset: The converted store.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    with np.load(npz_path, allow_pickle=True) as data:
+        class_names = [str(name) for name in data["class_names"]]
+        splits = {}
+        for split in SPLITS:
+            images = np.rint(data[f"X_{split}"][..., 0] * 255.0).astype(np.uint8)
+            labels = data[f"y_{split}"]
+            splits[split] = _write_split(
+                store_dir, split, images, labels, np.arange(len(images)), shard_size
+            )
+            image_shape = images.shape[1:]
+            del images
+
+    index = _write_index(store_dir, class_names, image_shape, splits)
+    # Like freshly preprocessed data, so the app and the feature cache read its hash
+    write_manifest(
+        store_dir,
+        class_names,
+        index["input_shape"],
+        sum(split["num_samples"] for split in splits.values()),
+    )
+
+    print(f"Converted {npz_path} to sharded dataset at {store_dir}")
+    return ShardedDataset(store_dir)
+
+
+# Example usage
+if __name__ == "__main__":
+    # Convert a dataset preprocessed with the previous .npz format
+    dataset = convert_npz_to_sharded(
+        "data/processed_data/math_notation_dataset.npz",
+        "data/processed_data/math_notation_dataset",
+    )
+    for split in SPLITS:
+        print(f"{split}: {dataset[split].shape}")
@@ -0,0 +1,312 @@
+"""
+Near-duplicate detection for dataset images with perceptual hashes and a Hamming index.
+
+Every image gets a 64-bit DCT perceptual hash, computed for all images with a few matrix
+products. Hashes within a small Hamming distance are found with multi-index hashing, and
+linked images are grouped into connected components, so that a group can be kept in a
+single split or reduced to one image.
+"""
+
+import itertools
+import time
+
+import numpy as np
+
+HASH_SIZE = 8  # Low-frequency DCT coefficients per axis: 8 x 8 = 64 hash bits
+DEFAULT_MAX_DISTANCE = (
+    3  # Most re-encoded copies are within 3 bits, distinct symbols 20+ apart
+)
+DEFAULT_NUM_TABLES = 4  # Multi-index hashing tables of 16-bit substrings
+DEFAULT_CHUNK_SIZE = 65536  # Images hashed, or hashes searched, per vectorized step
+
+_POPCOUNT = np.array([bin(value).count("1") for value in range(1 << 16)], np.uint8)
+
+
+def _dct_basis(length, size=HASH_SIZE):
+    """DCT-II basis of the `size` lowest frequencies over `length` samples."""
+    frequencies = np.arange(size)[:, np.newaxis]
+    samples = np.arange(length)[np.newaxis, :]
+    return np.cos(np.pi * (2 * samples + 1) * frequencies / (2 * length)).astype(
+        np.float32
+    )
+
+
+def perceptual_hashes(images, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Compute a 64-bit DCT perceptual hash of every image.
+
+    The hash keeps, for each of the 8 x 8 lowest-frequency DCT coefficients, whether it is
+    above the median coefficient of the image. Small shifts, stroke-width changes and
+    compression noise barely move the low frequencies, so near-identical images get hashes
+    a few bits apart.
+
+    Args:
+        images (np.ndarray): uint8 array of shape (N, height, width); may be memory-mapped.
+        chunk_size (int): Number of images transformed per matrix product.
+
+    Returns:
+        np.ndarray: uint64 array of shape (N,).
+    """
+    num_images, height, width = images.shape
+    rows, columns = _dct_basis(height), _dct_basis(width).T
+    hashes = np.empty(num_images, dtype=np.uint64)
+    for start in range(0, num_images, chunk_size):
+        chunk = np.asarray(images[start : start + chunk_size], dtype=np.float32)
+        coefficients = (rows @ chunk @ columns).reshape(len(chunk), -1)
+        # The DC coefficient only measures brightness and would skew the median
+        median = np.median(coefficients[:, 1:], axis=1, keepdims=True)
+        packed = np.packbits(coefficients > median, axis=1)
+        hashes[start : start + len(chunk)] = packed.view(">u8").ravel()
+    return hashes
+
+
+def hamming_distance(a, b):
+    """
+    Count the differing bits of two arrays of 64-bit hashes, element-wise.
+
+    Args:
+        a (np.ndarray): uint64 hashes.
+        b (np.ndarray): uint64 hashes, broadcastable against a.
+
+    Returns:
+        np.ndarray: uint8 distances.
+    """
+    difference = np.bitwise_xor(a, b)
+    mask = np.uint64(0xFFFF)
+    return (
+        _POPCOUNT[difference & mask]
+        + _POPCOUNT[(difference >> np.uint64(16)) & mask]
+        + _POPCOUNT[(difference >> np.uint64(32)) & mask]
+        + _POPCOUNT[difference >> np.uint64(48)]
+    )
+
+
+class MultiIndexHash:
+    """
+    Index of 64-bit hashes for Hamming-distance range queries (multi-index hashing).
+
+    Every hash is split into num_tables substrings, and each table keeps the hashes sorted
+    by one substring. Two hashes within distance r differ in at most r // num_tables bits
+    of at least one substring, so a query only compares the hashes in the buckets of its
+    own substrings and their few close neighbours, instead of the whole index. With
+    r < num_tables these are exact bucket lookups.
+    """
+
+    def __init__(self, hashes, num_tables=DEFAULT_NUM_TABLES):
+        """
+        Args:
+            hashes (np.ndarray): uint64 hashes to index.
+            num_tables (int): Number of substrings; must divide 64.
+        """
+        self.hashes = np.asarray(hashes, dtype=np.uint64)
+        self.num_tables = num_tables
+        self.substring_bits = 64 // num_tables
+        self.orders = []
+        self.sorted_substrings = []
+        for table in range(num_tables):
+            substrings = self._substrings(self.hashes, table)
+            order = np.argsort(substrings, kind="stable")
+            self.orders.append(order)
+            self.sorted_substrings.append(substrings[order])
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def _substrings(self, hashes, table):
+        shift = np.uint64(table * self.substring_bits)
+        mask = np.uint64((1 << self.substring_bits) - 1)
+        return ((hashes >> shift) & mask).astype(np.int64)
+
+    def _flip_masks(self, max_distance):
+        """Every substring mask with at most max_distance // num_tables bits set."""
+        radius = max_distance // self.num_tables
+        masks = [0]
+        for bits in range(1, radius + 1):
+            for positions in itertools.combinations(range(self.substring_bits), bits):
+                masks.append(sum(1 << position for position in positions))
+        return masks
+
+    def search(self, queries, max_distance):
+        """
+        Find every indexed hash within max_distance of each query.
+
+        Args:
+            queries (np.ndarray): uint64 hashes to look up.
+            max_distance (int): Largest Hamming distance of a match.
+
+        Returns:
+            Tuple of np.ndarray: (query positions, index positions) of all matches, each
+            pair listed once.
+        """
+        queries = np.asarray(queries, dtype=np.uint64)
+        found = []
+        for table in range(self.num_tables):
+            keys = self._substrings(queries, table)
+            sorted_substrings = self.sorted_substrings[table]
+            for mask in self._flip_masks(max_distance):
+                lookup = keys ^ mask
+                low = np.searchsorted(sorted_substrings, lookup, side="left")
+                counts = np.searchsorted(sorted_substrings, lookup, side="right") - low
+                query_positions = np.repeat(np.arange(len(queries)), counts)
+                # Position of every candidate within its bucket
+                offsets = np.arange(counts.sum()) - np.repeat(
+                    np.cumsum(counts) - counts, counts
+                )
+                index_positions = self.orders[table][np.repeat(low, counts) + offsets]
+                close = (
+                    hamming_distance(
+                        queries[query_positions], self.hashes[index_positions]
+                    )
+                    <= max_distance
+                )
+                found.append(
+                    query_positions[close] * len(self) + index_positions[close]
+                )
+
+        # A pair can be found through several tables
+        matches = np.unique(np.concatenate(found)) if found else np.empty(0, np.int64)
+        return matches // len(self), matches % len(self)
+
+    def pairs(self, max_distance, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Find all pairs of indexed hashes within max_distance of each other.
+
+        Args:
+            max_distance (int): Largest Hamming distance of a pair.
+            chunk_size (int): Number of hashes looked up per vectorized search.
+
+        Returns:
+            Tuple of np.ndarray: (first, second) positions of every pair, with first < second.
+        """
+        firsts, seconds = [], []
+        for start in range(0, len(self), chunk_size):
+            query_positions, index_positions = self.search(
+                self.hashes[start : start + chunk_size], max_distance
+            )
+            query_positions += start
+            keep = query_positions < index_positions
+            firsts.append(query_positions[keep])
+            seconds.append(index_positions[keep])
+        if not firsts:
+            return np.empty(0, np.int64), np.empty(0, np.int64)
+        return np.concatenate(firsts), np.concatenate(seconds)
+
+
+def find_duplicate_groups(
+    images,
+    labels=None,
+    max_distance=DEFAULT_MAX_DISTANCE,
+    num_tables=DEFAULT_NUM_TABLES,
+):
+    """
+    Group near-duplicate images.
+
+    Images whose hashes are within max_distance are linked, and every connected component
+    becomes a group. With labels, only images of the same class are linked, since the
+    groups are meant to be kept together or reduced to one image of their class.
+
+    Args:
+        images (np.ndarray): uint8 array of shape (N, height, width).
+        labels (np.ndarray): Label of every image, or None.
+        max_distance (int): Largest Hamming distance between near-duplicate hashes.
+        num_tables (int): Number of multi-index hashing tables.
+
+    Returns:
+        Tuple of np.ndarray and dict: (group id of every image, report with the number of
+        images, groups, duplicates (images beyond the first of their group) and the size of
+        the largest group, plus the hashing and indexing times in seconds)
+    """
+    # Imported here like sklearn in data_processing: only the dedup stage needs scipy
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    num_images = len(images)
+    start = time.perf_counter()
+    hashes = perceptual_hashes(images)
+    hash_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if labels is None:
+        labels = np.zeros(num_images, dtype=np.int64)
+    order = np.argsort(labels, kind="stable")
+    _, class_starts = np.unique(labels[order], return_index=True)
+    sources, targets = [], []
+    for members in np.split(order, class_starts[1:]):
+        # Identical hashes are linked directly and indexed once
+        unique_hashes, first, inverse = np.unique(
+            hashes[members], return_index=True, return_inverse=True
+        )
+        sources.append(members)
+        targets.append(members[first[inverse.ravel()]])
+        index = MultiIndexHash(unique_hashes, num_tables)
+        first_positions, second_positions = index.pairs(max_distance)
+        sources.append(members[first[first_positions]])
+        targets.append(members[first[second_positions]])
+
+    sources, targets = np.concatenate(sources), np.concatenate(targets)
+    graph = coo_matrix(
+        (np.ones(len(sources), dtype=np.int8), (sources, targets)),
+        shape=(num_images, num_images),
+    )
+    num_groups, groups = connected_components(graph, directed=False)
+    index_seconds = time.perf_counter() - start
+
+    group_sizes = np.bincount(groups, minlength=num_groups)
+    report = {
+        "num_images": num_images,
+        "num_groups": int(num_groups),
+        "num_duplicates": int(num_images - num_groups),
+        "num_duplicate_groups": int((group_sizes > 1).sum()),
+        "largest_group": int(group_sizes.max()) if num_images else 0,
+        "max_distance": max_distance,
+        "hash_seconds": hash_seconds,
+        "index_seconds": index_seconds,
+    }
+    return groups, report
+
+
+def first_of_each_group(groups):
+    """
+    Pick one image per group, the first in dataset order.
+
+    Args:
+        groups (np.ndarray): Group id of every image.
+
+    Returns:
+        np.ndarray: Sorted indices of the kept images.
+    """
+    return np.sort(np.unique(groups, return_index=True)[1])
+
+
+def groups_across_splits(groups, split_ids):
+    """
+    Count the groups of near-duplicates that are spread over more than one split.
+
+    Args:
+        groups (np.ndarray): Group id of every image.
+        split_ids (np.ndarray): Split (e.g. 0, 1, 2) of every image.
+
+    Returns:
+        int: Number of groups with images in several splits.
+    """
+    group_splits = np.unique(np.stack([groups, split_ids]), axis=1)
+    return int((np.bincount(group_splits[0]) > 1).sum())
+
+
+# Example usage
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    num_images = 200000
+    hashes = rng.integers(0, 2**63, size=num_images, dtype=np.int64).astype(np.uint64)
+    # Every tenth hash gets a near-copy with one flipped bit
+    flips = np.uint64(1) << rng.integers(0, 64, num_images // 10).astype(np.uint64)
+    hashes = np.concatenate([hashes, hashes[::10] ^ flips])
+
+    start = time.perf_counter()
+    index = MultiIndexHash(hashes)
+    first_positions, second_positions = index.pairs(DEFAULT_MAX_DISTANCE)
+    seconds = time.perf_counter() - start
+    print(
+        f"Found {len(first_positions)} near-duplicate pairs among {len(hashes)} hashes "
+        f"in {seconds:.2f}s"
+    )
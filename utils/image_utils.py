@@ -1,6 +1,43 @@
-from PyQt5.QtGui import QImage, qRgb
+from PyQt5.QtGui import QImage
 import numpy as np
 
+from utils.preprocessing import bgra_to_gray, gray_to_model_input
+
+
+def qimage_to_array(qimage):
+    """
+    Wrap the pixel buffer of a 32-bit QImage as a numpy array without copying it.
+
+    For a 32-bit QImage the returned array is a read-only view that is only valid while
+    the QImage is alive and unmodified; copy it (or derive a new array from it) before
+    handing it elsewhere. Other formats are converted to a temporary 32-bit image first,
+    and the array returned is a copy, since the temporary is freed on return.
+
+    Args:
+        qimage (QImage): Input QImage.
+
+    Returns:
+        np.ndarray: uint8 array of shape (height, width, 4) in BGRA order.
+    """
+    converted = qimage.format() not in (
+        QImage.Format_RGB32,
+        QImage.Format_ARGB32,
+        QImage.Format_ARGB32_Premultiplied,
+    )
+    if converted:
+        qimage = qimage.convertToFormat(QImage.Format_RGB32)
+
+    width, height = qimage.width(), qimage.height()
+    bytes_per_line = qimage.bytesPerLine()
+
+    # constBits does not detach (copy) an implicitly shared image
+    ptr = qimage.constBits()
+    ptr.setsize(height * bytes_per_line)
+    rows = np.frombuffer(ptr, dtype=np.uint8).reshape(height, bytes_per_line)
+    pixels = rows[:, : width * 4].reshape(height, width, 4)
+    # A view would point into the converted image, freed when this function returns
+    return pixels.copy() if converted else pixels
+
 
 def convert_qimage_to_numpy(qimage):
     """
@@ -10,22 +47,37 @@ def convert_qimage_to_numpy(qimage):
         qimage (QImage): Input QImage to convert.
 
     Returns:
-        np.ndarray: Converted numpy array representing the QImage.
+        np.ndarray: Array of shape (height, width, 3) in BGR order, a zero-copy view
+            for 32-bit images.
+    """
+    # Drop the alpha channel
+    return qimage_to_array(qimage)[:, :, :3]
+
+
+def qimage_to_gray(qimage):
+    """
+    Convert a QImage to a grayscale numpy array with a single conversion pass.
+
+    Args:
+        qimage (QImage): Input QImage.
+
+    Returns:
+        np.ndarray: uint8 array of shape (height, width).
     """
-    # Convert the QImage to a format compatible with numpy
-    qimage = qimage.convertToFormat(QImage.Format_RGB32)
+    return bgra_to_gray(qimage_to_array(qimage))
 
-    # Get the dimensions of the QImage
-    width = qimage.width()
-    height = qimage.height()
 
-    # Get the byte array of the QImage and reshape it to a 3-channel numpy array
-    ptr = qimage.bits()
-    ptr.setsize(qimage.byteCount())
-    arr = np.array(ptr).reshape(height, width, 4)
+def qimage_to_model_input(qimage):
+    """
+    Preprocess a QImage into the same float32 input layout the model is trained on.
+
+    Args:
+        qimage (QImage): Input QImage, dark ink on a light background.
 
-    # Return the numpy array, removing the alpha channel
-    return arr[:, :, :3]
+    Returns:
+        np.ndarray: float32 array of shape (1, 45, 45, 3).
+    """
+    return gray_to_model_input(qimage_to_gray(qimage))
 
 
 # Example usage
@@ -34,3 +86,23 @@ if __name__ == "__main__":
     qimage = QImage("example.png")
     numpy_array = convert_qimage_to_numpy(qimage)
     print(f"Converted QImage to numpy array with shape: {numpy_array.shape}")
+
+    # Formats other than 32-bit are converted first and must give the same pixels
+    gray = np.tile(np.arange(0, 250, 5, dtype=np.uint8), (37, 1))
+    # QImage does not copy the buffer, so it is kept alive in a variable
+    gray_bytes = gray.tobytes()
+    gray_qimage = QImage(
+        gray_bytes,
+        gray.shape[1],
+        gray.shape[0],
+        gray.shape[1],
+        QImage.Format_Grayscale8,
+    )
+    rgb32_qimage = gray_qimage.convertToFormat(QImage.Format_RGB32)
+    for qimage_format in (QImage.Format_Grayscale8, QImage.Format_RGB888):
+        converted = gray_qimage.convertToFormat(qimage_format)
+        assert np.array_equal(
+            convert_qimage_to_numpy(converted), convert_qimage_to_numpy(rgb32_qimage)
+        )
+        assert np.array_equal(qimage_to_gray(converted), gray)
+    print("Grayscale8 and RGB888 QImages convert to the same pixels as RGB32")
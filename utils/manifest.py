@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+
+def manifest_path_for(data_path):
+    """
+    Get the path of the sidecar manifest that describes a preprocessed dataset.
+
+    Args:
+        data_path (str): Path to the preprocessed dataset (a sharded store directory or .npz file).
+
+    Returns:
+        str: Path of the JSON manifest next to the dataset.
+    """
+    return os.path.splitext(os.path.normpath(data_path))[0] + ".json"
+
+
+def _digest(path, chunk_size=1 << 20):
+    """Compute the SHA-256 hex digest of one file without reading it into memory at once."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _directory_digests(path, previous=None, exclude=()):
+    """
+    Digest every file of a directory, reusing the digests of files that did not change.
+
+    Args:
+        path (str): Path to the directory.
+        previous (dict): Digests from an earlier call; a file whose size and mtime are
+            unchanged keeps its digest without being read.
+        exclude (tuple): Names of files (relative to path) to leave out.
+
+    Returns:
+        dict: Mapping of relative file name to its size, mtime and SHA-256 digest.
+    """
+    previous = previous or {}
+    digests = {}
+    for root, _, names in os.walk(path):
+        for name in names:
+            file_path = os.path.join(root, name)
+            relative = os.path.relpath(file_path, path).replace(os.sep, "/")
+            if relative in exclude:
+                continue
+            st = os.stat(file_path)
+            entry = previous.get(relative)
+            if not (
+                entry
+                and entry["size"] == st.st_size
+                and entry["mtime_ns"] == st.st_mtime_ns
+            ):
+                entry = {
+                    "size": st.st_size,
+                    "mtime_ns": st.st_mtime_ns,
+                    "sha256": _digest(file_path),
+                }
+            digests[relative] = entry
+    return digests
+
+
+def _combined_hash(digests):
+    """Hash the names and digests of all files of a directory, in sorted order."""
+    combined = hashlib.sha256()
+    for name in sorted(digests):
+        combined.update(f"{name}\0{digests[name]['sha256']}\n".encode("utf-8"))
+    return combined.hexdigest()
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """
+    Compute the SHA-256 digest of a file, or of all files of a directory, without reading
+    them into memory at once.
+
+    A directory is hashed from the names and digests of its files.
+
+    Args:
+        path (str): Path to the file or directory.
+        chunk_size (int): Number of bytes read per chunk.
+
+    Returns:
+        str: Hex digest of the contents.
+    """
+    if os.path.isdir(path):
+        return _combined_hash(_directory_digests(path))
+    return _digest(path, chunk_size)
+
+
+def write_manifest(data_path, class_names, input_shape, num_samples, exclude=()):
+    """
+    Write a small JSON manifest describing a preprocessed dataset.
+
+    For a sharded store, the manifest also records the digest of every file, and files
+    that have not changed since the previous manifest are not read again, so updating a
+    few shards only hashes those shards.
+
+    Args:
+        data_path (str): Path to the preprocessed dataset the manifest describes.
+        class_names (list): Class names, indexed by label.
+        input_shape (tuple): Shape of a single model input (excluding batch dimension).
+        num_samples (int): Total number of samples across all splits.
+        exclude (tuple): Files of a store that are not part of the dataset hash, e.g.
+            bookkeeping that training never reads.
+
+    Returns:
+        dict: The manifest that was written.
+    """
+    manifest = {
+        "class_names": [str(name) for name in class_names],
+        "input_shape": [int(dim) for dim in input_shape],
+        "num_samples": int(num_samples),
+    }
+    if os.path.isdir(data_path):
+        previous = load_manifest(data_path) or {}
+        files = _directory_digests(data_path, previous.get("files"), exclude)
+        manifest["dataset_hash"] = _combined_hash(files)
+        manifest["files"] = files
+    else:
+        manifest["dataset_hash"] = file_hash(data_path)
+    with open(manifest_path_for(data_path), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_manifest(data_path):
+    """
+    Load the manifest of a preprocessed dataset.
+
+    Args:
+        data_path (str): Path to the preprocessed dataset.
+
+    Returns:
+        dict: The manifest, or None if no manifest has been written yet.
+    """
+    path = manifest_path_for(data_path)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_class_names(data_path):
+    """
+    Load the class names of a preprocessed dataset, preferring the lightweight manifest.
+
+    Args:
+        data_path (str): Path to the preprocessed dataset.
+
+    Returns:
+        list: Class names, indexed by label.
+    """
+    manifest = load_manifest(data_path)
+    if manifest is not None:
+        return manifest["class_names"]
+
+    # Datasets preprocessed before manifests existed only store names with the data
+    if os.path.isdir(data_path):
+        with open(os.path.join(data_path, "index.json")) as f:
+            return json.load(f)["class_names"]
+    npz_path = data_path if data_path.endswith(".npz") else data_path + ".npz"
+    with np.load(npz_path, allow_pickle=True) as data:
+        return [str(name) for name in data["class_names"]]
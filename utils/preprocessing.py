@@ -0,0 +1,116 @@
+import cv2
+import numpy as np
+
+MODEL_IMAGE_SIZE = (45, 45)  # (height, width) of the model input
+MODEL_CHANNELS = 3  # Grayscale is repeated to fill the channels of the model input
+
+_SCALE = np.float32(1.0 / 255.0)
+
+
+def resize_to_model(gray, image_size=MODEL_IMAGE_SIZE):
+    """
+    Downscale a grayscale image to the model input size with a single area interpolation.
+
+    Args:
+        gray (np.ndarray): uint8 array of shape (height, width).
+        image_size (tuple): (height, width) of the output.
+
+    Returns:
+        np.ndarray: uint8 array of shape image_size (the input itself if it already fits).
+    """
+    if gray.shape == tuple(image_size):
+        return gray
+    return cv2.resize(
+        gray, (image_size[1], image_size[0]), interpolation=cv2.INTER_AREA
+    )
+
+
+def normalize_batch(images, channels=MODEL_CHANNELS):
+    """
+    Turn a batch of uint8 grayscale images into normalized model input.
+
+    This is the single definition of the model input layout, shared by training (per batch,
+    from the processed dataset) and inference (GUI, batch tools).
+
+    Args:
+        images (np.ndarray): uint8 array of shape (N, height, width).
+        channels (int): Number of channels the model expects; grayscale is repeated to fill them.
+
+    Returns:
+        np.ndarray: float32 array of shape (N, height, width, channels) with values in [0, 1].
+    """
+    batch = np.asarray(images, dtype=np.float32) * _SCALE
+    return np.repeat(batch[..., np.newaxis], channels, axis=-1)
+
+
+def gray_to_model_input(gray, image_size=MODEL_IMAGE_SIZE, channels=MODEL_CHANNELS):
+    """
+    Preprocess one grayscale image into a model input batch of size one.
+
+    Args:
+        gray (np.ndarray): uint8 array of shape (height, width), dark ink on a light background.
+        image_size (tuple): (height, width) of the model input.
+        channels (int): Number of channels the model expects.
+
+    Returns:
+        np.ndarray: float32 array of shape (1, height, width, channels).
+    """
+    return normalize_batch(resize_to_model(gray, image_size)[np.newaxis], channels)
+
+
+def bgra_to_gray(pixels):
+    """
+    Convert a BGRA pixel array (e.g. a view of a 32-bit QImage) to grayscale.
+
+    Args:
+        pixels (np.ndarray): uint8 array of shape (height, width, 4).
+
+    Returns:
+        np.ndarray: uint8 array of shape (height, width).
+    """
+    return cv2.cvtColor(pixels, cv2.COLOR_BGRA2GRAY)
+
+
+# Example usage
+if __name__ == "__main__":
+    import os
+    import sys
+    import tempfile
+
+    from PyQt5.QtGui import QImage, QPainter
+
+    from utils.data_processing import decode_images
+    from utils.image_utils import qimage_to_model_input
+
+    # Check that training and inference preprocessing produce identical bytes
+    rng = np.random.default_rng(0)
+    drawing = np.full((300, 400), 255, dtype=np.uint8)
+    cv2.line(drawing, (50, 40), (350, 260), 0, 9)
+    drawing[rng.random(drawing.shape) < 0.01] = 0
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "symbol.png")
+        cv2.imwrite(path, drawing)  # Lossless, so decoding returns the same pixels
+        images, valid = decode_images([path])
+        training_input = normalize_batch(images)
+
+    # Render the drawing offscreen onto a canvas like the GUI's (32-bit RGB)
+    height, width = drawing.shape
+    drawing_bytes = drawing.tobytes()  # QImage does not copy the buffer
+    drawing_qimage = QImage(
+        drawing_bytes, width, height, width, QImage.Format_Grayscale8
+    )
+    canvas = QImage(width, height, QImage.Format_RGB32)
+    canvas.fill(0xFFFFFFFF)
+    painter = QPainter(canvas)
+    painter.drawImage(0, 0, drawing_qimage)
+    painter.end()
+
+    inference_inputs = {
+        "grayscale array": gray_to_model_input(drawing),
+        "canvas QImage": qimage_to_model_input(canvas),
+    }
+    for name, inference_input in inference_inputs.items():
+        if training_input.tobytes() != inference_input.tobytes():
+            sys.exit(f"Preprocessing of a {name} differs from training preprocessing")
+    print("Training and inference preprocessing produce identical bytes")
@@ -0,0 +1,270 @@
+"""
+Lightweight named-span instrumentation for the prediction, ingestion and training paths.
+
+Spans are recorded only while profiling is enabled (by enable(), a --profile option, or
+the MATH_VISION_PROFILE environment variable); otherwise span() returns a shared no-op
+context manager, so instrumented code pays for little more than one function call.
+Recorded spans can be summarized per name (see PerformanceOverlay) or exported as a
+Chrome trace, viewable in chrome://tracing or https://ui.perfetto.dev.
+
+    with profiling.span("predict.rasterize"):
+        model_input = strokes_to_model_input(strokes, canvas_size)
+"""
+
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+DEFAULT_MAX_EVENTS = 100000  # Oldest spans are dropped beyond this many
+
+_enabled = os.environ.get("MATH_VISION_PROFILE", "") not in ("", "0")
+_events = deque(maxlen=DEFAULT_MAX_EVENTS)
+_NULL_SPAN = contextlib.nullcontext()
+
+
+class _Span:
+    """Context manager that records one span when it exits."""
+
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.name, self.start, time.perf_counter() - self.start, **self.args)
+        return False
+
+
+def span(name, **args):
+    """
+    Time a block of code as a named span.
+
+    Args:
+        name (str): Span name; dotted prefixes ("predict.", "ingest.", "train.") group
+            the spans of one path.
+        **args: JSON-serializable details stored with the span.
+
+    Returns:
+        A context manager; a shared no-op one while profiling is disabled.
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, args)
+
+
+def traced(name):
+    """Decorator that records every call of a function as a span."""
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with _Span(name, {}):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def record(name, start, duration, **args):
+    """
+    Record a span measured elsewhere.
+
+    Args:
+        name (str): Span name.
+        start (float): time.perf_counter() timestamp of the start of the span.
+        duration (float): Duration in seconds.
+        **args: JSON-serializable details stored with the span.
+    """
+    if _enabled:
+        # deque.append is atomic, so spans can be recorded from any thread
+        _events.append((name, start, duration, threading.get_ident(), args or None))
+
+
+def enable(max_events=None):
+    """Start recording spans, optionally changing how many are kept."""
+    global _enabled, _events
+    if max_events is not None and max_events != _events.maxlen:
+        _events = deque(_events, maxlen=max_events)
+    _enabled = True
+
+
+def disable():
+    """Stop recording spans; recorded spans are kept."""
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def clear():
+    """Drop all recorded spans."""
+    _events.clear()
+
+
+def events():
+    """Return the recorded spans as (name, start, duration, thread id, args) tuples."""
+    return list(_events)
+
+
+def summary(since=None):
+    """
+    Summarize the recorded spans per name.
+
+    Args:
+        since (float): Only include spans that started after this time.perf_counter()
+            timestamp.
+
+    Returns:
+        dict: For each span name (sorted), its count and the total, mean, p50, p95 and
+            last duration in milliseconds.
+    """
+    durations = {}
+    for name, start, duration, _, _ in events():
+        if since is None or start >= since:
+            durations.setdefault(name, []).append(duration)
+
+    result = {}
+    for name in sorted(durations):
+        values = np.array(durations[name]) * 1000
+        p50, p95 = np.percentile(values, [50, 95])
+        result[name] = {
+            "count": len(values),
+            "total_ms": float(values.sum()),
+            "mean_ms": float(values.mean()),
+            "p50_ms": float(p50),
+            "p95_ms": float(p95),
+            "last_ms": float(values[-1]),
+        }
+    return result
+
+
+def export_chrome_trace(path):
+    """
+    Write the recorded spans as a Chrome trace (JSON trace event format).
+
+    Args:
+        path (str): Output file path.
+
+    Returns:
+        int: Number of spans written.
+    """
+    thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+    pid = os.getpid()
+    trace_events = []
+    for thread_id, thread_name in thread_names.items():
+        trace_events.append(
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": thread_id,
+                "args": {"name": thread_name},
+            }
+        )
+
+    recorded = events()
+    for name, start, duration, thread_id, args in recorded:
+        event = {
+            "name": name,
+            "cat": name.split(".", 1)[0],
+            "ph": "X",
+            "ts": start * 1e6,
+            "dur": duration * 1e6,
+            "pid": pid,
+            "tid": thread_id,
+        }
+        if args:
+            event["args"] = args
+        trace_events.append(event)
+
+    with open(path, "w") as f:
+        json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+    return len(recorded)
+
+
+@contextlib.contextmanager
+def profile_to(path):
+    """
+    Record spans for the duration of a block and export them as a Chrome trace.
+
+    Args:
+        path (str): Trace file path, or None to do nothing.
+    """
+    if path is None:
+        yield
+        return
+    enable()
+    try:
+        yield
+    finally:
+        count = export_chrome_trace(path)
+        print(f"Wrote {count} spans to {path}")
+
+
+def start_tf_profiler(logdir):
+    """Start a tf.profiler capture, viewable in TensorBoard's profile tab."""
+    import tensorflow as tf
+
+    tf.profiler.experimental.start(logdir)
+
+
+def stop_tf_profiler():
+    """Stop the tf.profiler capture started by start_tf_profiler."""
+    import tensorflow as tf
+
+    tf.profiler.experimental.stop()
+
+
+@contextlib.contextmanager
+def tf_profiler(logdir):
+    """
+    Capture a tf.profiler trace for the duration of a block.
+
+    Args:
+        logdir (str): TensorBoard log directory, or None to do nothing.
+    """
+    if logdir is None:
+        yield
+        return
+    start_tf_profiler(logdir)
+    try:
+        yield
+    finally:
+        stop_tf_profiler()
+        print(f"TensorFlow profile saved to {logdir}")
+
+
+# Example usage
+if __name__ == "__main__":
+    enable()
+    for _ in range(100):
+        with span("example.outer"):
+            with span("example.inner", size=1000):
+                sum(range(1000))
+
+    for name, stats in summary().items():
+        print(f"{name}: {stats['count']} spans, p50 {stats['p50_ms']:.3f} ms")
+
+    disable()
+    start = time.perf_counter()
+    for _ in range(100000):
+        with span("example.disabled"):
+            pass
+    overhead = (time.perf_counter() - start) / 100000 * 1e9
+    print(f"Disabled span overhead: {overhead:.0f} ns")
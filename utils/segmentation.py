@@ -0,0 +1,146 @@
+import cv2
+import numpy as np
+
+from utils.preprocessing import normalize_batch, resize_to_model
+
+
+def segment_symbols(gray, threshold=128, min_area=4, overlap=0.5):
+    """
+    Segment a drawing into symbols using connected components of the ink.
+
+    Components whose horizontal extents overlap are grouped into one symbol, so that symbols
+    made of several strokes (such as "=", "i" or a division sign) stay together.
+
+    Args:
+        gray (np.ndarray): uint8 grayscale image with dark ink on a light background.
+        threshold (int): Pixels darker than this are considered ink.
+        min_area (int): Components with fewer ink pixels are treated as noise.
+        overlap (float): Fraction of the narrower component's width that must overlap
+            horizontally for two components to be grouped.
+
+    Returns:
+        list: Bounding boxes (x, y, width, height) of the symbols, ordered left to right.
+    """
+    ink = (gray < threshold).astype(np.uint8)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+
+    # Row 0 is the background
+    boxes = [
+        (int(x), int(y), int(w), int(h))
+        for x, y, w, h, area in stats[1:count]
+        if area >= min_area
+    ]
+    return group_boxes(boxes, overlap)
+
+
+def group_boxes(boxes, overlap=0.5):
+    """
+    Group bounding boxes whose horizontal extents overlap into symbols.
+
+    Args:
+        boxes (list): Bounding boxes (x, y, width, height), e.g. of ink components or strokes.
+        overlap (float): Fraction of the narrower box's width that must overlap
+            horizontally for two boxes to be grouped.
+
+    Returns:
+        list: Bounding boxes (x, y, width, height) of the groups, ordered left to right.
+    """
+    boxes = sorted(
+        ([x, y, x + w, y + h] for x, y, w, h in boxes), key=lambda box: box[0]
+    )
+
+    groups = []
+    for box in boxes:
+        if groups:
+            last = groups[-1]
+            shared = min(last[2], box[2]) - max(last[0], box[0])
+            narrower = min(last[2] - last[0], box[2] - box[0])
+            if shared >= overlap * narrower:
+                last[0] = min(last[0], box[0])
+                last[1] = min(last[1], box[1])
+                last[2] = max(last[2], box[2])
+                last[3] = max(last[3], box[3])
+                continue
+        groups.append(box)
+
+    return [(x0, y0, x1 - x0, y1 - y0) for x0, y0, x1, y1 in groups]
+
+
+def crop_symbols(gray, boxes, size=45, margin=0.15):
+    """
+    Crop symbols and normalize them to the training image format.
+
+    Each crop is padded to a square with background, with a margin around the symbol as in
+    the training images, and downscaled with area interpolation.
+
+    Args:
+        gray (np.ndarray): uint8 grayscale image with dark ink on a light background.
+        boxes (list): Bounding boxes (x, y, width, height) of the symbols.
+        size (int): Side length of the output images.
+        margin (float): Margin around each symbol as a fraction of its larger side.
+
+    Returns:
+        np.ndarray: uint8 array of shape (len(boxes), size, size).
+    """
+    crops = np.empty((len(boxes), size, size), dtype=np.uint8)
+    for i, (x, y, w, h) in enumerate(boxes):
+        side = int(max(w, h) * (1 + 2 * margin)) + 1
+        square = np.full((side, side), 255, dtype=np.uint8)
+        top = (side - h) // 2
+        left = (side - w) // 2
+        square[top : top + h, left : left + w] = gray[y : y + h, x : x + w]
+        crops[i] = resize_to_model(square, (size, size))
+    return crops
+
+
+def recognize_expression(predict, gray, class_names, threshold=128):
+    """
+    Recognize every symbol of a drawing with a single batched forward pass.
+
+    Args:
+        predict (callable): Function mapping a normalized batch to class probabilities,
+            e.g. InferenceSession.predict.
+        gray (np.ndarray): uint8 grayscale image with dark ink on a light background.
+        class_names (list): Class names, indexed by model output.
+        threshold (int): Pixels darker than this are considered ink.
+
+    Returns:
+        list: One dict per symbol, ordered left to right, with keys "class_name",
+            "confidence" (percent, like models.inference.interpret_prediction) and
+            "box" (x, y, width, height).
+    """
+    boxes = segment_symbols(gray, threshold)
+    if not boxes:
+        return []
+    return classify_crops(predict, crop_symbols(gray, boxes), boxes, class_names)
+
+
+def classify_crops(predict, crops, boxes, class_names):
+    """
+    Classify symbol crops with a single batched forward pass.
+
+    Args:
+        predict (callable): Function mapping a normalized batch to class probabilities.
+        crops (np.ndarray): uint8 array of shape (N, 45, 45), one crop per symbol.
+        boxes (list): Bounding boxes (x, y, width, height) of the symbols.
+        class_names (list): Class names, indexed by model output.
+
+    Returns:
+        list: One dict per symbol with keys "class_name", "confidence" (percent) and
+            "box" (x, y, width, height).
+    """
+    probabilities = predict(normalize_batch(crops))
+    class_indices = np.argmax(probabilities, axis=1)
+
+    return [
+        {
+            "class_name": (
+                str(class_names[class_index])
+                if class_index < len(class_names)
+                else str(class_index)
+            ),
+            "confidence": float(probabilities[i, class_index]) * 100,
+            "box": box,
+        }
+        for i, (class_index, box) in enumerate(zip(class_indices, boxes))
+    ]
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+
+SOURCE_MANIFEST_FILENAME = "source_manifest.json"
+SAMPLES_FILENAME = "samples.npy"
+SPLIT_FRACTIONS = (("train", 0.70), ("dev", 0.15), ("test", 0.15))
+
+
+def content_hash(path, chunk_size=1 << 20):
+    """
+    Compute the SHA-1 digest of a source image file.
+
+    Args:
+        path (str): Path to the file.
+        chunk_size (int): Number of bytes read per chunk.
+
+    Returns:
+        str: Hex digest of the file contents.
+    """
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _hash_position(key, part):
+    """Map a relative path to [0, 1) with 32 bits of its SHA-1, taken from the given part."""
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return int(digest[part * 8 : part * 8 + 8], 16) / 2**32
+
+
+def assign_split(key):
+    """
+    Deterministically assign a source file to a split from a hash of its relative path.
+
+    The assignment only depends on the path, so a file never moves between splits when
+    other files are added, changed or removed.
+
+    Args:
+        key (str): Path of the file relative to the dataset folder.
+
+    Returns:
+        str: Name of the split (train/dev/test).
+    """
+    position = _hash_position(key, 0)
+    cumulative = 0.0
+    for split, fraction in SPLIT_FRACTIONS:
+        cumulative += fraction
+        if position < cumulative:
+            return split
+    return SPLIT_FRACTIONS[-1][0]
+
+
+def shard_position(key):
+    """
+    Place a source file within its split from a hash of its relative path.
+
+    The position is independent of the split assignment and of the class, so samples
+    ordered by it are spread evenly over the classes, and a file keeps its place (and its
+    shard) when other files are added, changed or removed.
+
+    Args:
+        key (str): Path of the file relative to the dataset folder.
+
+    Returns:
+        float: Position in [0, 1).
+    """
+    return _hash_position(key, 1)
+
+
+def load_source_manifest(store_dir):
+    """
+    Load the per-file manifest of an incrementally preprocessed dataset.
+
+    Args:
+        store_dir (str): Directory of the processed dataset store.
+
+    Returns:
+        dict: The manifest; empty (no entries) if none has been written yet.
+    """
+    path = os.path.join(store_dir, SOURCE_MANIFEST_FILENAME)
+    if not os.path.exists(path):
+        return {"num_rows": 0, "entries": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_source_manifest(store_dir, manifest):
+    """
+    Atomically write the per-file manifest of an incrementally preprocessed dataset.
+
+    Args:
+        store_dir (str): Directory of the processed dataset store.
+        manifest (dict): The manifest to write.
+    """
+    path = os.path.join(store_dir, SOURCE_MANIFEST_FILENAME)
+    with open(path + ".partial", "w") as f:
+        json.dump(manifest, f)
+    os.replace(path + ".partial", path)
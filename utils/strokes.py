@@ -0,0 +1,372 @@
+import math
+import struct
+import time
+
+import cv2
+import numpy as np
+
+from utils import profiling
+from utils.preprocessing import MODEL_IMAGE_SIZE, gray_to_model_input
+from utils.segmentation import classify_crops, group_boxes
+
+# Session events
+STROKE, CLEAR, UNDO, REDO = range(4)
+
+SESSION_MAGIC = b"MVSS"
+SESSION_VERSION = 1
+_HEADER = struct.Struct("<4sBIII")  # magic, version, canvas width, height, events
+_STROKE_HEADER = struct.Struct("<fII")  # pen width, pen color (ARGB), points
+
+MIN_RASTER_WIDTH = 3.0  # Pen width (in pixels) strokes are rasterized at, at least
+MAX_SUPERSAMPLE = 16
+
+
+class Stroke:
+    """
+    One pen stroke: the polyline of its points in canvas coordinates, with pen settings.
+
+    Attributes:
+        points (np.ndarray): float32 array of shape (N, 2) of (x, y) positions.
+        times (np.ndarray): float32 array of shape (N,), seconds since the session started.
+        width (float): Pen width in pixels.
+        color (int): Pen color as a 32-bit ARGB value.
+    """
+
+    __slots__ = ("points", "times", "width", "color")
+
+    def __init__(self, points, times, width, color=0xFF000000):
+        self.points = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+        self.times = np.asarray(times, dtype=np.float32).reshape(-1)
+        self.width = float(width)
+        self.color = int(color) & 0xFFFFFFFF
+        self.points.flags.writeable = False
+        self.times.flags.writeable = False
+
+    def bounds(self):
+        """Return the bounding box (x, y, width, height) of the painted pixels."""
+        radius = self.width / 2
+        x0, y0 = np.floor(self.points.min(axis=0) - radius).astype(int)
+        x1, y1 = np.ceil(self.points.max(axis=0) + radius).astype(int)
+        return int(x0), int(y0), int(x1 - x0), int(y1 - y0)
+
+    def gray(self):
+        """Return the pen color as a gray level, weighted as in cv2.COLOR_BGRA2GRAY."""
+        r, g, b = (self.color >> 16) & 0xFF, (self.color >> 8) & 0xFF, self.color & 0xFF
+        return int(round(0.299 * r + 0.587 * g + 0.114 * b))
+
+
+class StrokeModel:
+    """
+    Vector record of a drawing: the visible strokes plus undo/redo and a session log.
+
+    Points of the stroke in progress are appended to preallocated arrays that grow by
+    doubling, so recording costs no per-point Python objects.
+    """
+
+    def __init__(self):
+        self.strokes = []  # Visible strokes, in drawing order
+        self.events = []  # Session log of (event, Stroke or None)
+        self._undo_stack = []  # ("stroke", Stroke) or ("clear", list of strokes)
+        self._redo_stack = []
+        self._start = time.perf_counter()
+        self._points = None
+        self._times = None
+        self._count = 0
+        self._pen = None
+
+    def begin_stroke(self, x, y, width, color=0xFF000000):
+        """Start a stroke at (x, y) with the given pen width and ARGB color."""
+        self._points = np.empty((64, 2), dtype=np.float32)
+        self._times = np.empty(64, dtype=np.float32)
+        self._count = 0
+        self._pen = (width, color)
+        self.add_point(x, y)
+
+    def add_point(self, x, y):
+        """Append a point to the stroke in progress (ignored if there is none)."""
+        if self._points is None:
+            return
+        if self._count == len(self._points):
+            self._points = np.resize(self._points, (2 * self._count, 2))
+            self._times = np.resize(self._times, 2 * self._count)
+        self._points[self._count] = (x, y)
+        self._times[self._count] = time.perf_counter() - self._start
+        self._count += 1
+
+    def end_stroke(self):
+        """
+        Finish the stroke in progress and record it.
+
+        Returns:
+            Stroke: The finished stroke, or None if no stroke was in progress.
+        """
+        if self._points is None:
+            return None
+        stroke = Stroke(
+            self._points[: self._count].copy(),
+            self._times[: self._count].copy(),
+            *self._pen,
+        )
+        self.cancel_stroke()
+
+        self.strokes.append(stroke)
+        self._push(("stroke", stroke))
+        self.events.append((STROKE, stroke))
+        return stroke
+
+    def cancel_stroke(self):
+        """Discard the stroke in progress."""
+        self._points = self._times = self._pen = None
+        self._count = 0
+
+    def clear(self):
+        """Remove all strokes (undoable)."""
+        self._push(("clear", self.strokes))
+        self.strokes = []
+        self.events.append((CLEAR, None))
+
+    def undo(self):
+        """Revert the last stroke or clear. Returns False if there was nothing to undo."""
+        if not self._undo_stack:
+            return False
+        action = self._undo_stack.pop()
+        self._redo_stack.append(action)
+        if action[0] == "stroke":
+            self.strokes.pop()
+        else:
+            self.strokes = action[1]
+        self.events.append((UNDO, None))
+        return True
+
+    def redo(self):
+        """Re-apply the last undone stroke or clear. Returns False if there was none."""
+        if not self._redo_stack:
+            return False
+        action = self._redo_stack.pop()
+        self._undo_stack.append(action)
+        if action[0] == "stroke":
+            self.strokes.append(action[1])
+        else:
+            self.strokes = []
+        self.events.append((REDO, None))
+        return True
+
+    def _push(self, action):
+        self._undo_stack.append(action)
+        self._redo_stack = []
+
+
+def rasterize_strokes(strokes, box, image_size=MODEL_IMAGE_SIZE):
+    """
+    Render the strokes inside a region of the canvas directly at a small output size.
+
+    The region is drawn at a supersampled resolution just large enough for the pen to be
+    a few pixels wide, then reduced with area interpolation, which approximates drawing
+    on the full-resolution canvas and downscaling it, without the full-resolution bitmap.
+
+    Args:
+        strokes (list): Strokes in canvas coordinates.
+        box (tuple): Region (x, y, width, height) of the canvas mapped onto the output.
+        image_size (tuple): (height, width) of the output.
+
+    Returns:
+        np.ndarray: uint8 grayscale array of shape image_size, white background.
+    """
+    height, width = image_size
+    x, y, box_width, box_height = box
+    scale_x = width / max(box_width, 1)
+    scale_y = height / max(box_height, 1)
+
+    thinnest = min((stroke.width for stroke in strokes), default=MIN_RASTER_WIDTH)
+    supersample = MIN_RASTER_WIDTH / max(thinnest * min(scale_x, scale_y), 1e-6)
+    supersample = min(max(math.ceil(supersample), 1), MAX_SUPERSAMPLE)
+
+    canvas = np.full((height * supersample, width * supersample), 255, np.uint8)
+    scale = np.array([scale_x, scale_y], dtype=np.float32) * supersample
+    origin = np.array([x, y], dtype=np.float32)
+    for stroke in strokes:
+        # Fixed-point coordinates (4 fractional bits) keep sub-pixel positions
+        points = np.round((stroke.points - origin) * scale * 16).astype(np.int32)
+        if len(points) == 1:
+            points = np.repeat(points, 2, axis=0)  # Draw a lone point as a dot
+        thickness = max(int(round(stroke.width * math.sqrt(scale[0] * scale[1]))), 1)
+        cv2.polylines(
+            canvas, [points], False, stroke.gray(), thickness, cv2.LINE_AA, shift=4
+        )
+
+    if supersample == 1:
+        return canvas
+    return cv2.resize(canvas, (width, height), interpolation=cv2.INTER_AREA)
+
+
+def strokes_to_model_input(strokes, canvas_size):
+    """
+    Rasterize a whole canvas of strokes into a model input batch of size one.
+
+    Args:
+        strokes (list): Strokes in canvas coordinates.
+        canvas_size (tuple): (width, height) of the canvas.
+
+    Returns:
+        np.ndarray: float32 array of shape (1, 45, 45, 3).
+    """
+    return gray_to_model_input(
+        rasterize_strokes(strokes, (0, 0, canvas_size[0], canvas_size[1]))
+    )
+
+
+def segment_strokes(strokes, overlap=0.5):
+    """
+    Segment a drawing into symbols by grouping strokes whose horizontal extents overlap.
+
+    Args:
+        strokes (list): Strokes in canvas coordinates.
+        overlap (float): Fraction of the narrower stroke's width that must overlap
+            horizontally for two strokes to be grouped.
+
+    Returns:
+        list: Bounding boxes (x, y, width, height) of the symbols, ordered left to right.
+    """
+    return group_boxes([stroke.bounds() for stroke in strokes], overlap)
+
+
+def crop_strokes(strokes, boxes, size=45, margin=0.15):
+    """
+    Rasterize symbols straight into square crops in the training image format.
+
+    Each crop covers the same square region as segmentation.crop_symbols would cut from the
+    canvas bitmap, and only contains the strokes that lie within the symbol's box.
+
+    Args:
+        strokes (list): Strokes in canvas coordinates.
+        boxes (list): Bounding boxes (x, y, width, height) of the symbols.
+        size (int): Side length of the output images.
+        margin (float): Margin around each symbol as a fraction of its larger side.
+
+    Returns:
+        np.ndarray: uint8 array of shape (len(boxes), size, size).
+    """
+    bounds = [stroke.bounds() for stroke in strokes]
+    crops = np.empty((len(boxes), size, size), dtype=np.uint8)
+    for i, (x, y, w, h) in enumerate(boxes):
+        members = [
+            stroke
+            for stroke, (sx, sy, sw, sh) in zip(strokes, bounds)
+            if sx >= x and sy >= y and sx + sw <= x + w and sy + sh <= y + h
+        ]
+        side = int(max(w, h) * (1 + 2 * margin)) + 1
+        square = (x - (side - w) // 2, y - (side - h) // 2, side, side)
+        crops[i] = rasterize_strokes(members, square, (size, size))
+    return crops
+
+
+def recognize_strokes(predict, strokes, class_names):
+    """
+    Recognize every symbol of a stroke drawing with a single batched forward pass.
+
+    Args:
+        predict (callable): Function mapping a normalized batch to class probabilities,
+            e.g. InferenceSession.predict.
+        strokes (list): Strokes in canvas coordinates.
+        class_names (list): Class names, indexed by model output.
+
+    Returns:
+        list: One dict per symbol, ordered left to right, as returned by
+            segmentation.recognize_expression.
+    """
+    with profiling.span("recognize.segment", strokes=len(strokes)):
+        boxes = segment_strokes(strokes)
+    if not boxes:
+        return []
+    with profiling.span("recognize.crop", symbols=len(boxes)):
+        crops = crop_strokes(strokes, boxes)
+    with profiling.span("recognize.classify", symbols=len(boxes)):
+        return classify_crops(predict, crops, boxes, class_names)
+
+
+def save_session(path, events, canvas_size):
+    """
+    Save a drawing session to a compact binary file.
+
+    Args:
+        path (str): Output file path.
+        events (list): Session log of (event, Stroke or None), e.g. StrokeModel.events.
+        canvas_size (tuple): (width, height) of the canvas.
+    """
+    with open(path, "wb") as f:
+        f.write(
+            _HEADER.pack(
+                SESSION_MAGIC,
+                SESSION_VERSION,
+                canvas_size[0],
+                canvas_size[1],
+                len(events),
+            )
+        )
+        for event, stroke in events:
+            f.write(bytes([event]))
+            if event == STROKE:
+                f.write(
+                    _STROKE_HEADER.pack(stroke.width, stroke.color, len(stroke.points))
+                )
+                f.write(stroke.points.tobytes())
+                f.write(stroke.times.tobytes())
+
+
+def load_session(path):
+    """
+    Load a drawing session saved by save_session.
+
+    Args:
+        path (str): Session file path.
+
+    Returns:
+        tuple: (events, canvas_size) as passed to save_session.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+
+    magic, version, width, height, count = _HEADER.unpack_from(data)
+    if magic != SESSION_MAGIC or version != SESSION_VERSION:
+        raise ValueError(f"{path} is not a version {SESSION_VERSION} session file")
+
+    events = []
+    offset = _HEADER.size
+    for _ in range(count):
+        event = data[offset]
+        offset += 1
+        stroke = None
+        if event == STROKE:
+            pen_width, color, n = _STROKE_HEADER.unpack_from(data, offset)
+            offset += _STROKE_HEADER.size
+            points = np.frombuffer(data, np.float32, 2 * n, offset)
+            offset += points.nbytes
+            times = np.frombuffer(data, np.float32, n, offset)
+            offset += times.nbytes
+            stroke = Stroke(points, times, pen_width, color)
+        events.append((event, stroke))
+    return events, (width, height)
+
+
+# Example usage
+if __name__ == "__main__":
+    import os
+    import tempfile
+
+    # Record a tiny session, save it and load it back
+    model = StrokeModel()
+    model.begin_stroke(10, 10, 5)
+    for i in range(1, 50):
+        model.add_point(10 + i, 10 + i)
+    model.end_stroke()
+    model.clear()
+    model.undo()
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "session.mvs")
+        save_session(path, model.events, (200, 200))
+        events, canvas_size = load_session(path)
+        print(f"Saved {len(events)} events in {os.path.getsize(path)} bytes")
+
+    model_input = strokes_to_model_input(model.strokes, canvas_size)
+    print(f"Rasterized {len(model.strokes)} stroke(s) to {model_input.shape}")